@@ -0,0 +1,206 @@
+"""
+Admission control for endpoints that call the LLM.
+
+At most ``LLM_MAX_CONCURRENCY`` such requests run at once, and at most
+``LLM_MAX_CONCURRENCY_PER_USER`` per user. Requests beyond that wait in a
+weighted priority queue: customer-facing ticket replies, then agent AutoCRM
+commands, then backfills, scheduled by stride so lower classes are slowed
+down but never starved (weights 6:3:1).
+
+Load is shed with ``Overloaded`` (503 with ``Retry-After``) when a request
+waits longer than ``LLM_ADMISSION_TIMEOUT_SECONDS`` or the queue holds
+``LLM_MAX_QUEUE_DEPTH`` requests. A full queue first evicts the newest waiter
+of a lower class, so backfills are shed before AutoCRM and AutoCRM before
+customers.
+
+The controller is not thread-safe; it is only used from the event loop.
+"""
+from collections import defaultdict, deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional
+import asyncio
+import logging
+import os
+import time
+
+from fastapi import Depends, HTTPException
+
+from .metrics import REGISTRY, Counter, Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', '16'))
+LLM_MAX_CONCURRENCY_PER_USER = int(os.getenv('LLM_MAX_CONCURRENCY_PER_USER', '4'))
+LLM_MAX_QUEUE_DEPTH = int(os.getenv('LLM_MAX_QUEUE_DEPTH', '64'))
+LLM_ADMISSION_TIMEOUT_SECONDS = float(os.getenv('LLM_ADMISSION_TIMEOUT_SECONDS', '10'))
+LLM_RETRY_AFTER_SECONDS = int(os.getenv('LLM_RETRY_AFTER_SECONDS', '5'))
+
+PRIORITY_CUSTOMER = 0
+PRIORITY_AGENT = 1
+PRIORITY_BACKFILL = 2
+PRIORITY_NAMES = ('customer', 'agent', 'backfill')
+PRIORITY_WEIGHTS = (6, 3, 1)
+
+llm_admission_in_flight = REGISTRY.register(Gauge(
+    'llm_admission_in_flight', 'LLM-backed requests holding an admission slot.'))
+llm_admission_queue_depth = REGISTRY.register(Gauge(
+    'llm_admission_queue_depth', 'LLM-backed requests waiting for an admission slot.', ('priority',)))
+llm_admission_wait_seconds = REGISTRY.register(Histogram(
+    'llm_admission_wait_seconds', 'Time spent waiting for an admission slot.', ('priority',)))
+llm_admission_rejected_total = REGISTRY.register(Counter(
+    'llm_admission_rejected_total', 'LLM-backed requests shed with a 503.', ('priority', 'reason')))
+
+
+class Overloaded(Exception):
+    def __init__(self, retry_after: int = LLM_RETRY_AFTER_SECONDS):
+        super().__init__(f"Server is busy, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ('user', 'priority', 'future')
+
+    def __init__(self, user: Any, priority: int, future: 'asyncio.Future[None]'):
+        self.user = user
+        self.priority = priority
+        self.future = future
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        max_per_user: int = LLM_MAX_CONCURRENCY_PER_USER,
+        max_queue_depth: int = LLM_MAX_QUEUE_DEPTH,
+        timeout_seconds: float = LLM_ADMISSION_TIMEOUT_SECONDS,
+        retry_after: int = LLM_RETRY_AFTER_SECONDS
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_per_user = max_per_user
+        self.max_queue_depth = max_queue_depth
+        self.timeout_seconds = timeout_seconds
+        self.retry_after = retry_after
+        self.active = 0
+        self._per_user: Dict[Any, int] = defaultdict(int)
+        self._queues: List[Deque[_Waiter]] = [deque() for _ in PRIORITY_NAMES]
+        # Stride scheduling: the class with the lowest pass goes next
+        self._passes = [0.0 for _ in PRIORITY_NAMES]
+
+    @property
+    def queued(self) -> int:
+        return sum(len(queue) for queue in self._queues)
+
+    def _reject(self, priority: int, reason: str) -> Overloaded:
+        llm_admission_rejected_total.inc(priority=PRIORITY_NAMES[priority], reason=reason)
+        return Overloaded(self.retry_after)
+
+    def _remove(self, waiter: _Waiter) -> None:
+        self._queues[waiter.priority].remove(waiter)
+        llm_admission_queue_depth.dec(priority=PRIORITY_NAMES[waiter.priority])
+
+    def _enqueue(self, waiter: _Waiter) -> None:
+        queue = self._queues[waiter.priority]
+        if not queue:
+            # A class that was idle does not get to catch up on its share
+            busy = [self._passes[priority] for priority, other in enumerate(self._queues) if other]
+            if busy:
+                self._passes[waiter.priority] = max(self._passes[waiter.priority], min(busy))
+        queue.append(waiter)
+        llm_admission_queue_depth.inc(priority=PRIORITY_NAMES[waiter.priority])
+
+    def _next_waiter(self) -> Optional[_Waiter]:
+        for priority in sorted(range(len(self._queues)), key=lambda p: (self._passes[p], p)):
+            for waiter in self._queues[priority]:
+                if self._per_user[waiter.user] < self.max_per_user:
+                    self._remove(waiter)
+                    self._passes[priority] += 1 / PRIORITY_WEIGHTS[priority]
+                    return waiter
+        return None
+
+    def _dispatch(self) -> None:
+        while self.active < self.max_concurrency:
+            waiter = self._next_waiter()
+            if waiter is None:
+                return
+            self.active += 1
+            self._per_user[waiter.user] += 1
+            llm_admission_in_flight.inc()
+            waiter.future.set_result(None)
+
+    async def acquire(self, user: Any, priority: int, shed: bool = True) -> None:
+        """
+        Wait for a slot. With ``shed`` the wait is bounded and a full queue
+        raises ``Overloaded``; without it (background work) the caller waits
+        as long as it takes.
+        """
+        if shed and self.queued >= self.max_queue_depth:
+            victim = next((queue[-1] for queue in reversed(self._queues[priority + 1:]) if queue), None)
+            if victim is None:
+                raise self._reject(priority, 'queue_full')
+            self._remove(victim)
+            victim.future.set_exception(self._reject(victim.priority, 'evicted'))
+
+        waiter = _Waiter(user, priority, asyncio.get_running_loop().create_future())
+        self._enqueue(waiter)
+        self._dispatch()
+        started = time.perf_counter()
+        try:
+            await asyncio.wait({waiter.future}, timeout=self.timeout_seconds if shed else None)
+        except asyncio.CancelledError:
+            self._abandon(waiter)
+            raise
+        llm_admission_wait_seconds.observe(time.perf_counter() - started, priority=PRIORITY_NAMES[priority])
+        if not waiter.future.done():
+            self._remove(waiter)
+            raise self._reject(priority, 'timeout')
+        waiter.future.result()
+
+    def _abandon(self, waiter: _Waiter) -> None:
+        if not waiter.future.done():
+            self._remove(waiter)
+        elif waiter.future.exception() is None:
+            self.release(waiter.user)
+
+    @asynccontextmanager
+    async def slot(self, user: Any, priority: int, shed: bool = True) -> AsyncIterator[None]:
+        await self.acquire(user, priority, shed)
+        try:
+            yield
+        finally:
+            self.release(user)
+
+    def release(self, user: Any) -> None:
+        self.active -= 1
+        self._per_user[user] -= 1
+        if self._per_user[user] <= 0:
+            del self._per_user[user]
+        llm_admission_in_flight.dec()
+        self._dispatch()
+
+
+llm_admission = AdmissionController()
+
+
+def shed_response(error: Overloaded) -> HTTPException:
+    logger.warning("Shedding request: %s", str(error))
+    return HTTPException(status_code=503, detail=str(error), headers={'Retry-After': str(error.retry_after)})
+
+
+def admit(priority: int, current_user: Callable[..., Awaitable[Optional[Dict[str, Any]]]]):
+    """
+    FastAPI dependency holding an admission slot for the whole request,
+    keyed by the user id ``current_user`` resolves (the route's own auth
+    dependency, so it runs once); answers 503 with ``Retry-After`` when shed.
+    """
+    async def dependency(caller: Optional[Dict[str, Any]] = Depends(current_user)) -> AsyncIterator[None]:
+        # Same key as ``slot`` callers use, whatever token the user sent
+        user = caller['id'] if caller else 'anonymous'
+        try:
+            await llm_admission.acquire(user, priority)
+        except Overloaded as e:
+            raise shed_response(e)
+        try:
+            yield
+        finally:
+            llm_admission.release(user)
+    return dependency
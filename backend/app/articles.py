@@ -0,0 +1,103 @@
+"""
+Write-through cache of knowledge base article rows.
+
+Search hits are hydrated from here instead of a ``select('*').in_('id', ...)``
+per search. Rows are keyed by ID and carry their ``updated_at``: the cache is
+filled when the lexical index loads and by the backfill, refreshed when an
+article is (re-)embedded, and dropped on ``delete_article``. A hit whose
+vector metadata reports a newer ``updated_at`` than the cached row, or a row
+older than ``ARTICLE_CACHE_TTL_SECONDS``, is re-read; all misses of one
+search share a single query.
+"""
+from typing import Any, Dict, Iterable, List, Optional
+import logging
+import os
+import threading
+import time
+
+from .metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+ARTICLE_CACHE_TTL_SECONDS = float(os.getenv('ARTICLE_CACHE_TTL_SECONDS', '600'))
+
+
+class ArticleCache:
+    def __init__(self, ttl_seconds: float = ARTICLE_CACHE_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._stored_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, article_id: Any, updated_at: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Return the cached row, unless it expired or is older than ``updated_at``.
+        """
+        article_id = str(article_id)
+        with self._lock:
+            article = self._entries.get(article_id)
+            if article is None:
+                return None
+            if time.monotonic() - self._stored_at[article_id] > self.ttl_seconds:
+                return None
+            if updated_at and str(article.get('updated_at') or '') < str(updated_at):
+                return None
+            return article
+
+    def put(self, article: Dict[str, Any]) -> None:
+        """
+        Store a full article row, unless a newer version is already cached.
+        """
+        article_id = str(article['id'])
+        with self._lock:
+            current = self._entries.get(article_id)
+            if current is not None and str(current.get('updated_at') or '') > str(article.get('updated_at') or ''):
+                return
+            self._entries[article_id] = article
+            self._stored_at[article_id] = time.monotonic()
+
+    def put_many(self, articles: Iterable[Dict[str, Any]]) -> None:
+        for article in articles:
+            self.put(article)
+
+    def invalidate(self, article_id: Optional[Any] = None) -> None:
+        with self._lock:
+            if article_id is None:
+                self._entries.clear()
+                self._stored_at.clear()
+            else:
+                self._entries.pop(str(article_id), None)
+                self._stored_at.pop(str(article_id), None)
+
+
+article_cache = ArticleCache()
+
+
+def hydrate_articles(article_ids: List[Any], supabase_client, versions: Optional[Dict[str, str]] = None) -> List[Dict[str, Any]]:
+    """
+    Return full article rows for ``article_ids`` in the given order, reading
+    only missing or stale rows from Supabase. ``versions`` maps article IDs to
+    the ``updated_at`` recorded with their search hit.
+    """
+    versions = versions or {}
+    ordered_ids = list(dict.fromkeys(str(article_id) for article_id in article_ids))
+    found: Dict[str, Dict[str, Any]] = {}
+    missing: List[str] = []
+    for article_id in ordered_ids:
+        article = article_cache.get(article_id, versions.get(article_id))
+        record_cache('articles', article is not None)
+        if article is None:
+            missing.append(article_id)
+        else:
+            found[article_id] = article
+
+    if missing:
+        result = supabase_client.table('knowledge_base_articles').select('*').in_('id', missing).execute()
+        for article in result.data or []:
+            article_cache.put(article)
+            found[str(article['id'])] = article
+
+    return [found[article_id] for article_id in ordered_ids if article_id in found]
@@ -0,0 +1,128 @@
+"""
+Lazily constructed clients for Supabase, Pinecone and OpenAI.
+
+Nothing in this module talks to the network or imports the heavy SDKs at
+import time. Each client is built on first use, cached for the lifetime of
+the process and can be pre-built from the application lifespan.
+"""
+from typing import Any, Dict, Optional
+import asyncio
+import logging
+import os
+import threading
+
+from .instrumentation import InstrumentedSupabase
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_supabase = None
+_vector_store = None
+_async_openai = None
+
+
+def get_supabase():
+    """
+    Return the shared Supabase client, creating it on first use.
+    """
+    global _supabase
+    if _supabase is None:
+        with _lock:
+            if _supabase is None:
+                from supabase import create_client
+
+                supabase_url = os.getenv("SUPABASE_URL", "")
+                supabase_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY", "")
+                if not supabase_url or not supabase_key:
+                    raise ValueError("Supabase URL and key must be provided")
+
+                _supabase = InstrumentedSupabase(create_client(supabase_url, supabase_key))
+                logger.info("Supabase client initialized successfully")
+    return _supabase
+
+
+async def aexecute(query: Any) -> Any:
+    """
+    Run a Supabase query's blocking ``execute()`` in a worker thread so
+    concurrent coroutines are not serialized on the event loop.
+    """
+    return await asyncio.to_thread(query.execute)
+
+
+def get_vector_store():
+    """
+    Return the shared async Pinecone client, creating it on first use.
+
+    When ``PINECONE_HOST`` is set the index host is used directly, which skips
+    the control-plane lookup otherwise made before the first call.
+    """
+    global _vector_store
+    if _vector_store is None:
+        with _lock:
+            if _vector_store is None:
+                from .vectorstore import VectorStore
+
+                index_name = os.getenv('PINECONE_INDEX', '')
+                _vector_store = VectorStore(
+                    api_key=os.getenv('PINECONE_API_KEY', ''),
+                    index_name=index_name,
+                    host=os.getenv('PINECONE_HOST')
+                )
+                logger.info("Pinecone index %s initialized successfully", index_name)
+    return _vector_store
+
+
+def get_async_openai():
+    """
+    Return the shared asyncio OpenAI client, creating it on first use.
+    """
+    global _async_openai
+    if _async_openai is None:
+        with _lock:
+            if _async_openai is None:
+                from openai import AsyncOpenAI
+
+                # Retries are made by app.resilience
+                _async_openai = AsyncOpenAI(api_key=os.getenv('OPENAI_API_KEY'), max_retries=0)
+    return _async_openai
+
+
+def init_clients() -> Dict[str, Any]:
+    """
+    Build every client up front, e.g. from the application lifespan.
+
+    Failures are logged and reported instead of raised so a dependency that
+    is unreachable at boot does not keep the API from starting; the next
+    request that needs the client retries construction.
+    """
+    status: Dict[str, Any] = {}
+    for name, factory in (("supabase", get_supabase), ("pinecone", get_vector_store), ("openai", get_async_openai)):
+        try:
+            factory()
+            status[name] = "up"
+        except Exception as e:
+            logger.error("Failed to initialize %s client: %s", name, str(e))
+            status[name] = "down"
+    return status
+
+
+async def close_clients() -> None:
+    """
+    Close pooled connections, e.g. on shutdown.
+    """
+    if _vector_store is not None:
+        await _vector_store.aclose()
+
+
+def reset_clients(name: Optional[str] = None) -> None:
+    """
+    Drop cached clients so the next call rebuilds them.
+    """
+    global _supabase, _vector_store, _async_openai
+    with _lock:
+        if name in (None, "supabase"):
+            _supabase = None
+        if name in (None, "pinecone"):
+            _vector_store = None
+        if name in (None, "openai"):
+            _async_openai = None
@@ -0,0 +1,90 @@
+"""
+Debounced, coalesced AI replies per ticket.
+
+A customer often sends several short messages in a row. Each one triggers
+``process_reply``, and answering each separately costs a completion per
+message and posts near-duplicate AI replies. ``ReplyCoalescer`` waits
+``REPLY_DEBOUNCE_SECONDS`` after a message before generating; a newer message
+on the same ticket cancels the pending (or in-flight) generation and starts
+the wait again, so one AI reply answers the latest state of the conversation.
+"""
+from typing import Awaitable, Callable, Dict, TypeVar
+import asyncio
+import logging
+import os
+
+from .metrics import REGISTRY, Counter
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+REPLY_DEBOUNCE_SECONDS = float(os.getenv('REPLY_DEBOUNCE_SECONDS', '1.5'))
+
+ai_reply_generations_total = REGISTRY.register(Counter(
+    'ai_reply_generations_total', 'AI reply generations by outcome (generated, superseded, failed).', ('result',)))
+
+
+class Superseded(Exception):
+    """
+    Raised to a caller whose message was folded into a newer one's AI reply.
+    """
+
+
+class ReplyCoalescer:
+    def __init__(self, debounce_seconds: float = REPLY_DEBOUNCE_SECONDS):
+        self.debounce_seconds = debounce_seconds
+        self._pending: Dict[int, asyncio.Task] = {}
+
+    async def run(self, ticket_id: int, generate: Callable[[], Awaitable[T]]) -> T:
+        """
+        Run ``generate`` for ``ticket_id`` once the debounce window passes.
+
+        Raises ``Superseded`` when a newer call for the same ticket replaced
+        this one. ``generate`` should read the ticket context when it runs,
+        not when it is scheduled, so the reply covers every message in the
+        burst. If the caller goes away, generation carries on in the background.
+        """
+        previous = self._pending.get(ticket_id)
+        if previous is not None and not previous.done():
+            previous.cancel()
+
+        task = asyncio.ensure_future(self._debounced(generate))
+        self._pending[ticket_id] = task
+        task.add_done_callback(lambda done: self._forget(ticket_id, done))
+
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if task.cancelled():
+                logger.info("AI reply for ticket %s superseded by a newer message", ticket_id)
+                raise Superseded(ticket_id) from None
+            raise
+
+    async def _debounced(self, generate: Callable[[], Awaitable[T]]) -> T:
+        try:
+            if self.debounce_seconds > 0:
+                await asyncio.sleep(self.debounce_seconds)
+            result = await generate()
+        except asyncio.CancelledError:
+            ai_reply_generations_total.inc(result='superseded')
+            raise
+        except Exception:
+            ai_reply_generations_total.inc(result='failed')
+            raise
+        ai_reply_generations_total.inc(result='generated')
+        return result
+
+    def _forget(self, ticket_id: int, task: asyncio.Task) -> None:
+        if self._pending.get(ticket_id) is task:
+            del self._pending[ticket_id]
+        if not task.cancelled() and task.exception() is not None:
+            # Retrieve the exception so an abandoned task does not log "never retrieved"
+            logger.debug("AI reply task for ticket %s failed: %s", ticket_id, task.exception())
+
+    def pending(self, ticket_id: int) -> bool:
+        task = self._pending.get(ticket_id)
+        return task is not None and not task.done()
+
+
+reply_coalescer = ReplyCoalescer()
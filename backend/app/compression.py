@@ -0,0 +1,141 @@
+"""
+Compression of HTTP responses.
+
+``CompressionMiddleware`` compresses responses of at least
+``COMPRESSION_MIN_BYTES`` (default 1024) bytes. It uses brotli when the
+client accepts ``br`` and the ``brotli`` (or ``brotlicffi``) package is
+installed, and gzip otherwise. Levels favour speed over ratio, as every
+response is compressed on the fly: ``BROTLI_QUALITY`` (default 4) and
+``GZIP_LEVEL`` (default 6).
+
+Some responses are passed through untouched: smaller ones, ones that already
+have a ``Content-Encoding``, and already-compressed or streamed content types
+such as images, audio and server-sent events. Streamed bodies are compressed
+chunk by chunk.
+"""
+from typing import Any, Dict, Optional
+import os
+import zlib
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+COMPRESSION_MIN_BYTES = int(os.getenv('COMPRESSION_MIN_BYTES', '1024'))
+GZIP_LEVEL = int(os.getenv('GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.getenv('BROTLI_QUALITY', '4'))
+
+_SKIPPED_CONTENT_TYPES = ('image/', 'audio/', 'video/', 'text/event-stream', 'application/zip',
+                          'application/gzip', 'application/octet-stream')
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """
+    ``br``, ``gzip`` or ``None`` for an ``Accept-Encoding`` header.
+    """
+    accepted: Dict[str, float] = {}
+    for part in accept_encoding.split(','):
+        name, _, params = part.strip().partition(';')
+        quality = 1.0
+        if params.strip().startswith('q='):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    if brotli is not None and accepted.get('br', 0) > 0:
+        return 'br'
+    if accepted.get('gzip', accepted.get('*', 0)) > 0:
+        return 'gzip'
+    return None
+
+
+class Compressor:
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == 'br':
+            self._brotli = brotli.Compressor(quality=BROTLI_QUALITY)
+            # ``brotli`` calls it process(), ``brotlicffi`` compress()
+            self._process = getattr(self._brotli, 'process', None) or self._brotli.compress
+        else:
+            self._gzip = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._process(data) if self.encoding == 'br' else self._gzip.compress(data)
+
+    def finish(self) -> bytes:
+        return self._brotli.finish() if self.encoding == 'br' else self._gzip.flush()
+
+
+class _CompressingSend:
+    def __init__(self, send, encoding: str, minimum_size: int):
+        self.send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.start: Optional[Dict[str, Any]] = None
+        self.compressor: Optional[Compressor] = None
+        self.passthrough = False
+
+    async def __call__(self, message: Dict[str, Any]) -> None:
+        if message['type'] == 'http.response.start':
+            # Held back until the first body chunk shows whether to compress
+            self.start = message
+            return
+        if message['type'] != 'http.response.body' or self.passthrough:
+            await self.send(message)
+            return
+
+        body = message.get('body', b'')
+        more_body = message.get('more_body', False)
+        if self.compressor is None:
+            headers = MutableHeaders(raw=self.start['headers'])
+            content_type = headers.get('content-type', '')
+            if ('content-encoding' in headers or content_type.startswith(_SKIPPED_CONTENT_TYPES)
+                    or (not more_body and len(body) < self.minimum_size)):
+                self.passthrough = True
+                await self.send(self.start)
+                await self.send(message)
+                return
+            self.compressor = Compressor(self.encoding)
+            headers['Content-Encoding'] = self.encoding
+            headers.add_vary_header('Accept-Encoding')
+            if 'content-length' in headers:
+                del headers['Content-Length']
+            data = self.compressor.compress(body)
+            if not more_body:
+                data += self.compressor.finish()
+                headers['Content-Length'] = str(len(data))
+            await self.send(self.start)
+            await self.send({'type': 'http.response.body', 'body': data, 'more_body': more_body})
+            return
+
+        data = self.compressor.compress(body)
+        if not more_body:
+            data += self.compressor.finish()
+        await self.send({'type': 'http.response.body', 'body': data, 'more_body': more_body})
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing large responses with brotli or gzip.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get('accept-encoding', ''))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await self.app(scope, receive, _CompressingSend(send, encoding, self.minimum_size))
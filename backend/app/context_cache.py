@@ -0,0 +1,150 @@
+"""
+Per-ticket conversation context kept in memory between replies.
+
+``process_reply`` used to re-select the ticket, the new reply and the last ten
+replies for every customer message. A ``TicketContext`` holds all three, plus
+the knowledge base articles already retrieved for the ticket, so follow-up
+messages on an active chat only append the new reply to the window.
+
+Snapshots follow every ticket write made by this API, and are dropped when the
+frontend reports an edit made through the ``tickets`` edge function
+(``POST /api/tickets/{ticket_id}/changed``). They expire after
+``TICKET_CONTEXT_TTL_SECONDS`` to pick up changes made any other way (e.g.
+directly in Supabase).
+"""
+from collections import OrderedDict, deque
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+import os
+import threading
+import time
+
+from .metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+REPLY_WINDOW = 10
+TICKET_CONTEXT_TTL_SECONDS = float(os.getenv('TICKET_CONTEXT_TTL_SECONDS', '60'))
+TICKET_CONTEXT_MAX_TICKETS = int(os.getenv('TICKET_CONTEXT_MAX_TICKETS', '1000'))
+
+
+class TicketContext:
+    """
+    Snapshot of one ticket: the ticket row, a rolling window of its most
+    recent replies (oldest first) and the articles retrieved for it.
+    """
+
+    def __init__(self, ticket: Dict[str, Any], replies: List[Dict[str, Any]], articles: Optional[List[Dict[str, Any]]] = None):
+        self.ticket = ticket
+        self.replies = deque(replies, maxlen=REPLY_WINDOW)
+        self.articles: List[Dict[str, Any]] = list(articles or [])
+        self.loaded_at = time.monotonic()
+
+    def find_reply(self, reply_id: str) -> Optional[Dict[str, Any]]:
+        for reply in self.replies:
+            if str(reply.get('id')) == reply_id:
+                return reply
+        return None
+
+    def add_reply(self, reply: Dict[str, Any]) -> None:
+        if reply.get('id') is None or self.find_reply(str(reply['id'])) is None:
+            self.replies.append(reply)
+
+    def recent_messages(self) -> List[Dict[str, Any]]:
+        """
+        Replies newest first, matching ``order('created_at', desc=True)``.
+        """
+        return list(reversed(self.replies))
+
+
+class TicketContextCache:
+    def __init__(self, ttl_seconds: float = TICKET_CONTEXT_TTL_SECONDS, max_tickets: int = TICKET_CONTEXT_MAX_TICKETS):
+        self.ttl_seconds = ttl_seconds
+        self.max_tickets = max_tickets
+        self._entries: 'OrderedDict[int, TicketContext]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, ticket_id: int) -> Optional[TicketContext]:
+        with self._lock:
+            context = self._entries.get(ticket_id)
+            if context is not None and time.monotonic() - context.loaded_at > self.ttl_seconds:
+                del self._entries[ticket_id]
+                context = None
+            if context is not None:
+                self._entries.move_to_end(ticket_id)
+        record_cache('ticket_context', context is not None)
+        return context
+
+    def put(self, ticket_id: int, context: TicketContext) -> TicketContext:
+        with self._lock:
+            self._entries[ticket_id] = context
+            self._entries.move_to_end(ticket_id)
+            while len(self._entries) > self.max_tickets:
+                self._entries.popitem(last=False)
+        return context
+
+    def add_reply(self, ticket_id: int, reply: Dict[str, Any]) -> None:
+        """
+        Append a reply written through this API to a cached snapshot, if any.
+        """
+        with self._lock:
+            context = self._entries.get(ticket_id)
+            if context is not None:
+                context.add_reply(reply)
+
+    def update_ticket(self, ticket_id: int, changes: Dict[str, Any]) -> None:
+        with self._lock:
+            context = self._entries.get(ticket_id)
+            if context is not None:
+                context.ticket = {**context.ticket, **changes}
+
+    def invalidate(self, ticket_id: Optional[int] = None) -> None:
+        """
+        Drop the snapshot for one ticket, or every snapshot.
+        """
+        with self._lock:
+            if ticket_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(ticket_id, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+ticket_contexts = TicketContextCache()
+
+
+def load_ticket_context(ticket_id: int, reply_id: str, supabase_client, reply: Optional[Dict[str, Any]] = None) -> Tuple[Optional[TicketContext], Optional[Dict[str, Any]]]:
+    """
+    Return the context for ``ticket_id`` and the row for reply ``reply_id``.
+
+    Pass ``reply`` when the row is already known (e.g. it was just inserted)
+    to skip selecting it. Otherwise, with a cached snapshot the reply only
+    costs a read when it is not in the window yet (e.g. the frontend inserted
+    it straight into Supabase). A new reply is appended to the window. A cold
+    start selects the ticket and its recent replies. The context is ``None``
+    when the ticket does not exist.
+    """
+    context = ticket_contexts.get(ticket_id)
+    if context is None:
+        ticket_result = supabase_client.table('tickets').select('*').eq('id', ticket_id).execute()
+        if not ticket_result.data:
+            return None, None
+
+        recent_result = supabase_client.table('replies').select('*').eq('ticket_id', ticket_id).order('created_at', desc=True).limit(REPLY_WINDOW).execute()
+        recent_messages = recent_result.data or []
+        context = ticket_contexts.put(ticket_id, TicketContext(ticket_result.data[0], list(reversed(recent_messages))))
+
+    known = context.find_reply(reply_id)
+    if known is not None:
+        return context, known
+
+    if reply is None:
+        reply_result = supabase_client.table('replies').select('*').eq('id', reply_id).eq('ticket_id', ticket_id).execute()
+        reply = reply_result.data[0] if reply_result.data else None
+    if reply is not None:
+        newest = context.replies[-1] if context.replies else None
+        if newest is None or str(reply.get('created_at', '')) >= str(newest.get('created_at', '')):
+            context.add_reply(reply)
+    return context, reply
@@ -0,0 +1,154 @@
+"""
+Rolling memory for AutoCRM conversations.
+
+The prompt gets a compact summary of the conversation plus its most recent
+turns, never more than ``AUTOCRM_HISTORY_TOKEN_BUDGET`` (estimated) tokens of
+them, each cut to ``AUTOCRM_HISTORY_MESSAGE_TOKENS``. The summary lives on
+the ``autocrm_conversations`` row (``summary``, plus ``summarized_through``,
+the ``created_at`` of the last message folded into it).
+
+Summaries are updated in batches to save LLM calls: the recent window grows
+to ``AUTOCRM_HISTORY_TURNS + AUTOCRM_SUMMARY_BATCH_TURNS`` user/system
+exchanges, and once a message no longer fits, everything but the last
+``AUTOCRM_HISTORY_TURNS`` exchanges is folded into the summary after the
+reply, at most one fold per conversation at a time. The prompt size is
+therefore bounded however long the conversation gets.
+"""
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set
+import logging
+import os
+
+from .clients import aexecute
+from .model_router import TASK_CONVERSATION_SUMMARY, model_router
+
+logger = logging.getLogger(__name__)
+
+AUTOCRM_HISTORY_TURNS = int(os.getenv('AUTOCRM_HISTORY_TURNS', '3'))
+AUTOCRM_HISTORY_TOKEN_BUDGET = int(os.getenv('AUTOCRM_HISTORY_TOKEN_BUDGET', '1500'))
+# Longer messages (e.g. search results) are cut to this many tokens in the window
+AUTOCRM_HISTORY_MESSAGE_TOKENS = int(os.getenv('AUTOCRM_HISTORY_MESSAGE_TOKENS', '150'))
+AUTOCRM_SUMMARY_BATCH_TURNS = int(os.getenv('AUTOCRM_SUMMARY_BATCH_TURNS', '3'))
+# Unsummarized messages read per request; in a longer backlog (e.g. a conversation
+# from before summaries existed) the oldest ones are left out of the summary
+MAX_UNSUMMARIZED_MESSAGES = 40
+# Conversations whose last fold here is remembered, least recently folded dropped first;
+# a forgotten one may be summarized again, and the conditional write then drops it
+MAX_FOLDED_CONVERSATIONS = 1000
+
+SUMMARY_PROMPT = """You maintain a running summary of a conversation between a support agent and a CRM assistant.
+Update the summary with the new messages. Keep ticket numbers, filters, assignees and field values that later
+requests may refer to; drop pleasantries. Reply with the updated summary only, in at most 120 words."""
+
+
+# Conversations whose summary is being updated in this process, and how far
+# the folds made here got; requests that loaded their history before a fold
+# finished would otherwise summarize the same messages again
+_folding: Set[Any] = set()
+_folded_through: 'OrderedDict[Any, str]' = OrderedDict()
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text or '') // 4)
+
+
+def _clip(text: str, max_tokens: int = AUTOCRM_HISTORY_MESSAGE_TOKENS) -> str:
+    limit = max_tokens * 4
+    return text if len(text) <= limit else text[:limit].rstrip() + ' ...'
+
+
+class ConversationHistory:
+    def __init__(self, conversation: Dict[str, Any], recent: List[Dict[str, Any]], unsummarized: List[Dict[str, Any]]):
+        self.conversation = conversation
+        # Oldest first
+        self.recent = recent
+        # Messages to fold into the summary after this exchange, oldest first
+        self.unsummarized = unsummarized
+
+    @property
+    def summary(self) -> str:
+        return self.conversation.get('summary') or ''
+
+    def render(self) -> str:
+        """
+        History text for the prompt.
+        """
+        parts = []
+        if self.summary:
+            parts.append(f"Summary of earlier conversation: {self.summary}")
+        parts.extend(f"{message['sender']}: {_clip(message['content'])}" for message in self.recent)
+        return '\n'.join(parts) if parts else 'No previous conversation'
+
+
+def load_history(supabase_client, conversation: Dict[str, Any], exclude_id: Optional[Any] = None) -> ConversationHistory:
+    """
+    Read the messages the summary does not cover yet (one query) and split
+    them into the recent window and the ones still to be summarized.
+    ``exclude_id`` skips the message of the current request.
+    """
+    query = supabase_client.table('autocrm_messages').select('id, sender, content, created_at').eq('conversation_id', conversation['id'])
+    if conversation.get('summarized_through'):
+        query = query.gt('created_at', conversation['summarized_through'])
+    result = query.order('created_at', desc=True).limit(MAX_UNSUMMARIZED_MESSAGES + 1).execute()
+    messages = [message for message in result.data or [] if message['id'] != exclude_id]
+
+    recent: List[Dict[str, Any]] = []
+    tokens = 0
+    for message in messages[:(AUTOCRM_HISTORY_TURNS + AUTOCRM_SUMMARY_BATCH_TURNS) * 2]:
+        tokens += estimate_tokens(_clip(message['content']))
+        if recent and tokens > AUTOCRM_HISTORY_TOKEN_BUDGET:
+            break
+        recent.append(message)
+    # Once messages no longer fit, fold all but the last AUTOCRM_HISTORY_TURNS turns
+    unsummarized = messages[min(len(recent), AUTOCRM_HISTORY_TURNS * 2):] if len(messages) > len(recent) else []
+    return ConversationHistory(conversation, list(reversed(recent)), list(reversed(unsummarized)))
+
+
+async def update_summary(supabase_client, history: ConversationHistory) -> Optional[str]:
+    """
+    Fold the messages that left the recent window into the stored summary.
+    Skipped while another fold of the conversation is running here, and the
+    write is dropped if another process moved the summary on; failures are
+    logged, not raised, as this runs in the background.
+    """
+    conversation_id = history.conversation['id']
+    if not history.unsummarized or conversation_id in _folding:
+        return None
+    previous = history.conversation.get('summarized_through')
+    if _folded_through.get(conversation_id, str(previous or '')) != str(previous or ''):
+        # Loaded before a fold made here; the next exchange starts from the new summary
+        return None
+
+    _folding.add(conversation_id)
+    try:
+        # Deferred: langchain_core is slow to import and only needed here
+        from langchain_core.messages import HumanMessage, SystemMessage
+
+        transcript = '\n'.join(f"{message['sender']}: {message['content']}" for message in history.unsummarized)
+        summary = await model_router.complete(
+            TASK_CONVERSATION_SUMMARY,
+            [
+                SystemMessage(content=SUMMARY_PROMPT),
+                HumanMessage(content=f"Current summary:\n{history.summary or '(none)'}\n\nNew messages:\n{transcript}"),
+            ],
+            tags=["autocrm", "summary"]
+        )
+
+        query = supabase_client.table('autocrm_conversations').update({
+            'summary': summary.strip(),
+            'summarized_through': history.unsummarized[-1]['created_at'],
+        }).eq('id', conversation_id)
+        query = query.eq('summarized_through', previous) if previous else query.is_('summarized_through', 'null')
+        await aexecute(query)
+        _folded_through[conversation_id] = str(history.unsummarized[-1]['created_at'])
+        _folded_through.move_to_end(conversation_id)
+        while len(_folded_through) > MAX_FOLDED_CONVERSATIONS:
+            _folded_through.popitem(last=False)
+        logger.info("Folded %d messages into the summary of conversation %s", len(history.unsummarized), conversation_id)
+        return summary
+    except Exception as e:
+        # The unsummarized messages are picked up again by the next exchange
+        logger.error("Error updating summary of conversation %s: %s", conversation_id, str(e))
+        return None
+    finally:
+        _folding.discard(conversation_id)
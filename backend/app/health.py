@@ -0,0 +1,171 @@
+"""
+Background health probes and warmup.
+
+``/health`` is called constantly by load balancers and uptime monitors, so it
+never touches a dependency. ``HealthMonitor`` probes each dependency every
+``HEALTH_PROBE_INTERVAL_SECONDS`` (default 15) from the application lifespan,
+and ``/health`` serves the cached results. The probes are:
+
+- Supabase: a one-row ``profiles`` read.
+- Pinecone: index stats.
+- OpenAI: a model lookup.
+
+None of them uses tokens, and each is cut off after
+``HEALTH_PROBE_TIMEOUT_SECONDS``. When the results are older than three
+intervals (e.g. the loop is not running), ``/health`` starts a refresh in the
+background and still answers from memory.
+
+``warmup`` pre-fills what the first requests would otherwise pay for:
+
+- the clients;
+- the agent directory;
+- the lexical index, which fills the article cache;
+- the LLM clients of every model route;
+- one round of probes, which opens a pooled connection to each dependency.
+"""
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, Optional
+import asyncio
+import logging
+import os
+import time
+
+from . import llm
+from .clients import aexecute, get_async_openai, get_supabase, get_vector_store, init_clients
+from .instrumentation import external_call
+from .model_router import model_router
+from .resilience import circuit_states
+from .routing import agent_directory
+from .search import lexical_index
+
+logger = logging.getLogger(__name__)
+
+HEALTH_PROBE_INTERVAL_SECONDS = float(os.getenv('HEALTH_PROBE_INTERVAL_SECONDS', '15'))
+HEALTH_PROBE_TIMEOUT_SECONDS = float(os.getenv('HEALTH_PROBE_TIMEOUT_SECONDS', '5'))
+
+
+async def _probe_supabase() -> None:
+    await aexecute(get_supabase().table('profiles').select('id').limit(1))
+
+
+async def _probe_pinecone() -> None:
+    await get_vector_store().describe_index_stats()
+
+
+async def _probe_openai() -> None:
+    with external_call('openai', 'model', llm.DEFAULT_CHAT_MODEL):
+        await get_async_openai().models.retrieve(llm.DEFAULT_CHAT_MODEL)
+
+
+PROBES: Dict[str, Callable[[], Awaitable[None]]] = {
+    'database': _probe_supabase,
+    'pinecone': _probe_pinecone,
+    'openai': _probe_openai,
+}
+
+
+class HealthMonitor:
+    def __init__(self, interval: float = HEALTH_PROBE_INTERVAL_SECONDS, timeout: float = HEALTH_PROBE_TIMEOUT_SECONDS):
+        self.interval = interval
+        self.timeout = timeout
+        self.results: Dict[str, Dict[str, Any]] = {}
+        self._checked_at: Optional[float] = None
+        self._refresh: Optional[asyncio.Task] = None
+
+    async def _probe(self, name: str) -> None:
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(PROBES[name](), self.timeout)
+            result: Dict[str, Any] = {'status': 'up'}
+        except Exception as e:
+            logger.warning("Health probe for %s failed: %s", name, str(e) or type(e).__name__)
+            result = {'status': 'down', 'error': str(e) or type(e).__name__}
+        result['latency_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        result['checked_at'] = datetime.now(timezone.utc).isoformat()
+        self.results[name] = result
+
+    async def probe_all(self) -> Dict[str, Dict[str, Any]]:
+        await asyncio.gather(*(self._probe(name) for name in PROBES))
+        self._checked_at = time.monotonic()
+        return self.results
+
+    async def run(self) -> None:
+        """
+        Probe every ``interval`` seconds until cancelled.
+        """
+        while True:
+            await self.probe_all()
+            await asyncio.sleep(self.interval)
+
+    @property
+    def stale(self) -> bool:
+        return self._checked_at is None or time.monotonic() - self._checked_at > 3 * self.interval
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        The ``/health`` response, from the latest probes. Starts a refresh in
+        the background when they are stale.
+        """
+        if self.stale and (self._refresh is None or self._refresh.done()):
+            self._refresh = asyncio.ensure_future(self.probe_all())
+
+        services = {'api': 'up', **{name: self.results.get(name, {}).get('status', 'unknown') for name in PROBES}}
+        circuits = circuit_states()
+        if services['database'] == 'down':
+            status = 'unhealthy'
+        elif self._checked_at is None:
+            status = 'starting'
+        elif 'down' in services.values() or any(c['state'] != 'closed' for c in circuits.values()):
+            status = 'degraded'
+        else:
+            status = 'healthy'
+        return {
+            'status': status,
+            'services': services,
+            'checks': self.results,
+            'circuit_breakers': circuits,
+            'stale': self.stale,
+            'timestamp': datetime.now().isoformat(),
+        }
+
+
+health_monitor = HealthMonitor()
+
+
+async def _step(steps: Dict[str, Dict[str, Any]], name: str, work: Callable[[], Awaitable[Any]]) -> None:
+    started = time.perf_counter()
+    try:
+        await work()
+        steps[name] = {'status': 'success'}
+    except Exception as e:
+        logger.error("Warmup step %s failed: %s", name, str(e))
+        steps[name] = {'status': 'error', 'error': str(e)}
+    steps[name]['ms'] = round((time.perf_counter() - started) * 1000, 1)
+
+
+async def warmup() -> Dict[str, Dict[str, Any]]:
+    """
+    Build clients, load the in-memory caches and open pooled connections.
+    Returns the outcome and duration of each step; failures do not stop the
+    other steps.
+    """
+    steps: Dict[str, Dict[str, Any]] = {}
+    await _step(steps, 'clients', lambda: asyncio.to_thread(init_clients))
+
+    def build_llm_clients() -> None:
+        for route in model_router.routes.values():
+            llm._chat_model(route.model, route.temperature, route.max_tokens)
+
+    async def open_connections() -> None:
+        results = await health_monitor.probe_all()
+        down = [name for name, result in results.items() if result['status'] != 'up']
+        if down:
+            raise RuntimeError(f"Unreachable: {', '.join(down)}")
+
+    await asyncio.gather(
+        _step(steps, 'agent_directory', lambda: asyncio.to_thread(agent_directory.load, get_supabase())),
+        _step(steps, 'lexical_index', lambda: asyncio.to_thread(lexical_index.load, get_supabase())),
+        _step(steps, 'llm_clients', lambda: asyncio.to_thread(build_llm_clients)),
+        _step(steps, 'connections', open_connections),
+    )
+    return steps
@@ -0,0 +1,143 @@
+"""
+Passage-level indexing of knowledge base articles in Pinecone.
+
+Articles are split into overlapping passages of ``PASSAGE_WORDS`` words, and
+every passage is embedded (in batches) as its own vector
+``article_{id}_chunk_{n}``. Each vector's metadata holds only that passage, so
+retrieval returns focused passages instead of whole articles and metadata
+stays small. Only the first ``MAX_PASSAGES_PER_ARTICLE`` passages of an
+article are indexed; a warning is logged for longer articles.
+"""
+from typing import Any, Dict, List
+import asyncio
+import logging
+import os
+
+from . import llm
+from .clients import get_vector_store
+
+logger = logging.getLogger(__name__)
+
+PASSAGE_WORDS = 120
+PASSAGE_OVERLAP_WORDS = 30
+# Passages beyond this are not indexed; also bounds the ids deleted for an article
+MAX_PASSAGES_PER_ARTICLE = int(os.getenv('MAX_PASSAGES_PER_ARTICLE', '40'))
+UPSERT_BATCH_SIZE = 100
+# Articles embedded together by the backfill
+ARTICLE_BATCH_SIZE = 20
+
+
+def split_passages(text: str, size: int = PASSAGE_WORDS, overlap: int = PASSAGE_OVERLAP_WORDS) -> List[str]:
+    """
+    Split ``text`` into passages of ``size`` words, each sharing ``overlap``
+    words with the one before.
+    """
+    words = (text or '').split()
+    if len(words) <= size:
+        return [' '.join(words)] if words else []
+    step = size - overlap
+    passages = []
+    for start in range(0, len(words), step):
+        passages.append(' '.join(words[start:start + size]))
+        if start + size >= len(words):
+            break
+    return passages
+
+
+def article_passages(article: Dict[str, Any]) -> List[str]:
+    """
+    The passages indexed for ``article``, at most ``MAX_PASSAGES_PER_ARTICLE``.
+    """
+    passages = split_passages(article.get('content', ''))
+    if len(passages) > MAX_PASSAGES_PER_ARTICLE:
+        logger.warning("Article %s has %d passages; only the first %d are indexed",
+                       article.get('id'), len(passages), MAX_PASSAGES_PER_ARTICLE)
+        passages = passages[:MAX_PASSAGES_PER_ARTICLE]
+    return passages
+
+
+def passage_id(article_id: Any, chunk: int) -> str:
+    return f"article_{article_id}_chunk_{chunk}"
+
+
+def article_vector_ids(article_id: Any, start: int = 0) -> List[str]:
+    """
+    Every vector id an article may own from passage ``start`` on, including
+    the whole-article vector written before passages were introduced.
+    """
+    return [f"article_{article_id}"] + [passage_id(article_id, chunk) for chunk in range(start, MAX_PASSAGES_PER_ARTICLE)]
+
+
+async def index_articles(articles: List[Dict[str, Any]]) -> Dict[str, int]:
+    """
+    Embed and upsert the passages of ``articles`` and delete vectors left over
+    from earlier versions of them. Returns the passage count per article id.
+    """
+    vectors: List[Dict[str, Any]] = []
+    texts: List[str] = []
+    stale_ids: List[str] = []
+    counts: Dict[str, int] = {}
+
+    for article in articles:
+        passages = article_passages(article) or ['']
+        counts[str(article['id'])] = len(passages)
+        stale_ids.extend(article_vector_ids(article['id'], start=len(passages)))
+        for chunk, passage in enumerate(passages):
+            texts.append(f"Title: {article['title']}\nContent: {passage}")
+            vectors.append({
+                'id': passage_id(article['id'], chunk),
+                'metadata': {
+                    'title': article['title'],
+                    'passage': passage,
+                    'chunk': chunk,
+                    'article_id': article['id'],
+                    'updated_at': article.get('updated_at') or '',
+                    'type': 'article'
+                }
+            })
+
+    if not vectors:
+        return counts
+
+    embeddings = await llm.embed_documents(texts)
+    for vector, values in zip(vectors, embeddings):
+        vector['values'] = values
+
+    # Stale ids never overlap the upserted ones, so all batches can run at once
+    store = get_vector_store()
+    await asyncio.gather(
+        *(store.upsert(vectors[start:start + UPSERT_BATCH_SIZE]) for start in range(0, len(vectors), UPSERT_BATCH_SIZE)),
+        store.delete(stale_ids)
+    )
+
+    logger.info("Indexed %d passages for %d articles", len(vectors), len(counts))
+    return counts
+
+
+async def retrieve_passages(query_text: str, top_k: int = 5) -> List[Dict[str, Any]]:
+    """
+    Return the ``top_k`` passages most similar to ``query_text``, best first,
+    as dicts with ``article_id``, ``title``, ``chunk``, ``passage`` and
+    ``score``. Vectors indexed before passages existed contribute their
+    whole ``content`` as the passage.
+    """
+    query_embedding = await llm.embed_query(query_text)
+    response = await get_vector_store().query(
+        vector=query_embedding,
+        top_k=top_k,
+        include_metadata=True,
+        filter={"type": "article"}
+    )
+    passages = []
+    for match in response['matches']:
+        metadata = match['metadata']
+        if 'article_id' not in metadata:
+            continue
+        passages.append({
+            'article_id': metadata['article_id'],
+            'title': metadata.get('title', ''),
+            'chunk': int(metadata.get('chunk', 0)),
+            'passage': metadata.get('passage', metadata.get('content', '')),
+            'score': float(match['score']),
+        })
+    return passages
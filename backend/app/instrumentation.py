@@ -0,0 +1,219 @@
+"""
+Instrumentation for calls to external dependencies.
+
+``external_call`` is the single hook every Supabase, Pinecone and OpenAI call
+goes through. The Supabase client returned by ``app.clients`` is wrapped in
+thin proxies that route ``execute()`` and auth calls through it, so call sites
+stay unchanged; the Pinecone and OpenAI clients call it directly. The proxies
+also put every Supabase call behind the ``supabase`` circuit breaker and retry
+reads and idempotent writes (``app/resilience.py``); inserts and RPCs are
+made once.
+
+``external_call`` also counts round trips per request. ``RoundTripMiddleware``
+scopes a counter to each HTTP request and, when ``DEBUG_ROUND_TRIPS`` is set,
+reports it in the ``X-Round-Trips`` response header, e.g.
+``supabase=4, pinecone=1, openai=2``.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional
+import logging
+import os
+import threading
+
+from . import resilience
+from .metrics import REGISTRY, Histogram, track_dependency
+from .tracing import start_span
+
+logger = logging.getLogger(__name__)
+
+_QUERY_VERBS = {'select', 'insert', 'update', 'upsert', 'delete', 'rpc'}
+_RETRIED_OPERATIONS = {'select', 'update', 'upsert', 'delete'}
+_RETRIED_AUTH_CALLS = {'get_user', 'get_session'}
+
+ROUND_TRIP_HEADER = 'X-Round-Trips'
+DEPENDENCIES = ('supabase', 'pinecone', 'openai')
+
+http_request_round_trips = REGISTRY.register(Histogram(
+    'http_request_round_trips', 'External round trips made per HTTP request.', ('route', 'dependency'),
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 500, 1000)))
+
+
+class RoundTripCounter:
+    """
+    Thread-safe tally of external calls, shared by every task and worker
+    thread spawned while serving one request.
+    """
+
+    def __init__(self):
+        self.counts: Dict[str, int] = {dependency: 0 for dependency in DEPENDENCIES}
+        self._lock = threading.Lock()
+
+    def add(self, dependency: str) -> None:
+        with self._lock:
+            self.counts[dependency] = self.counts.get(dependency, 0) + 1
+
+    @property
+    def total(self) -> int:
+        return sum(self.counts.values())
+
+    def header_value(self) -> str:
+        return ', '.join(f"{dependency}={count}" for dependency, count in self.counts.items())
+
+
+_round_trips: ContextVar[Optional[RoundTripCounter]] = ContextVar('round_trips', default=None)
+
+
+@contextmanager
+def count_round_trips() -> Iterator[RoundTripCounter]:
+    """
+    Count external calls made inside the block, e.g. in a test:
+
+        with count_round_trips() as trips:
+            await handle_crm_operations(...)
+        assert trips.counts['supabase'] <= 3
+    """
+    counter = RoundTripCounter()
+    token = _round_trips.set(counter)
+    try:
+        yield counter
+    finally:
+        _round_trips.reset(token)
+
+
+@contextmanager
+def external_call(dependency: str, operation: str, target: str = '') -> Iterator[None]:
+    """
+    Wrap one round trip to an external dependency in a timing metric and a
+    tracing span, and count it against the current request.
+    """
+    counter = _round_trips.get()
+    if counter is not None:
+        counter.add(dependency)
+    with start_span(f"{dependency}.{operation}", dependency=dependency, operation=operation, target=target):
+        with track_dependency(dependency, operation, target):
+            yield
+
+
+class RoundTripMiddleware:
+    """
+    ASGI middleware counting external calls per request. The counts feed the
+    ``http_request_round_trips`` histogram and, with ``DEBUG_ROUND_TRIPS``
+    enabled, the ``X-Round-Trips`` response header.
+    """
+
+    def __init__(self, app, expose_header: Optional[bool] = None):
+        self.app = app
+        if expose_header is None:
+            expose_header = os.getenv('DEBUG_ROUND_TRIPS', '').lower() in ('1', 'true', 'yes')
+        self.expose_header = expose_header
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        with count_round_trips() as counter:
+
+            async def send_wrapper(message):
+                if message['type'] == 'http.response.start' and self.expose_header:
+                    message['headers'] = list(message.get('headers', [])) + [
+                        (ROUND_TRIP_HEADER.lower().encode('latin-1'), counter.header_value().encode('latin-1'))
+                    ]
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                route = getattr(scope.get('route'), 'path', None) or 'unmatched'
+                for dependency, count in counter.counts.items():
+                    http_request_round_trips.observe(count, route=route, dependency=dependency)
+
+
+def parse_round_trip_header(value: str) -> Dict[str, int]:
+    """
+    Parse an ``X-Round-Trips`` header back into per-dependency counts.
+    """
+    counts: Dict[str, int] = {}
+    for part in filter(None, (part.strip() for part in value.split(','))):
+        dependency, _, count = part.partition('=')
+        counts[dependency] = int(count)
+    return counts
+
+
+class _QueryProxy:
+    """
+    Follows a PostgREST builder chain and times the final ``execute()``.
+    """
+
+    def __init__(self, builder: Any, table: str, operation: str = 'request'):
+        self._builder = builder
+        self._table = table
+        self._operation = operation
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._builder, name)
+        if name == 'execute':
+            def attempt(*args, **kwargs):
+                with external_call('supabase', self._operation, self._table):
+                    return attr(*args, **kwargs)
+
+            def execute(*args, **kwargs):
+                return resilience.call_sync('supabase', lambda: attempt(*args, **kwargs),
+                                            retry=self._operation in _RETRIED_OPERATIONS)
+            return execute
+        operation = name if name in _QUERY_VERBS else self._operation
+        if not callable(attr):
+            # Properties such as ``not_`` return the builder itself
+            return self._follow(attr, operation)
+
+        def chained(*args, **kwargs):
+            return self._follow(attr(*args, **kwargs), operation)
+        return chained
+
+    def _follow(self, result: Any, operation: str) -> Any:
+        if hasattr(result, 'execute') or hasattr(result, 'select'):
+            return _QueryProxy(result, self._table, operation)
+        return result
+
+
+class _AuthProxy:
+    def __init__(self, auth: Any):
+        self._auth = auth
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._auth, name)
+        if not callable(attr):
+            return attr
+
+        def attempt(*args, **kwargs):
+            with external_call('supabase', 'auth', name):
+                return attr(*args, **kwargs)
+
+        def call(*args, **kwargs):
+            return resilience.call_sync('supabase', lambda: attempt(*args, **kwargs),
+                                        retry=name in _RETRIED_AUTH_CALLS)
+        return call
+
+
+class InstrumentedSupabase:
+    """
+    Supabase client proxy; ``table()``, ``rpc()`` and ``auth`` calls are instrumented,
+    everything else is passed through untouched.
+    """
+
+    def __init__(self, client: Any):
+        self._client = client
+        self.auth = _AuthProxy(client.auth)
+
+    def table(self, name: str) -> _QueryProxy:
+        return _QueryProxy(self._client.table(name), name)
+
+    def from_(self, name: str) -> _QueryProxy:
+        return self.table(name)
+
+    def rpc(self, function: str, params: Optional[Dict[str, Any]] = None) -> _QueryProxy:
+        return _QueryProxy(self._client.rpc(function, params or {}), function, 'rpc')
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._client, name)
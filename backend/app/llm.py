@@ -0,0 +1,141 @@
+"""
+OpenAI helpers for chat completions, embeddings and audio transcription.
+
+Every call goes through ``external_call`` and records its token usage, so
+latency and cost per model show up on ``/metrics`` and in the ``usage``
+table (``app/usage.py``). Retries and the circuit
+breaker come from ``app/resilience.py``; the SDKs' own retries are off.
+"""
+from functools import lru_cache
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple
+import json
+import logging
+import os
+
+from . import resilience
+from .clients import get_async_openai
+from .instrumentation import external_call
+from .metrics import record_tokens
+from .usage import usage_tracker
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL = "text-embedding-3-large"
+DEFAULT_CHAT_MODEL = "gpt-4o-mini"
+TRANSCRIPTION_MODEL = "whisper-1"
+EMBEDDING_BATCH_SIZE = 100
+
+# USD per million (prompt, completion) tokens; ``MODEL_PRICES`` (JSON) adds or overrides models
+MODEL_PRICES: Dict[str, Tuple[float, float]] = {
+    'gpt-4o-mini': (0.15, 0.60),
+    'gpt-4o': (2.50, 10.00),
+    'gpt-4-turbo': (10.00, 30.00),
+    'gpt-3.5-turbo': (0.50, 1.50),
+    'text-embedding-3-large': (0.13, 0.0),
+    'text-embedding-3-small': (0.02, 0.0),
+}
+MODEL_PRICES.update({model: tuple(price) for model, price in json.loads(os.getenv('MODEL_PRICES', '{}')).items()})
+
+
+def estimate_cost(model: str, prompt_tokens: int = 0, completion_tokens: int = 0) -> float:
+    """
+    Estimated cost in USD; 0 for models without a known price.
+    """
+    prompt_price, completion_price = MODEL_PRICES.get(model, (0.0, 0.0))
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+
+
+@lru_cache(maxsize=16)
+def _chat_model(model: str, temperature: float, max_tokens: Optional[int]):
+    from langchain_openai import ChatOpenAI
+
+    return ChatOpenAI(model_name=model, temperature=temperature, max_tokens=max_tokens, max_retries=0)
+
+
+async def chat(
+    messages: List[Any],
+    model: str = DEFAULT_CHAT_MODEL,
+    temperature: float = 0.7,
+    max_tokens: Optional[int] = None,
+    tags: Optional[List[str]] = None,
+    metadata: Optional[Dict[str, Any]] = None
+) -> str:
+    """
+    Run a chat completion over LangChain messages and return the text.
+    """
+    text, _ = await chat_with_usage(messages, model, temperature, max_tokens, tags, metadata)
+    return text
+
+
+async def chat_with_usage(
+    messages: List[Any],
+    model: str = DEFAULT_CHAT_MODEL,
+    temperature: float = 0.7,
+    max_tokens: Optional[int] = None,
+    tags: Optional[List[str]] = None,
+    metadata: Optional[Dict[str, Any]] = None
+) -> Tuple[str, Dict[str, int]]:
+    """
+    ``chat`` that also returns the ``prompt_tokens`` and ``completion_tokens`` used.
+    """
+    llm = _chat_model(model, temperature, max_tokens)
+
+    async def generate():
+        with external_call('openai', 'chat', model):
+            return await llm.agenerate([messages], tags=tags, metadata=metadata)
+
+    result = await resilience.call('openai', generate)
+
+    token_usage = (result.llm_output or {}).get('token_usage') or {}
+    usage = {'prompt_tokens': token_usage.get('prompt_tokens', 0), 'completion_tokens': token_usage.get('completion_tokens', 0)}
+    record_tokens(model, usage['prompt_tokens'], usage['completion_tokens'])
+    usage_tracker.record(model, usage['prompt_tokens'], usage['completion_tokens'],
+                         estimate_cost(model, usage['prompt_tokens'], usage['completion_tokens']))
+    return result.generations[0][0].text, usage
+
+
+async def embed_documents(texts: List[str]) -> List[List[float]]:
+    """
+    Embed a list of texts, batching them into as few API calls as possible.
+    """
+    client = get_async_openai()
+    vectors: List[List[float]] = []
+    for start in range(0, len(texts), EMBEDDING_BATCH_SIZE):
+        # The API rejects empty strings
+        batch = [text.strip() or ' ' for text in texts[start:start + EMBEDDING_BATCH_SIZE]]
+        response = await resilience.call('openai', lambda: _embed_batch(client, batch))
+        record_tokens(EMBEDDING_MODEL, prompt_tokens=response.usage.prompt_tokens)
+        usage_tracker.record(EMBEDDING_MODEL, response.usage.prompt_tokens,
+                             cost_usd=estimate_cost(EMBEDDING_MODEL, response.usage.prompt_tokens))
+        vectors.extend(item.embedding for item in sorted(response.data, key=lambda item: item.index))
+    return vectors
+
+
+async def _embed_batch(client, batch: List[str]):
+    with external_call('openai', 'embedding', EMBEDDING_MODEL):
+        return await client.embeddings.create(model=EMBEDDING_MODEL, input=batch)
+
+
+async def embed_query(text: str) -> List[float]:
+    """
+    Embed a single search query.
+    """
+    vectors = await embed_documents([text])
+    return vectors[0]
+
+
+async def transcribe(audio_file: BinaryIO) -> str:
+    """
+    Transcribe an audio file with Whisper.
+    """
+    client = get_async_openai()
+
+    async def create():
+        # A retry sends the file again from the start
+        if audio_file.seekable():
+            audio_file.seek(0)
+        with external_call('openai', 'transcription', TRANSCRIPTION_MODEL):
+            return await client.audio.transcriptions.create(file=audio_file, model=TRANSCRIPTION_MODEL)
+
+    transcript = await resilience.call('openai', create)
+    return transcript.text
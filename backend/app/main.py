@@ -1,30 +1,47 @@
 from fastapi import FastAPI, HTTPException, Header, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.openapi.utils import get_openapi
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
-from langsmith import Client
-from supabase import create_client, Client as SupabaseClient
+from supabase import Client as SupabaseClient
 from typing import Optional, Dict, Any, List, Union
 import os
 from dotenv import load_dotenv
 import json
 from .utils.notifications import notify_ticket_updated, notify_ticket_created
 from .utils.formatting import format_ticket_numbers
-from datetime import datetime
+from .utils.ticket_specs import MAX_TICKETS_PER_UPDATE, TICKET_SPEC_RE, TicketSpecError, fetch_tickets, parse_ticket_spec
+from .clients import aexecute, close_clients, get_supabase, get_vector_store, init_clients
+from .metrics import MetricsMiddleware, REGISTRY
+from .tracing import TracingMiddleware, TRACE_HEADER, traced
+from .instrumentation import RoundTripMiddleware, ROUND_TRIP_HEADER
+from .context_cache import TicketContext, load_ticket_context, ticket_contexts
+from .coalescing import Superseded, reply_coalescer
+from .routing import agent_directory
+from .planner import run_actions
+from .admission import PRIORITY_AGENT, PRIORITY_BACKFILL, PRIORITY_CUSTOMER, Overloaded, admit, llm_admission, shed_response
+from .conversation_memory import load_history, update_summary
+from .health import health_monitor, warmup
+from .model_router import TASK_AUTOCRM_ACTIONS, classify_reply, model_router
+from .usage import UsageMiddleware, fetch_usage, set_usage_user, summarize, usage_tracker
+from .compression import CompressionMiddleware
+from .schemas import (ArticleSearchRequest, ArticleSearchResponse, AutoCRMRequest, AutoCRMResponse, EmbeddingsResponse,
+                      GenerateEmbeddingsRequest, ReplyCreate, ReplyCreateResponse, TicketCreate, TicketCreateResponse,
+                      MAX_SUGGEST_QUERY_CHARS, body_openapi, json_body)
+from .search import lexical_index, search_articles, suggest
+from .articles import article_cache, hydrate_articles
+from .indexing import ARTICLE_BATCH_SIZE, article_vector_ids, index_articles, retrieve_passages
+from .rerank import RETRIEVAL_OVERFETCH, rerank
+from . import llm
+from datetime import datetime, timedelta, timezone
+from contextlib import asynccontextmanager
+from collections import OrderedDict
+import asyncio
 import logging
 import re
 import tempfile
-import openai
-from openai import OpenAI
-import numpy as np
-from fastapi.responses import JSONResponse
-from yarl import URL
-from math import isnan
-from fastapi import Depends
-from pinecone import Pinecone
+import time
+from fastapi.responses import ORJSONResponse, PlainTextResponse
+from fastapi import Depends, Query
+from pydantic import ValidationError
 from uuid import UUID
 
 corsHeaders = {
@@ -39,27 +56,32 @@ logger = logging.getLogger(__name__)
 
 load_dotenv()
 
-# Initialize Supabase client
-try:
-    supabase_url = os.getenv("SUPABASE_URL", "")
-    supabase_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY", "")
-    if not supabase_url or not supabase_key:
-        raise ValueError("Supabase URL and key must be provided")
-    
-    supabase = create_client(supabase_url, supabase_key)
-    logger.info("Supabase client initialized successfully")
-except Exception as e:
-    logger.error(f"Failed to initialize Supabase client: {str(e)}")
-    raise
-
-# Initialize Pinecone
-pc = Pinecone(api_key=os.getenv('PINECONE_API_KEY'))
-index = pc.Index(os.getenv('PINECONE_INDEX'))
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Build the Supabase/Pinecone/OpenAI clients in the background so the
+    # server starts accepting requests immediately; anything that is still
+    # missing is created on first use.
+    warmup_task = asyncio.create_task(asyncio.to_thread(init_clients))
+    usage_flush_task = asyncio.create_task(usage_tracker.run(get_supabase))
+    health_task = asyncio.create_task(health_monitor.run())
+    yield
+    health_task.cancel()
+    if not warmup_task.done():
+        warmup_task.cancel()
+    # Let AI replies that are already being generated land before exiting
+    await drain_background_tasks(timeout=30)
+    # Stopping the flush loop writes the last usage aggregates
+    usage_flush_task.cancel()
+    await asyncio.gather(usage_flush_task, return_exceptions=True)
+    await close_clients()
 
 app = FastAPI(
     title="AutoCRM API",
     description="API for handling CRM operations with AI assistance",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    # orjson serializes large payloads (search results, articles) several times faster
+    default_response_class=ORJSONResponse
 )
 
 # Add CORS middleware
@@ -73,8 +95,24 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[TRACE_HEADER, ROUND_TRIP_HEADER],
 )
 
+# Compress responses above COMPRESSION_MIN_BYTES with brotli or gzip
+app.add_middleware(CompressionMiddleware)
+
+# Count Supabase/Pinecone/OpenAI round trips per request
+app.add_middleware(RoundTripMiddleware)
+
+# Record per-route request metrics
+app.add_middleware(MetricsMiddleware)
+
+# Attribute LLM token usage to each request's route and user
+app.add_middleware(UsageMiddleware)
+
+# Open a trace per request and return its ID in the X-Trace-Id header
+app.add_middleware(TracingMiddleware)
+
 # Initialize LangSmith client if API key is available
 langsmith_api_key = os.getenv('LANGCHAIN_API_KEY')
 if langsmith_api_key:
@@ -102,8 +140,9 @@ def custom_openapi():
 app.openapi = custom_openapi
 
 async def get_supabase_client() -> SupabaseClient:
-    return supabase
+    return get_supabase()
 
+@traced("auth.get_current_user")
 async def get_current_user(authorization: str = Header(...), supabase_client: SupabaseClient = Depends(get_supabase_client)) -> Dict[str, Any]:
     try:
         # Extract the token from the Authorization header
@@ -115,9 +154,10 @@ async def get_current_user(authorization: str = Header(...), supabase_client: Su
             raise HTTPException(status_code=401, detail="Invalid token")
         
         user = user_response.user
+        set_usage_user(user.id)
         
-        # Get user's role from profiles table
-        profile_response = supabase_client.table('profiles').select('role').eq('id', user.id).single().execute()
+        # Get user's role (and display fields, same round trip) from profiles table
+        profile_response = supabase_client.table('profiles').select('role, email, full_name, avatar_url').eq('id', user.id).single().execute()
         if not profile_response.data:
             raise HTTPException(status_code=401, detail="Could not fetch user profile")
         
@@ -127,7 +167,8 @@ async def get_current_user(authorization: str = Header(...), supabase_client: Su
             'email': user.email,
             'user_metadata': {
                 'role': profile_response.data['role']
-            }
+            },
+            'profile': profile_response.data
         }
         
         return user_data
@@ -136,65 +177,403 @@ async def get_current_user(authorization: str = Header(...), supabase_client: Su
         logger.error('Error getting current user: %s', str(e))
         raise HTTPException(status_code=401, detail="Invalid token")
 
+AUTH_CACHE_TTL_SECONDS = float(os.getenv('AUTH_CACHE_TTL_SECONDS', '30'))
+AUTH_CACHE_MAX_ENTRIES = int(os.getenv('AUTH_CACHE_MAX_ENTRIES', '1024'))
+# Only touched from the event loop, between awaits, so it needs no lock
+_auth_cache: 'OrderedDict[str, Any]' = OrderedDict()
+
+async def get_current_user_cached(authorization: str = Header(...), supabase_client: SupabaseClient = Depends(get_supabase_client)) -> Dict[str, Any]:
+    """
+    ``get_current_user`` remembered per token for ``AUTH_CACHE_TTL_SECONDS``,
+    for endpoints called on every keystroke.
+
+    A token that is revoked or logged out keeps working on these endpoints
+    until its entry expires, i.e. for up to ``AUTH_CACHE_TTL_SECONDS``. Past
+    ``AUTH_CACHE_MAX_ENTRIES`` tokens the least recently used is evicted.
+    """
+    now = time.monotonic()
+    cached = _auth_cache.get(authorization)
+    if cached and cached[0] > now:
+        _auth_cache.move_to_end(authorization)
+        set_usage_user(cached[1]['id'])
+        return cached[1]
+    if cached:
+        del _auth_cache[authorization]
+    user = await get_current_user(authorization, supabase_client)
+    _auth_cache[authorization] = (time.monotonic() + AUTH_CACHE_TTL_SECONDS, user)
+    _auth_cache.move_to_end(authorization)
+    while len(_auth_cache) > AUTH_CACHE_MAX_ENTRIES:
+        _auth_cache.popitem(last=False)
+    return user
+
+async def get_optional_user_cached(authorization: Optional[str] = Header(None), supabase_client: SupabaseClient = Depends(get_supabase_client)) -> Optional[Dict[str, Any]]:
+    """
+    ``get_current_user_cached`` for endpoints that do not require auth;
+    ``None`` without a token.
+    """
+    return await get_current_user_cached(authorization, supabase_client) if authorization else None
+
 @app.get("/health")
 async def health_check():
     """
-    Health check endpoint to verify the API is running.
+    Health of the API and its dependencies, from the latest background probes.
     """
-    try:
-        # Simple connection test
-        logger.info("Testing database connection...")
-        result = supabase.table('profiles').select('count', count='exact').limit(1).execute()
-        logger.info("Database connection test successful")
-        return {
-            "status": "healthy",
-            "services": {
-                "api": "up",
-                "database": "up"
-            },
-            "timestamp": datetime.now().isoformat()
-        }
-    except Exception as e:
-        logger.error(f"Health check failed: {str(e)}")
-        return {
-            "status": "unhealthy",
-            "services": {
-                "api": "up",
-                "database": "down",
-                "error": str(e)
-            },
-            "timestamp": datetime.now().isoformat()
-        }
+    return health_monitor.snapshot()
 
 @app.get("/warmup")
 async def warmup_database():
     """
-    Endpoint to warm up the database connection.
-    Makes a lightweight query to ensure the connection is established.
+    Pre-fill the clients, connection pools and in-memory caches (agent
+    directory, lexical index and article cache, LLM clients).
     """
-    try:
-        logger.info("Warming up database connection...")
-        # Make a simple count query
-        result = supabase.table('profiles').select('count', count='exact').limit(1).execute()
-        logger.info("Database warmup successful with result: %s", result)
-        return {
-            "status": "success",
-            "message": "Database connection warmed up successfully",
-            "timestamp": datetime.now().isoformat()
-        }
-    except Exception as e:
-        logger.error(f"Database warmup failed: {str(e)}")
-        return {
-            "status": "error",
-            "message": "Failed to warm up database connection",
-            "error": str(e),
-            "timestamp": datetime.now().isoformat()
-        }
+    steps = await warmup()
+    failed = [name for name, step in steps.items() if step['status'] != 'success']
+    if failed:
+        logger.error("Warmup incomplete, failed steps: %s", ', '.join(failed))
+    return {
+        "status": "error" if failed else "success",
+        "message": f"Warmup failed for {', '.join(failed)}" if failed else "Warmed up successfully",
+        "steps": steps,
+        "timestamp": datetime.now().isoformat()
+    }
+
+@traced("crm.action.search")
+async def handle_search_action(details: str, user_id: str, supabase_client: SupabaseClient) -> str:
+    # Parse field-based search criteria using the raw query content
+    field_matches = re.finditer(r'(\w+):\s*([^\s]+(?:\s+[^\s]+)*?)(?=\s+\w+:|$)', details)
+    search_criteria = {match.group(1): match.group(2) for match in field_matches}
+    
+    logger.info("Search criteria before processing: %s", search_criteria)
+    
+    # The email is already in the raw query from MentionInput, no need to parse display_content
+    if 'assigned_to' in search_criteria:
+        assignee = search_criteria['assigned_to']
+        if assignee.lower() != 'unassigned':
+            # Remove any @ prefix if present as the email is stored without it
+            assignee_email = assignee.lstrip('@')
+            logger.info("Looking up agent with email: %s", assignee_email)
+            search_criteria['assigned_to'] = assignee_email
+    
+    # Get user role
+    user_info = await aexecute(supabase_client.table('profiles').select('role').eq('id', user_id).single())
+    
+    # Build query based on role and search criteria
+    base_query = supabase_client.table('tickets').select('''
+        *,
+        profiles!tickets_user_id_fkey (email, name),
+        agents:profiles!tickets_assigned_to_fkey (email, name)
+    ''')
+
+    # Apply search criteria first
+    for field, value in search_criteria.items():
+        if field == 'assigned_to':
+            if value.lower() == 'unassigned':
+                base_query = base_query.is_('assigned_to', 'null')
+            else:
+                # Look up the user ID for the email
+                assignee_data = await aexecute(supabase_client.table('profiles').select('id').eq('email', value))
+                if assignee_data.data:
+                    base_query = base_query.eq('assigned_to', assignee_data.data[0]['id'])
+        else:
+            base_query = base_query.eq(field, value)
+
+    # Then apply role-based filters
+    if user_info.data['role'] == 'agent':
+        # For agents: show all tickets in their group (excluding Admin group)
+        base_query = base_query.neq('group_name', 'Admin')
+    elif user_info.data['role'] == 'admin':
+        # Admins can see all tickets
+        pass
+    else:
+        # Regular users shouldn't be able to use AutoCRM
+        return 'Sorry, only agents and admins can use the AutoCRM assistant.'
+
+    # Execute the query
+    tickets = await aexecute(base_query)
+
+    # Format and return results
+    if tickets.data:
+        unique_tickets = sorted(
+            {t['id']: t for t in tickets.data}.values(),
+            key=lambda x: x['id']
+        )
+        # Format ticket display with more details
+        ticket_summaries = []
+        for t in unique_tickets:
+            status_str = f"({t['status']})"
+            priority_str = f"[{t['priority']}]" if 'priority' in t else ""
+            assigned_to = ""
+            if t.get('agents'):
+                assigned_to = f" - Assigned to @{t['agents']['name']}"
+            elif t.get('assigned_to') is None:
+                assigned_to = " - Unassigned"
+            ticket_summaries.append(f"#{t['id']}: {t['subject']} {status_str} {priority_str}{assigned_to}")
+        
+        ticket_summary = '\n'.join(ticket_summaries)
+        return f"I found these tickets:\n{ticket_summary}"
+    else:
+        return 'No tickets found matching your search criteria.'
+
+@traced("crm.action.update")
+async def handle_update_action(details: str, user_id: str, user: Dict[str, Any], supabase_client: SupabaseClient) -> str:
+    responses = []
+    logger.info("Processing UPDATE action")
+    # Updated regex to handle unassigned tickets and ranges
+    ticket_match = TICKET_SPEC_RE.search(details)
+    priority_match = re.search(r'priority:\s*(low|normal|high|urgent)(?=\s+\w+:|$)', details, re.IGNORECASE)
+    status_match = re.search(r'status:\s*(open|pending|solved|closed)(?=\s+\w+:|$)', details, re.IGNORECASE)
+    group_match = re.search(r'group_name:\s*(Admin|Support)(?=\s+\w+:|$)', details)
+    type_match = re.search(r'type:\s*(question|incident|problem|task)(?=\s+\w+:|$)', details, re.IGNORECASE)
+    # Updated pattern to handle topic values with spaces and special characters
+    topic_match = re.search(r'topic:\s*"([^"]+)"(?=\s+\w+:|$)', details)
+    if not topic_match:
+        # Try without quotes but ensure we don't capture subsequent fields
+        topic_match = re.search(r'topic:\s*((?:[^"\s]+(?:\s+(?!(?:status|priority|group_name|assigned_to|type):|$)[^"\s]+)*)+)(?=\s+\w+:|$)', details)
+    # Updated pattern to handle email addresses without @ prefix
+    assigned_to_match = re.search(r'assigned_to:\s*(unassigned|[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,})(?=\s|$)', details, re.IGNORECASE)
+    
+    logger.info("Regex matches: %s", {
+        'ticket_match': ticket_match.group(1) if ticket_match else None,
+        'priority_match': priority_match.group(1) if priority_match else None,
+        'status_match': status_match.group(1) if status_match else None,
+        'group_match': group_match.group(1) if group_match else None,
+        'type_match': type_match.group(1) if type_match else None,
+        'topic_match': topic_match.group(1) if topic_match else None,
+        'assigned_to_match': assigned_to_match.group(1) if assigned_to_match else None
+    })
+
+    if not ticket_match:
+        return 'Please specify which tickets to update.'
+        
+    updates = {}
+    ticket_ids_str = ticket_match.group(1)
+    
+    # Parse updates
+    if priority_match:
+        priority = priority_match.group(1).lower()
+        logger.info("Processing priority: %s", priority)
+        if priority in ['low', 'normal', 'high', 'urgent']:
+            updates['priority'] = priority
+        else:
+            return 'Invalid priority. Must be "low", "normal", "high", or "urgent" (case insensitive)'
+            
+    if status_match:
+        status = status_match.group(1).lower()
+        logger.info("Processing status: %s", status)
+        if status in ['open', 'pending', 'solved', 'closed']:
+            updates['status'] = status
+        else:
+            return 'Invalid status. Must be "open", "pending", "solved", or "closed" (case insensitive)'
+            
+    if group_match:
+        group = group_match.group(1)  # Preserve case
+        logger.info("Processing group: %s", group)
+        if group in ['Admin', 'Support']:
+            updates['group_name'] = group
+        else:
+            return 'Invalid group name. Must be exactly "Admin" or "Support"'
+
+    if type_match:
+        ticket_type = type_match.group(1).lower()
+        logger.info("Processing type: %s", ticket_type)
+        if ticket_type in ['question', 'incident', 'problem', 'task']:
+            updates['ticket_type'] = ticket_type
+        else:
+            return 'Invalid type. Must be "question", "incident", "problem", or "task" (case insensitive)'
+
+    if topic_match:
+        topic = topic_match.group(1)
+        logger.info("Processing topic: %s", topic)
+        valid_topics = [
+            "Order & Shipping Issues",
+            "Billing & Account Concerns",
+            "Communication & Customer Experience",
+            "Policy, Promotions & Loyalty Programs",
+            "Product & Service Usage"
+        ]
+        # Case-insensitive comparison
+        matching_topic = next((t for t in valid_topics if t.lower() == topic.lower()), None)
+        if matching_topic:
+            updates['topic'] = matching_topic  # Use the exact case from valid_topics
+        else:
+            topic_list = '", "'.join(valid_topics)
+            return f'Invalid topic. Must be one of: "{topic_list}"'
+            
+    if assigned_to_match:
+        assignee = assigned_to_match.group(1)
+        logger.info("Found assigned_to match: %s", assignee)
+        
+        if assignee.lower() == 'unassigned':
+            updates['assigned_to'] = None
+        else:
+            # Extract email from the raw content
+            # The MentionInput component sends the email in the format: assigned_to: john.doe@example.com
+            # Remove any @ prefix if present as the email is stored without it
+            assignee_email = assignee.lstrip('@')
+            logger.info("Looking up agent with email: %s", assignee_email)
+            
+            assignee_data = await aexecute(supabase_client.table('profiles').select('id,full_name,email').eq('email', assignee_email))
+            logger.info("Assignee lookup result: %s", json.dumps(assignee_data.data if assignee_data.data else None, indent=2))
+            
+            if assignee_data.data:
+                updates['assigned_to'] = assignee_data.data[0]['id']
+                logger.info("Found agent %s (%s) with ID %s", 
+                    assignee_data.data[0].get('full_name'),
+                    assignee_data.data[0].get('email'),
+                    assignee_data.data[0]['id'])
+            else:
+                logger.error("Could not find agent with email %s. Raw assignee value was: %s", assignee_email, assignee)
+                return f'Could not find agent with email {assignee_email}'
+    
+    logger.info("Final updates object: %s", updates)
+    
+    # Process ticket IDs
+    if ticket_ids_str.lower() == 'unassigned':
+        logger.info("Fetching unassigned tickets...")
+        unassigned_tickets = await aexecute(supabase_client.table('tickets').select('*', count='exact').filter('assigned_to', 'is', 'null').order('id').limit(MAX_TICKETS_PER_UPDATE + 1))
+        tickets = unassigned_tickets.data or []
+        total = unassigned_tickets.count if unassigned_tickets.count is not None else len(tickets)
+        missing_ids = []
+        if not tickets:
+            logger.info("No unassigned tickets found in the system")
+            return 'No unassigned tickets found'
+        logger.info("Processing the following unassigned ticket IDs: %s", [t['id'] for t in tickets])
+    else:
+        # Ranges stay intervals; only tickets that exist are read
+        try:
+            ticket_ids, invalid_segments = parse_ticket_spec(ticket_ids_str)
+        except TicketSpecError as e:
+            return str(e)
+        responses.extend(f'Invalid ticket ID format: {segment}' for segment in invalid_segments)
+        logger.info("Ticket intervals: %s", ticket_ids.intervals)
+        tickets, total = await asyncio.to_thread(fetch_tickets, supabase_client, ticket_ids)
+        found_ids = {ticket['id'] for ticket in tickets}
+        missing_ids = [ticket_id for ticket_id in ticket_ids if ticket_id not in found_ids] if total <= MAX_TICKETS_PER_UPDATE else []
+
+    if total > MAX_TICKETS_PER_UPDATE:
+        return f'That would update {total} tickets; at most {MAX_TICKETS_PER_UPDATE} tickets can be updated at once.'
+
+    # Update tickets
+    update_results = [{'id': ticket_id, 'success': False, 'error': 'Ticket not found'} for ticket_id in missing_ids]
+    user_info = await aexecute(supabase_client.table('profiles').select('role').eq('id', user_id)) if tickets else None
+    is_agent = bool(user_info and user_info.data and user_info.data[0]['role'] == 'agent')
+    for current_ticket in tickets:
+        ticket_id = current_ticket['id']
+        try:
+            # Check permissions
+            if is_agent and current_ticket['group_name'] == 'Admin':
+                update_results.append({'id': ticket_id, 'success': False, 'error': 'Agents cannot modify Admin group tickets'})
+                continue
+            
+            # Store previous state
+            previous_ticket = current_ticket.copy()
+            
+            # Update ticket
+            updated_ticket = await aexecute(supabase_client.table('tickets').update(updates).eq('id', ticket_id))
+            
+            if updated_ticket.data:
+                ticket_contexts.invalidate(ticket_id)
+                agent_directory.ticket_changed(previous_ticket, updated_ticket.data[0])
+                # Create notification
+                await notify_ticket_updated(supabase_client, updated_ticket.data[0], user, previous_ticket)
+                update_results.append({'id': ticket_id, 'success': True})
+            else:
+                update_results.append({'id': ticket_id, 'success': False, 'error': 'Update failed'})
+                
+        except Exception as e:
+            logger.error(f"Error updating ticket {ticket_id}: {str(e)}")
+            update_results.append({'id': ticket_id, 'success': False, 'error': str(e)})
+    
+    # Format response
+    successful = [r['id'] for r in update_results if r['success']]
+    failed = [(r['id'], r['error']) for r in update_results if not r['success']]
+    
+    response_parts = []
+    if successful:
+        # Format field updates with special handling for assigned_to
+        formatted_updates = []
+        for key, value in updates.items():
+            if key == 'assigned_to':
+                if value is None:
+                    formatted_updates.append('Assigned To set to Unassigned')
+                else:
+                    # Get assignee info
+                    assignee_data = await aexecute(supabase_client.table('profiles').select('full_name,email').eq('id', value).single())
+                    assignee = assignee_data.data if assignee_data.data else None
+                    # Show name in UI but keep email as reference
+                    if assignee:
+                        name = assignee.get('full_name') or 'Unknown user'
+                        formatted_updates.append(f'Assigned To set to @{name}')
+                    else:
+                        formatted_updates.append('Assigned To set to Unknown user')
+            else:
+                # Capitalize first letter of value and format key
+                formatted_key = ' '.join(word.title() for word in key.split('_'))
+                formatted_value = str(value)[0].upper() + str(value)[1:] if value else value
+                formatted_updates.append(f'{formatted_key} set to {formatted_value}')
+        
+        fields_updated = ', '.join(formatted_updates)
+        # Use the format_ticket_numbers helper for successful tickets
+        ticket_nums = format_ticket_numbers(successful)
+        response_parts.append(f"Successfully updated tickets {ticket_nums} with: {fields_updated}")
+
+    if failed:
+        # Group failed tickets by error message
+        error_groups = {}
+        for ticket_id, error in failed:
+            if error not in error_groups:
+                error_groups[error] = []
+            error_groups[error].append(ticket_id)
+        
+        # Format each error group with ticket ranges
+        failure_messages = []
+        for error, tickets in error_groups.items():
+            ticket_range = format_ticket_numbers(tickets)
+            failure_messages.append(f"{ticket_range} ({error})")
+        
+        response_parts.append(f"Failed to update tickets: {', '.join(failure_messages)}")
+    
+    responses.append('\n'.join(response_parts))
+    return '\n'.join(responses)
+
+@traced("crm.action.create")
+async def handle_create_action(details: str, user_id: str, supabase_client: SupabaseClient) -> str:
+    subject_match = details.split('subject:', 1)
+    if len(subject_match) < 2:
+        return 'Please specify a subject for the ticket.'
+        
+    subject = subject_match[1].strip()
+    new_ticket = await aexecute(supabase_client.table('tickets').insert({
+        'subject': subject,
+        'user_id': user_id,
+        'status': 'open',
+        'priority': 'normal',
+        'created_at': 'now()',
+        'updated_at': 'now()'
+    }))
+    
+    if new_ticket.data:
+        return f"Created new ticket #{new_ticket.data[0]['id']} with subject: {subject}"
+    else:
+        return 'Failed to create ticket.'
+
+@traced("crm.action.info")
+async def handle_info_action(details: str, user_id: str, supabase_client: SupabaseClient) -> str:
+    customer_match = details.split('customer:', 1)
+    customer_id = customer_match[1].strip() if len(customer_match) > 1 else user_id
+    
+    customer_info = await aexecute(supabase_client.table('profiles').select('*').eq('id', customer_id).single())
+    
+    if customer_info.data:
+        return f"Customer Information:\nName: {customer_info.data['name']}\nEmail: {customer_info.data['email']}"
+    else:
+        return 'Customer not found.'
 
+@traced("crm.handle_operations")
 async def handle_crm_operations(result: str, user_id: str, supabase_client: SupabaseClient, display_content: str = '') -> str:
     try:
         # Get user info at the start
-        user_info = supabase_client.table('profiles').select('*').eq('id', user_id).single().execute()
+        user_info = await aexecute(supabase_client.table('profiles').select('*').eq('id', user_id).single())
         if not user_info.data:
             raise ValueError('User not found')
         user = {
@@ -208,359 +587,28 @@ async def handle_crm_operations(result: str, user_id: str, supabase_client: Supa
         if not actions:
             return "I couldn't understand your request. Please try rephrasing it."
             
-        responses = []
+        parsed_actions = []
         for action_text in actions:
             action_match = action_text.split('ACTION: ', 1)[1].split(' ', 1)
             if len(action_match) != 2:
                 continue
                 
             action, details = action_match
-            
-            if action.upper() == 'SEARCH':
-                # Parse field-based search criteria using the raw query content
-                field_matches = re.finditer(r'(\w+):\s*([^\s]+(?:\s+[^\s]+)*?)(?=\s+\w+:|$)', details)
-                search_criteria = {match.group(1): match.group(2) for match in field_matches}
-                
-                logger.info("Search criteria before processing: %s", search_criteria)
-                
-                # The email is already in the raw query from MentionInput, no need to parse display_content
-                if 'assigned_to' in search_criteria:
-                    assignee = search_criteria['assigned_to']
-                    if assignee.lower() != 'unassigned':
-                        # Remove any @ prefix if present as the email is stored without it
-                        assignee_email = assignee.lstrip('@')
-                        logger.info("Looking up agent with email: %s", assignee_email)
-                        search_criteria['assigned_to'] = assignee_email
-                
-                # Get user role
-                user_info = supabase_client.table('profiles').select('role').eq('id', user_id).single().execute()
-                
-                # Build query based on role and search criteria
-                base_query = supabase_client.table('tickets').select('''
-                    *,
-                    profiles!tickets_user_id_fkey (email, name),
-                    agents:profiles!tickets_assigned_to_fkey (email, name)
-                ''')
-
-                # Apply search criteria first
-                for field, value in search_criteria.items():
-                    if field == 'assigned_to':
-                        if value.lower() == 'unassigned':
-                            base_query = base_query.is_('assigned_to', 'null')
-                        else:
-                            # Look up the user ID for the email
-                            assignee_data = supabase_client.table('profiles').select('id').eq('email', value).execute()
-                            if assignee_data.data:
-                                base_query = base_query.eq('assigned_to', assignee_data.data[0]['id'])
-                    else:
-                        base_query = base_query.eq(field, value)
-
-                # Then apply role-based filters
-                if user_info.data['role'] == 'agent':
-                    # For agents: show all tickets in their group (excluding Admin group)
-                    base_query = base_query.neq('group_name', 'Admin')
-                elif user_info.data['role'] == 'admin':
-                    # Admins can see all tickets
-                    pass
-                else:
-                    # Regular users shouldn't be able to use AutoCRM
-                    responses.append('Sorry, only agents and admins can use the AutoCRM assistant.')
-                    continue
-
-                # Execute the query
-                tickets = base_query.execute()
-
-                # Format and return results
-                if tickets.data:
-                    unique_tickets = sorted(
-                        {t['id']: t for t in tickets.data}.values(),
-                        key=lambda x: x['id']
-                    )
-                    # Format ticket display with more details
-                    ticket_summaries = []
-                    for t in unique_tickets:
-                        status_str = f"({t['status']})"
-                        priority_str = f"[{t['priority']}]" if 'priority' in t else ""
-                        assigned_to = ""
-                        if t.get('agents'):
-                            assigned_to = f" - Assigned to @{t['agents']['name']}"
-                        elif t.get('assigned_to') is None:
-                            assigned_to = " - Unassigned"
-                        ticket_summaries.append(f"#{t['id']}: {t['subject']} {status_str} {priority_str}{assigned_to}")
-                    
-                    ticket_summary = '\n'.join(ticket_summaries)
-                    responses.append(f"I found these tickets:\n{ticket_summary}")
-                else:
-                    responses.append('No tickets found matching your search criteria.')
-                    
-            elif action.upper() == 'UPDATE':
-                logger.info("Processing UPDATE action")
-                # Updated regex to handle unassigned tickets and ranges
-                ticket_match = re.search(r'ticket:\s*([\d,\s\-]+|unassigned)(?=\s+\w+:|$)', details)
-                priority_match = re.search(r'priority:\s*(low|normal|high|urgent)(?=\s+\w+:|$)', details, re.IGNORECASE)
-                status_match = re.search(r'status:\s*(open|pending|solved|closed)(?=\s+\w+:|$)', details, re.IGNORECASE)
-                group_match = re.search(r'group_name:\s*(Admin|Support)(?=\s+\w+:|$)', details)
-                type_match = re.search(r'type:\s*(question|incident|problem|task)(?=\s+\w+:|$)', details, re.IGNORECASE)
-                # Updated pattern to handle topic values with spaces and special characters
-                topic_match = re.search(r'topic:\s*"([^"]+)"(?=\s+\w+:|$)', details)
-                if not topic_match:
-                    # Try without quotes but ensure we don't capture subsequent fields
-                    topic_match = re.search(r'topic:\s*((?:[^"\s]+(?:\s+(?!(?:status|priority|group_name|assigned_to|type):|$)[^"\s]+)*)+)(?=\s+\w+:|$)', details)
-                # Updated pattern to handle email addresses without @ prefix
-                assigned_to_match = re.search(r'assigned_to:\s*(unassigned|[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,})(?=\s|$)', details, re.IGNORECASE)
-                
-                logger.info("Regex matches: %s", {
-                    'ticket_match': ticket_match.group(1) if ticket_match else None,
-                    'priority_match': priority_match.group(1) if priority_match else None,
-                    'status_match': status_match.group(1) if status_match else None,
-                    'group_match': group_match.group(1) if group_match else None,
-                    'type_match': type_match.group(1) if type_match else None,
-                    'topic_match': topic_match.group(1) if topic_match else None,
-                    'assigned_to_match': assigned_to_match.group(1) if assigned_to_match else None
-                })
-
-                if not ticket_match:
-                    responses.append('Please specify which tickets to update.')
-                    continue
-                    
-                updates = {}
-                ticket_ids_str = ticket_match.group(1)
-                
-                # Parse updates
-                if priority_match:
-                    priority = priority_match.group(1).lower()
-                    logger.info("Processing priority: %s", priority)
-                    if priority in ['low', 'normal', 'high', 'urgent']:
-                        updates['priority'] = priority
-                    else:
-                        responses.append('Invalid priority. Must be "low", "normal", "high", or "urgent" (case insensitive)')
-                        continue
-                        
-                if status_match:
-                    status = status_match.group(1).lower()
-                    logger.info("Processing status: %s", status)
-                    if status in ['open', 'pending', 'solved', 'closed']:
-                        updates['status'] = status
-                    else:
-                        responses.append('Invalid status. Must be "open", "pending", "solved", or "closed" (case insensitive)')
-                        continue
-                        
-                if group_match:
-                    group = group_match.group(1)  # Preserve case
-                    logger.info("Processing group: %s", group)
-                    if group in ['Admin', 'Support']:
-                        updates['group_name'] = group
-                    else:
-                        responses.append('Invalid group name. Must be exactly "Admin" or "Support"')
-                        continue
-
-                if type_match:
-                    ticket_type = type_match.group(1).lower()
-                    logger.info("Processing type: %s", ticket_type)
-                    if ticket_type in ['question', 'incident', 'problem', 'task']:
-                        updates['ticket_type'] = ticket_type
-                    else:
-                        responses.append('Invalid type. Must be "question", "incident", "problem", or "task" (case insensitive)')
-                        continue
-
-                if topic_match:
-                    topic = topic_match.group(1)
-                    logger.info("Processing topic: %s", topic)
-                    valid_topics = [
-                        "Order & Shipping Issues",
-                        "Billing & Account Concerns",
-                        "Communication & Customer Experience",
-                        "Policy, Promotions & Loyalty Programs",
-                        "Product & Service Usage"
-                    ]
-                    # Case-insensitive comparison
-                    matching_topic = next((t for t in valid_topics if t.lower() == topic.lower()), None)
-                    if matching_topic:
-                        updates['topic'] = matching_topic  # Use the exact case from valid_topics
-                    else:
-                        topic_list = '", "'.join(valid_topics)
-                        responses.append(f'Invalid topic. Must be one of: "{topic_list}"')
-                        continue
-                        
-                if assigned_to_match:
-                    assignee = assigned_to_match.group(1)
-                    logger.info("Found assigned_to match: %s", assignee)
-                    
-                    if assignee.lower() == 'unassigned':
-                        updates['assigned_to'] = None
-                    else:
-                        # Extract email from the raw content
-                        # The MentionInput component sends the email in the format: assigned_to: john.doe@example.com
-                        # Remove any @ prefix if present as the email is stored without it
-                        assignee_email = assignee.lstrip('@')
-                        logger.info("Looking up agent with email: %s", assignee_email)
-                        
-                        assignee_data = supabase_client.table('profiles').select('id,full_name,email').eq('email', assignee_email).execute()
-                        logger.info("Assignee lookup result: %s", json.dumps(assignee_data.data if assignee_data.data else None, indent=2))
-                        
-                        if assignee_data.data:
-                            updates['assigned_to'] = assignee_data.data[0]['id']
-                            logger.info("Found agent %s (%s) with ID %s", 
-                                assignee_data.data[0].get('full_name'),
-                                assignee_data.data[0].get('email'),
-                                assignee_data.data[0]['id'])
-                        else:
-                            logger.error("Could not find agent with email %s. Raw assignee value was: %s", assignee_email, assignee)
-                            responses.append(f'Could not find agent with email {assignee_email}')
-                            continue
-                
-                logger.info("Final updates object: %s", updates)
-                
-                # Process ticket IDs
-                ticket_ids = []
-                if ticket_ids_str.lower() == 'unassigned':
-                    logger.info("Fetching unassigned tickets...")
-                    unassigned_tickets = supabase_client.table('tickets').select('id').filter('assigned_to', 'is', 'null').execute()
-                    logger.info("Unassigned tickets query result: %s", json.dumps(unassigned_tickets.data if unassigned_tickets.data else [], indent=2))
-                    if unassigned_tickets.data:
-                        ticket_ids = [t['id'] for t in unassigned_tickets.data]
-                        logger.info("Processing the following unassigned ticket IDs: %s", ticket_ids)
-                    else:
-                        logger.info("No unassigned tickets found in the system")
-                        responses.append('No unassigned tickets found')
-                        continue
-                else:
-                    # Process normal ticket IDs or ranges
-                    raw_ticket_ids = ticket_ids_str.split(',')
-                    logger.info("Raw ticket segments: %s", raw_ticket_ids)
-                    
-                    for segment in raw_ticket_ids:
-                        segment = segment.strip()
-                        logger.info("Processing segment: %s", segment)
-                        
-                        # Check if it's a range (e.g., "43-47")
-                        range_match = re.match(r'^(\d+)-(\d+)$', segment)
-                        if range_match:
-                            start, end = map(int, range_match.groups())
-                            ticket_ids.extend(range(start, end + 1))
-                        else:
-                            try:
-                                ticket_ids.append(int(segment))
-                            except ValueError:
-                                responses.append(f'Invalid ticket ID format: {segment}')
-                                continue
-                
-                # Update tickets
-                update_results = []
-                for ticket_id in ticket_ids:
-                    try:
-                        # Get current ticket
-                        current_ticket = supabase_client.table('tickets').select('*').eq('id', ticket_id).execute()
-                        
-                        if not current_ticket.data:
-                            update_results.append({'id': ticket_id, 'success': False, 'error': 'Ticket not found'})
-                            continue
-                            
-                        # Check permissions
-                        user_info = supabase_client.table('profiles').select('role').eq('id', user_id).execute()
-                        if user_info.data and user_info.data[0]['role'] == 'agent' and current_ticket.data[0]['group_name'] == 'Admin':
-                            update_results.append({'id': ticket_id, 'success': False, 'error': 'Agents cannot modify Admin group tickets'})
-                            continue
-                        
-                        # Store previous state
-                        previous_ticket = current_ticket.data[0].copy()
-                        
-                        # Update ticket
-                        updated_ticket = supabase_client.table('tickets').update(updates).eq('id', ticket_id).execute()
-                        
-                        if updated_ticket.data:
-                            # Create notification
-                            await notify_ticket_updated(supabase_client, updated_ticket.data[0], user, previous_ticket)
-                            update_results.append({'id': ticket_id, 'success': True})
-                        else:
-                            update_results.append({'id': ticket_id, 'success': False, 'error': 'Update failed'})
-                            
-                    except Exception as e:
-                        logger.error(f"Error updating ticket {ticket_id}: {str(e)}")
-                        update_results.append({'id': ticket_id, 'success': False, 'error': str(e)})
-                
-                # Format response
-                successful = [r['id'] for r in update_results if r['success']]
-                failed = [(r['id'], r['error']) for r in update_results if not r['success']]
-                
-                response_parts = []
-                if successful:
-                    # Format field updates with special handling for assigned_to
-                    formatted_updates = []
-                    for key, value in updates.items():
-                        if key == 'assigned_to':
-                            if value is None:
-                                formatted_updates.append('Assigned To set to Unassigned')
-                            else:
-                                # Get assignee info
-                                assignee_data = supabase_client.table('profiles').select('full_name,email').eq('id', value).single().execute()
-                                assignee = assignee_data.data if assignee_data.data else None
-                                # Show name in UI but keep email as reference
-                                if assignee:
-                                    name = assignee.get('full_name') or 'Unknown user'
-                                    formatted_updates.append(f'Assigned To set to @{name}')
-                                else:
-                                    formatted_updates.append('Assigned To set to Unknown user')
-                        else:
-                            # Capitalize first letter of value and format key
-                            formatted_key = ' '.join(word.title() for word in key.split('_'))
-                            formatted_value = str(value)[0].upper() + str(value)[1:] if value else value
-                            formatted_updates.append(f'{formatted_key} set to {formatted_value}')
-                    
-                    fields_updated = ', '.join(formatted_updates)
-                    # Use the format_ticket_numbers helper for successful tickets
-                    ticket_nums = format_ticket_numbers(successful)
-                    response_parts.append(f"Successfully updated tickets {ticket_nums} with: {fields_updated}")
-
-                if failed:
-                    # Group failed tickets by error message
-                    error_groups = {}
-                    for ticket_id, error in failed:
-                        if error not in error_groups:
-                            error_groups[error] = []
-                        error_groups[error].append(ticket_id)
-                    
-                    # Format each error group with ticket ranges
-                    failure_messages = []
-                    for error, tickets in error_groups.items():
-                        ticket_range = format_ticket_numbers(tickets)
-                        failure_messages.append(f"{ticket_range} ({error})")
-                    
-                    response_parts.append(f"Failed to update tickets: {', '.join(failure_messages)}")
-                
-                responses.append('\n'.join(response_parts))
-                
-            elif action.upper() == 'CREATE':
-                subject_match = details.split('subject:', 1)
-                if len(subject_match) < 2:
-                    responses.append('Please specify a subject for the ticket.')
-                    continue
-                    
-                subject = subject_match[1].strip()
-                new_ticket = supabase_client.table('tickets').insert({
-                    'subject': subject,
-                    'user_id': user_id,
-                    'status': 'open',
-                    'priority': 'normal',
-                    'created_at': 'now()',
-                    'updated_at': 'now()'
-                }).execute()
-                
-                if new_ticket.data:
-                    responses.append(f"Created new ticket #{new_ticket.data[0]['id']} with subject: {subject}")
-                else:
-                    responses.append('Failed to create ticket.')
-                    
-            elif action.upper() == 'INFO':
-                customer_match = details.split('customer:', 1)
-                customer_id = customer_match[1].strip() if len(customer_match) > 1 else user_id
-                
-                customer_info = supabase_client.table('profiles').select('*').eq('id', customer_id).single().execute()
-                
-                if customer_info.data:
-                    responses.append(f"Customer Information:\nName: {customer_info.data['name']}\nEmail: {customer_info.data['email']}")
-                else:
-                    responses.append('Customer not found.')
+            action = action.upper()
+            if action in ('SEARCH', 'UPDATE', 'CREATE', 'INFO'):
+                parsed_actions.append((action, details))
+
+        async def execute_action(action: str, details: str) -> str:
+            if action == 'SEARCH':
+                return await handle_search_action(details, user_id, supabase_client)
+            elif action == 'UPDATE':
+                return await handle_update_action(details, user_id, user, supabase_client)
+            elif action == 'CREATE':
+                return await handle_create_action(details, user_id, supabase_client)
+            return await handle_info_action(details, user_id, supabase_client)
+
+        # Independent actions run concurrently; responses keep the action order
+        responses = await run_actions(parsed_actions, execute_action)
         
         return '\n'.join(responses) if responses else "I couldn't process your request. Please try again."
         
@@ -568,33 +616,19 @@ async def handle_crm_operations(result: str, user_id: str, supabase_client: Supa
         print(f"Error in handle_crm_operations: {str(e)}")
         return "I encountered an error while processing your request. Please try again."
 
-@app.post("/autocrm")
+@app.post("/autocrm", response_model=AutoCRMResponse, openapi_extra=body_openapi(AutoCRMRequest),
+          dependencies=[Depends(json_body(AutoCRMRequest)), Depends(admit(PRIORITY_AGENT, get_current_user_cached))])
 async def handle_autocrm(
-    request: Dict[str, Any],
-    authorization: str = Header(None)
+    request: AutoCRMRequest = Depends(json_body(AutoCRMRequest)),
+    user: Dict[str, Any] = Depends(get_current_user_cached)
 ):
     logger.info("Received AutoCRM request")
-    
-    if not authorization:
-        logger.error("No authorization header provided")
-        raise HTTPException(status_code=401, detail="No authorization header")
 
     try:
-        # Debug logging for auth token
-        logger.info(f"Processing auth token: {authorization[:20]}...")
-        
-        # Get user from auth token
-        logger.info("Attempting to get user from auth token")
-        user_response = supabase.auth.get_user(authorization.replace('Bearer ', ''))
-        logger.info(f"User response received: {user_response}")
-        user = user_response.user
-
-        if not user:
-            logger.error("Invalid token - no user found")
-            raise HTTPException(status_code=401, detail="Invalid token")
+        supabase = get_supabase()
 
         # Check if user is agent or admin
-        user_role = user.user_metadata.get('role')
+        user_role = user['user_metadata']['role']
         logger.info(f"User role: {user_role}")
         is_agent_or_admin = user_role in ['agent', 'admin']
         if not is_agent_or_admin:
@@ -614,12 +648,12 @@ async def handle_autocrm(
             )
 
         # Get request data
-        query = request.get('query')  # This is the raw text content
-        display_content = request.get('displayContent')  # This is the HTML content with mentions
-        user_id = request.get('userId')
+        query = request.query  # This is the raw text content
+        display_content = request.displayContent  # This is the HTML content with mentions
+        user_id = request.userId
         
         # Add detailed logging of the request data
-        logger.info("Raw request data: %s", json.dumps(request, indent=2))
+        logger.info("Raw request data: %s", request.model_dump_json(indent=2))
         logger.info("Query (raw content): %s", query)
         logger.info("Display content (HTML): %s", display_content)
         logger.info("User ID: %s", user_id)
@@ -639,18 +673,17 @@ async def handle_autocrm(
         logger.info("Final query being sent to LLM: %s", query)
         logger.info("=" * 50)
 
-        if not query or not user_id:
-            logger.error("Missing required fields in request")
-            raise HTTPException(status_code=400, detail="Query and userId are required")
-
         # Get or create conversation and store user message
+        conversation_row = None
+        user_message_id = None
         try:
             # Get or create conversation
-            conversation = supabase.table('autocrm_conversations').select('id').eq('user_id', user_id).order('updated_at.desc').limit(1).execute()
+            conversation = supabase.table('autocrm_conversations').select('id, summary, summarized_through').eq('user_id', user_id).order('updated_at.desc').limit(1).execute()
             
             conversation_id = None
             if conversation.data:
-                conversation_id = conversation.data[0]['id']
+                conversation_row = conversation.data[0]
+                conversation_id = conversation_row['id']
                 logger.info("Found existing conversation for user message: %s", conversation_id)
             else:
                 # Create new conversation
@@ -660,7 +693,8 @@ async def handle_autocrm(
                     'updated_at': datetime.now().isoformat()
                 }).execute()
                 if new_conv.data:
-                    conversation_id = new_conv.data[0]['id']
+                    conversation_row = new_conv.data[0]
+                    conversation_id = conversation_row['id']
                     logger.info("Created new conversation for user message: %s", conversation_id)
 
             if conversation_id:
@@ -674,6 +708,8 @@ async def handle_autocrm(
                 }
                 logger.info("Storing user message: %s", json.dumps(user_message_data, indent=2))
                 user_message_result = supabase.table('autocrm_messages').insert(user_message_data).execute()
+                if user_message_result.data:
+                    user_message_id = user_message_result.data[0]['id']
                 logger.info("User message store result: %s", json.dumps(user_message_result.data if user_message_result.data else [], indent=2))
 
                 # Update conversation timestamp
@@ -690,6 +726,8 @@ async def handle_autocrm(
 
         # Initialize LangChain components
         logger.info("Initializing LangChain components")
+        from langchain_core.prompts import ChatPromptTemplate
+
         system_prompt = """You are an AI assistant helping with CRM tasks. You must respond in a structured format that starts with an ACTION: followed by the action type and any relevant details.
 
     Available actions:
@@ -748,27 +786,12 @@ Current request:
             ("human", human_prompt),
         ])
 
-        # Get conversation history
-        history = []
+        # Conversation memory: rolling summary plus the most recent turns
+        history = None
         try:
-            # Get the most recent conversation
-            logger.info("Fetching most recent conversation for user_id: %s", user_id)
-            conversation = supabase.table('autocrm_conversations').select('id').eq('user_id', user_id).order('updated_at.desc').limit(1).execute()
-            logger.info("Conversation query result: %s", json.dumps(conversation.data if conversation.data else [], indent=2))
-            
-            if conversation.data:
-                conversation_id = conversation.data[0]['id']
-                logger.info("Found conversation ID: %s", conversation_id)
-                # Get only the last system message from this conversation
-                logger.info("Fetching last system message from conversation")
-                messages = supabase.table('autocrm_messages').select('sender,content').eq('conversation_id', conversation_id).eq('sender', 'system').order('created_at.desc').limit(1).execute()
-                logger.info("Messages query result: %s", json.dumps(messages.data if messages.data else [], indent=2))
-                
-                if messages.data:
-                    history = [f"{msg['sender']}: {msg['content']}" for msg in messages.data]
-                    logger.info("Constructed history: %s", history)
-                else:
-                    logger.info("No system messages found in conversation")
+            if conversation_row:
+                history = load_history(supabase, conversation_row, exclude_id=user_message_id)
+                logger.info("Loaded %d recent messages, %d to summarize", len(history.recent), len(history.unsummarized))
             else:
                 logger.info("No conversation found for user")
         except Exception as e:
@@ -777,27 +800,10 @@ Current request:
             # Continue without history if there's an error
             pass
 
-        logger.info("Final history to be used in prompt: %s", history)
-
-        # Initialize model with tracing enabled
-        model = ChatOpenAI(
-            openai_api_key=openai_api_key,
-            model_name='gpt-4o-mini',
-            temperature=0.7,
-            tags=["autocrm"],
-            metadata={
-                "user_id": user_id,
-                "user_role": user_role
-            }
-        )
-
-        # Create chain with tracing
-        chain = prompt.pipe(model).pipe(StrOutputParser())
-
         # Log the full prompt being sent to the LLM
         prompt_input = {
             'input': query,  # Current query
-            'history': '\n'.join(history) if history else 'No previous conversation'  # Add conversation history
+            'history': history.render() if history else 'No previous conversation'  # Add conversation history
         }
         logger.info("Prompt input parameters: %s", json.dumps(prompt_input, indent=2))
         formatted_prompt = prompt.format_messages(**prompt_input)
@@ -807,8 +813,16 @@ Current request:
             logger.info("Content:\n%s", message.content)
             logger.info("-" * 50)  # Add separator between messages
 
-        # Run the chain
-        result = await chain.ainvoke(prompt_input)
+        # Run the model with tracing enabled
+        result = await model_router.complete(
+            TASK_AUTOCRM_ACTIONS,
+            formatted_prompt,
+            tags=["autocrm"],
+            metadata={
+                "user_id": user_id,
+                "user_role": user_role
+            }
+        )
 
         # Log the raw LLM response with clear separator for visibility
         logger.info("=" * 50)
@@ -863,42 +877,34 @@ Current request:
             # Continue even if storing fails
             pass
 
+        # Fold turns that left the recent window into the summary after responding
+        if history and history.unsummarized:
+            run_in_background(update_summary(supabase, history))
+
         # Log the processed response
         logger.info("Processed CRM response: \n%s", response)
 
         return {"reply": response}
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in handle_autocrm: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/autocrm/transcribe")
+@app.post("/autocrm/transcribe", dependencies=[Depends(admit(PRIORITY_AGENT, get_current_user_cached))])
 async def transcribe_audio(
     file: UploadFile = File(...),
-    authorization: str = Header(None)
+    user: Dict[str, Any] = Depends(get_current_user_cached)
 ):
     """
     Endpoint to transcribe audio using OpenAI Whisper and process it through AutoCRM.
     """
     logger.info("Received audio transcription request")
-    
-    if not authorization:
-        logger.error("No authorization header provided")
-        raise HTTPException(status_code=401, detail="No authorization header")
 
     try:
-        # Get user from auth token
-        logger.info("Attempting to get user from auth token")
-        user_response = supabase.auth.get_user(authorization.replace('Bearer ', ''))
-        logger.info(f"User response received: {user_response}")
-        user = user_response.user
-
-        if not user:
-            logger.error("Invalid token - no user found")
-            raise HTTPException(status_code=401, detail="Invalid token")
-
         # Check if user is agent or admin
-        user_role = user.user_metadata.get('role')
+        user_role = user['user_metadata']['role']
         logger.info(f"User role: {user_role}")
         is_agent_or_admin = user_role in ['agent', 'admin']
         if not is_agent_or_admin:
@@ -915,31 +921,25 @@ async def transcribe_audio(
             temp_file.flush()
             
             try:
-                # Initialize OpenAI client
-                client = openai.OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-                
                 # Transcribe audio using OpenAI Whisper
                 logger.info("Transcribing audio with Whisper")
                 with open(temp_file.name, 'rb') as audio_file:
-                    transcript = client.audio.transcriptions.create(
-                        file=audio_file,
-                        model="whisper-1"
-                    )
+                    transcript_text = await llm.transcribe(audio_file)
                 logger.info("Transcription successful")
                 
                 # Process transcribed text through AutoCRM
-                autocrm_request = {
-                    'query': transcript.text,
-                    'userId': user.id
-                }
+                try:
+                    autocrm_request = AutoCRMRequest(query=transcript_text.strip(), userId=str(user['id']))
+                except ValidationError as e:
+                    raise HTTPException(status_code=422, detail=f"Transcription cannot be processed: {e.errors()[0]['msg']}")
                 
-                logger.info(f"Processing transcribed text through AutoCRM: {transcript.text}")
+                logger.info(f"Processing transcribed text through AutoCRM: {transcript_text}")
                 
                 # Process through existing AutoCRM logic
-                response = await handle_autocrm(autocrm_request, authorization)
+                response = await handle_autocrm(autocrm_request, user)
                 
                 return {
-                    "transcription": transcript.text,
+                    "transcription": transcript_text,
                     "reply": response["reply"]
                 }
                 
@@ -947,11 +947,14 @@ async def transcribe_audio(
                 # Clean up temporary file
                 os.unlink(temp_file.name)
                 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in transcribe_audio: {str(e)}")
         logger.error("Stack trace:", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
+@traced("search.relevant_articles")
 async def get_relevant_articles(ticket_context, recent_messages, supabase_client):
     try:
         # Combine ticket context and recent messages into a query
@@ -965,60 +968,37 @@ async def get_relevant_articles(ticket_context, recent_messages, supabase_client
         
         logger.info("Combined query text for article search: %s", query_text[:200] + "..." if len(query_text) > 200 else query_text)
 
-        # Get embeddings using LangChain
-        embeddings = OpenAIEmbeddings(model="text-embedding-3-large")
-        query_embedding = await embeddings.aembed_query(query_text.strip())
-        logger.info("Generated embeddings for article search")
-
-        # Query Pinecone for similar articles
-        query_response = index.query(
-            vector=query_embedding,
-            top_k=5,
-            include_metadata=True,
-            filter={
-                "type": "article"  # Only get articles
-            }
-        )
-        logger.info("Pinecone query completed. Found %d matches", len(query_response['matches']))
-
-        # Get the articles from Supabase using the IDs from Pinecone
-        article_ids = []
-        for match in query_response['matches']:
-            if 'article_id' in match['metadata']:
-                article_ids.append(match['metadata']['article_id'])
-                logger.info("Found matching article ID: %s with score: %f", 
-                          match['metadata'].get('article_id'), 
-                          match['score'])
-
-        if not article_ids:
-            logger.info("No article IDs found in Pinecone matches")
-            return []
-
-        try:
-            articles_result = supabase_client.table('knowledge_base_articles').select('*').in_('id', article_ids).execute()
-            if articles_result.data:
-                logger.info("Retrieved %d articles from Supabase", len(articles_result.data))
-                for article in articles_result.data:
-                    logger.info("Retrieved article - Title: %s", article.get('title', ''))
-            else:
-                logger.info("No articles found in Supabase for the given IDs")
-            return articles_result.data if hasattr(articles_result, 'data') else []
-        except Exception as e:
-            logger.error('Error fetching knowledge base articles from Supabase: %s', str(e))
-            return []
+        # Over-fetch passages, then keep only the relevant, diverse ones for the prompt;
+        # when none clear the threshold the prompt gets no articles section at all
+        candidates = await retrieve_passages(query_text, top_k=RETRIEVAL_OVERFETCH)
+        passages = rerank(query_text, candidates)
+        logger.info("Passage search completed. Kept %d of %d matches", len(passages), len(candidates))
+
+        articles = []
+        for passage in passages:
+            logger.info("Found passage %d of article %s with score: %f (relevance %f)",
+                      passage['chunk'], passage['article_id'], passage['score'], passage['relevance'])
+            articles.append({
+                'id': passage['article_id'],
+                'title': passage['title'],
+                'content': passage['passage'],
+                'chunk': passage['chunk'],
+                'score': passage['relevance']
+            })
+        return articles
 
     except Exception as e:
         logger.error('Error in get_relevant_articles: %s', str(e))
         return []
 
+@traced("search.similar_messages")
 async def find_similar_messages(content: str, ticket_id: int, supabase_client: SupabaseClient, limit: int = 5) -> List[Dict]:
     try:
-        # Get embeddings using LangChain
-        embeddings = OpenAIEmbeddings(model="text-embedding-3-large")
-        query_embedding = await embeddings.aembed_query(content.strip())
+        # Get embeddings for the query
+        query_embedding = await llm.embed_query(content)
 
         # Query Pinecone for similar messages
-        query_response = index.query(
+        query_response = await get_vector_store().query(
             vector=query_embedding,
             top_k=limit,
             include_metadata=True,
@@ -1050,13 +1030,67 @@ async def find_similar_messages(content: str, ticket_id: int, supabase_client: S
 
 async def generate_message_embedding(content: str, ticket_id: str = None) -> List[float]:
     try:
-        embeddings = OpenAIEmbeddings(model="text-embedding-3-large")
-        embedding_vector = await embeddings.aembed_query(content.strip())
+        embedding_vector = await llm.embed_query(content)
         return embedding_vector
     except Exception as e:
         logger.error('Error generating message embedding: %s', str(e))
         return None
 
+async def generate_ai_reply(ticket_id: int, reply: Dict[str, Any], context: TicketContext, supabase_client: SupabaseClient) -> Optional[Dict[str, Any]]:
+    """
+    Generate and post the AI reply to ``reply`` from the ticket's context.
+
+    The snapshot is read when generation starts, after the debounce window,
+    so messages that arrived in the meantime are part of the prompt.
+    """
+    context = ticket_contexts.get(ticket_id) or context
+    ticket = context.ticket
+    recent_messages = context.recent_messages()
+
+    # Generate enhanced AI response using all context
+    ai_response = await generate_enhanced_response(
+        {
+            'ticket_context': ticket,
+            'recent_messages': recent_messages,
+            'relevant_articles': context.articles,
+            'similar_messages': recent_messages
+        },
+        reply['content'],
+        'user'
+    )
+    if not ai_response:
+        return None
+
+    # Get the assigned agent's ID from the ticket or find an available agent
+    assigned_agent_id = ticket.get('assigned_to')
+
+    if not assigned_agent_id:
+        # Find the least busy agent
+        agent = await agent_directory.pick(supabase_client)
+        if agent:
+            assigned_agent_id = agent['id']
+            # Update ticket with assigned agent
+            assigned = await aexecute(supabase_client.table('tickets').update({'assigned_to': assigned_agent_id}).eq('id', ticket_id))
+            if assigned.data:
+                agent_directory.ticket_changed(ticket, assigned.data[0])
+            ticket_contexts.update_ticket(ticket_id, {'assigned_to': assigned_agent_id})
+        else:
+            assigned_agent_id = "00000000-0000-0000-0000-000000000000"  # System user ID
+
+    # Create the AI reply
+    ai_reply_result = await aexecute(supabase_client.table('replies').insert({
+        'ticket_id': ticket_id,
+        'content': ai_response,
+        'user_id': assigned_agent_id,
+        'is_public': True,
+        'is_ai_generated': True
+    }))
+
+    if not ai_reply_result.data:
+        return None
+    ticket_contexts.add_reply(ticket_id, ai_reply_result.data[0])
+    return ai_reply_result.data[0]
+
 @app.post("/api/tickets/{ticket_id}/replies/{reply_id}/process", response_model=Dict[str, Any])
 async def process_reply(
     ticket_id: int,
@@ -1065,63 +1099,31 @@ async def process_reply(
     user: Dict[str, Any] = Depends(get_current_user)
 ):
     try:
-        # Get the ticket context
-        ticket_result = supabase_client.table('tickets').select('*').eq('id', ticket_id).execute()
-        if not hasattr(ticket_result, 'data') or not ticket_result.data:
+        # Get the ticket, the reply that was just created and recent messages,
+        # reusing the cached snapshot of an active conversation
+        context, reply = await asyncio.to_thread(load_ticket_context, ticket_id, str(reply_id), supabase_client)
+        if context is None:
             raise HTTPException(status_code=404, detail="Ticket not found")
-        ticket = ticket_result.data[0]
-
-        # Get the reply that was just created
-        reply_result = supabase_client.table('replies').select('*').eq('id', str(reply_id)).execute()
-        if not hasattr(reply_result, 'data') or not reply_result.data:
+        if reply is None:
             raise HTTPException(status_code=404, detail="Reply not found")
-        reply = reply_result.data[0]
-
-        # Get recent messages for context
-        recent_result = supabase_client.table('replies').select('*').eq('ticket_id', ticket_id).order('created_at', desc=True).limit(10).execute()
-        recent_messages = recent_result.data if hasattr(recent_result, 'data') else []
 
         # Only generate AI response if the message is from a user and not AI-generated
         if user['user_metadata']['role'] == 'user' and not reply.get('is_ai_generated'):
             try:
-                # Generate enhanced AI response using all context
-                ai_response = await generate_enhanced_response(
-                    {
-                        'ticket_context': ticket,
-                        'recent_messages': recent_messages,
-                        'relevant_articles': [],  # We can add this back if needed
-                        'similar_messages': recent_messages
-                    },
-                    reply['content'],
-                    'user'
-                )
-
-                if ai_response:
-                    # Get the assigned agent's ID from the ticket or find an available agent
-                    assigned_agent_id = ticket.get('assigned_to')
-                    
-                    if not assigned_agent_id:
-                        # Find an available agent
-                        agent_result = supabase_client.table('profiles').select('id').eq('role', 'agent').limit(1).execute()
-                        if hasattr(agent_result, 'data') and agent_result.data:
-                            assigned_agent_id = agent_result.data[0]['id']
-                            # Update ticket with assigned agent
-                            supabase_client.table('tickets').update({'assigned_to': assigned_agent_id}).eq('id', ticket_id).execute()
-                        else:
-                            assigned_agent_id = "00000000-0000-0000-0000-000000000000"  # System user ID
-
-                    # Create the AI reply
-                    ai_reply_result = supabase_client.table('replies').insert({
-                        'ticket_id': ticket_id,
-                        'content': ai_response,
-                        'user_id': assigned_agent_id,
-                        'is_public': True,
-                        'is_ai_generated': True
-                    }).execute()
-
-                    if hasattr(ai_reply_result, 'data'):
-                        return {"success": True, "ai_reply": ai_reply_result.data[0]}
-
+                # Messages in quick succession share one AI reply, generated
+                # for the last of them; only the generation takes an LLM slot
+                async def generate():
+                    async with llm_admission.slot(user['id'], PRIORITY_CUSTOMER):
+                        return await generate_ai_reply(ticket_id, reply, context, supabase_client)
+
+                ai_reply = await reply_coalescer.run(ticket_id, generate)
+                if ai_reply:
+                    return {"success": True, "ai_reply": ai_reply}
+
+            except Superseded:
+                return {"success": True, "coalesced": True}
+            except Overloaded as e:
+                raise shed_response(e)
             except Exception as e:
                 logger.error('Error generating AI response: %s', str(e))
                 # Don't raise an exception here, just log it
@@ -1129,168 +1131,232 @@ async def process_reply(
 
         return {"success": True}
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error('Error in process_reply: %s', str(e))
         raise HTTPException(status_code=400, detail=str(e))
 
-# Update the existing endpoint to just return the reply data
-@app.post("/api/tickets/{ticket_id}/replies", response_model=Dict[str, Any])
+@app.post("/api/tickets/{ticket_id}/changed", response_model=Dict[str, Any])
+async def ticket_changed(
+    ticket_id: int,
+    user: Dict[str, Any] = Depends(get_current_user_cached)
+):
+    """
+    Drop the cached context of a ticket written outside this API (e.g. by the
+    ``tickets`` edge function), so the next reply reads it again.
+    """
+    ticket_contexts.invalidate(ticket_id)
+    return {"success": True}
+
+async def process_new_reply(ticket_id: int, reply: Dict[str, Any], supabase_client: SupabaseClient) -> None:
+    """
+    Generate the AI reply to a reply created through the API, in the
+    background. The AI reply reaches the frontend through its Supabase
+    realtime subscription on ``replies``.
+    """
+    async def generate():
+        # Queued behind other LLM work rather than shed: the reply is already saved
+        async with llm_admission.slot(reply.get('user_id'), PRIORITY_CUSTOMER, shed=False):
+            return await generate_ai_reply(ticket_id, reply, context, supabase_client)
+
+    try:
+        context, _ = await asyncio.to_thread(load_ticket_context, ticket_id, str(reply['id']), supabase_client, reply)
+        if context is None:
+            logger.error('Ticket %s not found for reply %s', ticket_id, reply['id'])
+            return
+        await reply_coalescer.run(ticket_id, generate)
+    except Superseded:
+        pass
+    except Exception as e:
+        logger.error('Error generating AI response for reply %s: %s', reply.get('id'), str(e))
+
+_background_tasks = set()
+
+def run_in_background(coroutine) -> asyncio.Task:
+    """
+    Run ``coroutine`` after the response is sent, keeping a reference so the
+    task is not garbage collected and can be drained on shutdown.
+    """
+    task = asyncio.create_task(coroutine)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+async def drain_background_tasks(timeout: Optional[float] = None) -> None:
+    """
+    Wait for background work such as pending AI replies to finish.
+    """
+    if _background_tasks:
+        await asyncio.wait(list(_background_tasks), timeout=timeout)
+
+@app.post("/api/tickets/{ticket_id}/replies", response_model=ReplyCreateResponse, openapi_extra=body_openapi(ReplyCreate))
 async def create_reply(
     ticket_id: int,
-    data: Dict[str, Any],
+    # Before the auth dependencies, so a malformed body is rejected first
+    data: ReplyCreate = Depends(json_body(ReplyCreate)),
     supabase_client: SupabaseClient = Depends(get_supabase_client),
     user: Dict[str, Any] = Depends(get_current_user)
 ):
+    """
+    Create a reply and return it at once. Replies from customers are then
+    answered by the AI in the background, without a separate call to the
+    ``process`` endpoint.
+    """
     try:
-        content = data.get('content')
-        is_public = data.get('is_public', True)
-        
-        if not content:
-            raise HTTPException(status_code=400, detail="Content is required")
+        # The reply is written with the service-role key, so the checks RLS
+        # would make on the customer's own insert are made here
+        role = user['user_metadata']['role']
+        context = ticket_contexts.get(ticket_id)
+        if context is not None:
+            ticket = context.ticket
+        else:
+            ticket_result = await aexecute(supabase_client.table('tickets').select('id, user_id').eq('id', ticket_id).limit(1))
+            ticket = ticket_result.data[0] if ticket_result.data else None
+        if not ticket:
+            raise HTTPException(status_code=404, detail="Ticket not found")
+        if role == 'user':
+            if str(ticket.get('user_id')) != str(user['id']):
+                raise HTTPException(status_code=403, detail="You can only reply to your own tickets")
+            if not data.is_public:
+                raise HTTPException(status_code=403, detail="Customers cannot post internal notes")
 
         # Create the reply
-        reply_result = supabase_client.table('replies').insert({
+        reply_result = await aexecute(supabase_client.table('replies').insert({
             'ticket_id': ticket_id,
-            'content': content,
+            'content': data.content,
             'user_id': user['id'],
-            'is_public': is_public,
+            'is_public': data.is_public,
             'is_ai_generated': False
-        }).execute()
+        }))
 
-        if not hasattr(reply_result, 'data'):
+        if not reply_result.data:
             raise HTTPException(status_code=400, detail="Failed to create reply")
 
-        return {"reply": reply_result.data[0]}
+        reply = reply_result.data[0]
+        ticket_contexts.add_reply(ticket_id, reply)
+
+        ai_pending = role == 'user'
+        if ai_pending:
+            run_in_background(process_new_reply(ticket_id, reply, supabase_client))
+
+        profile = user.get('profile') or {}
+        return ORJSONResponse({
+            "reply": {
+                **reply,
+                'user_profile': {
+                    'email': profile.get('email', user.get('email')),
+                    'full_name': profile.get('full_name'),
+                    'avatar_url': profile.get('avatar_url'),
+                    'role': user['user_metadata']['role']
+                }
+            },
+            "ai_pending": ai_pending
+        })
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error('Error in create_reply: %s', str(e))
         raise HTTPException(status_code=400, detail=str(e))
 
-@app.post("/api/knowledge-base/generate-embeddings", response_model=Dict[str, Any])
+@app.post("/api/knowledge-base/generate-embeddings", response_model=EmbeddingsResponse,
+          openapi_extra=body_openapi(GenerateEmbeddingsRequest),
+          dependencies=[Depends(json_body(GenerateEmbeddingsRequest)),
+                        Depends(admit(PRIORITY_BACKFILL, get_optional_user_cached))])
 async def generate_embeddings(
-    request: Dict[str, Any],
+    request: GenerateEmbeddingsRequest = Depends(json_body(GenerateEmbeddingsRequest)),
     supabase_client: SupabaseClient = Depends(get_supabase_client)
 ):
     try:
-        # Get article_id from request body
-        article_id = request.get('article_id')
-        
         # Get articles to process
+        article_id = request.article_id
         if article_id:
             # Get single article
-            articles_query = supabase_client.table('knowledge_base_articles').select('id, title, content').eq('id', article_id)
+            articles_query = supabase_client.table('knowledge_base_articles').select('*').eq('id', article_id)
         else:
             # Get all articles without embeddings
-            articles_query = supabase_client.table('knowledge_base_articles').select('id, title, content').eq('has_embedding', False)
+            articles_query = supabase_client.table('knowledge_base_articles').select('*').eq('has_embedding', False)
         
         articles_response = articles_query.execute()
         articles = articles_response.data if hasattr(articles_response, 'data') else []
         
         if not articles:
-            return {"message": "No articles found to process", "updated_count": 0}
-
-        # Initialize OpenAI embeddings
-        embeddings = OpenAIEmbeddings(model="text-embedding-3-large")
-        updated_count = 0
+            return ORJSONResponse({"message": "No articles found to process", "updated_count": 0})
 
-        # Process each article
+        # Embed every passage of every article in batched calls
+        await index_articles(articles)
         for article in articles:
-            try:
-                # Combine title and content for embedding
-                text_to_embed = f"Title: {article['title']}\nContent: {article['content']}"
-                embedding_vector = await embeddings.aembed_query(text_to_embed.strip())
-
-                # Store in Pinecone
-                index.upsert(
-                    vectors=[{
-                        'id': f"article_{article['id']}",
-                        'values': embedding_vector,
-                        'metadata': {
-                            'title': article['title'],
-                            'content': article['content'],
-                            'article_id': article['id'],
-                            'type': 'article'
-                        }
-                    }]
-                )
+            lexical_index.add(article)
+            article_cache.put(article)
 
-                # Update has_embedding flag in Supabase
-                update_result = supabase_client.table('knowledge_base_articles').update({
-                    'has_embedding': True
-                }).eq('id', article['id']).execute()
+        # Update has_embedding flag in Supabase
+        update_result = supabase_client.table('knowledge_base_articles').update({
+            'has_embedding': True
+        }).in_('id', [article['id'] for article in articles]).execute()
 
-                if not update_result.data:
-                    logger.error('Error updating has_embedding flag for article %s: No data returned', article['id'])
-                    continue
+        updated_count = len(update_result.data or [])
+        if updated_count < len(articles):
+            logger.error('has_embedding flag updated for %d of %d articles', updated_count, len(articles))
+        logger.info('Successfully updated embeddings for %d articles', updated_count)
 
-                updated_count += 1
-                logger.info('Successfully updated embedding for article %s', article['id'])
-
-            except Exception as e:
-                logger.error('Error processing article %s: %s', article['id'], str(e))
-                continue
-
-        return {
+        return ORJSONResponse({
             "message": f"Successfully updated {updated_count} articles with embeddings",
             "updated_count": updated_count
-        }
+        })
 
     except Exception as e:
         logger.error('Error generating embeddings: %s', str(e))
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/api/knowledge-base/search", response_model=Dict[str, Any])
+@app.get("/api/knowledge-base/suggest", response_model=Dict[str, Any])
+async def suggest_articles(
+    q: str = Query('', max_length=MAX_SUGGEST_QUERY_CHARS),
+    limit: int = 5,
+    supabase_client: SupabaseClient = Depends(get_supabase_client),
+    user: Dict[str, Any] = Depends(get_current_user_cached)
+):
+    """
+    Typeahead article suggestions (id, title, snippet) from the local index.
+    Use ``POST /api/knowledge-base/search`` for a full search on submit.
+    """
+    if not q.strip():
+        return {"suggestions": []}
+    return {"suggestions": suggest(q, supabase_client, max(1, min(limit, 10)))}
+
+@app.post("/api/knowledge-base/search", response_model=ArticleSearchResponse, openapi_extra=body_openapi(ArticleSearchRequest))
 async def search_similar_articles(
-    request: Dict[str, str],
+    request: ArticleSearchRequest = Depends(json_body(ArticleSearchRequest)),
     supabase_client: SupabaseClient = Depends(get_supabase_client),
     user: Dict[str, Any] = Depends(get_current_user)
 ):
     try:
-        query = request.get('query')
-        if not query:
-            raise HTTPException(status_code=400, detail="Query is required")
+        query = request.query
 
-        # Generate embedding for the query
-        embeddings = OpenAIEmbeddings(model="text-embedding-3-large")
-        query_embedding = await embeddings.aembed_query(query.strip())
+        # BM25 over the local index, fused with vector search unless the
+        # lexical index alone answers a short keyword query
+        ranked, mode, versions = await search_articles(query, supabase_client)
+        if not ranked:
+            return ORJSONResponse({"articles": [], "mode": mode})
 
-        # Search Pinecone for similar articles
-        search_response = index.query(
-            vector=query_embedding,
-            top_k=5,
-            include_metadata=True,
-            filter={
-                "type": "article"
-            }
-        )
-
-        # Get article IDs from search results
-        article_ids = [
-            match['metadata']['article_id'] 
-            for match in search_response['matches']
-            if 'article_id' in match['metadata']
-        ]
-
-        if not article_ids:
-            return {"articles": []}
+        # Full article rows come from the article cache, best match first
+        scores = dict(ranked)
+        articles = hydrate_articles(list(scores), supabase_client, versions)
 
-        # Fetch full article data from Supabase
-        articles_result = supabase_client.table('knowledge_base_articles').select('*').in_('id', article_ids).execute()
-        
-        if articles_result.error:
-            logger.error('Error fetching articles: %s', articles_result.error)
-            raise HTTPException(status_code=500, detail="Failed to fetch articles")
-
-        return {"articles": articles_result.data or []}
+        return ORJSONResponse({"articles": [{**article, 'score': round(scores.get(str(article['id']), 0.0), 4)} for article in articles],
+                               "mode": mode})
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error('Error in search_similar_articles: %s', str(e))
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/api/embeddings/backfill", response_model=Dict[str, Any])
+@app.post("/api/embeddings/backfill", response_model=Dict[str, Any],
+          dependencies=[Depends(admit(PRIORITY_BACKFILL, get_current_user_cached))])
 async def backfill_embeddings(
     supabase_client: SupabaseClient = Depends(get_supabase_client),
-    user: Dict[str, Any] = Depends(get_current_user)
+    user: Dict[str, Any] = Depends(get_current_user_cached)
 ):
     try:
         # Get user's role from profiles table
@@ -1299,45 +1365,29 @@ async def backfill_embeddings(
             raise HTTPException(status_code=403, detail="Only admins can perform embedding backfill")
 
         total_processed = 0
-        embeddings = OpenAIEmbeddings(model="text-embedding-3-large")
 
         # Process knowledge base articles
-        articles_result = supabase_client.table('knowledge_base_articles').select('id,title,content').execute()
-        if articles_result.data:
-            for article in articles_result.data:
-                try:
-                    # Generate embedding
-                    text_to_embed = f"Title: {article['title']}\nContent: {article['content']}"
-                    embedding_vector = await embeddings.aembed_query(text_to_embed.strip())
-
-                    # Store in Pinecone
-                    index.upsert(
-                        vectors=[{
-                            'id': f"article_{article['id']}",
-                            'values': embedding_vector,
-                            'metadata': {
-                                'title': article['title'],
-                                'content': article['content'],
-                                'article_id': article['id'],
-                                'type': 'article'
-                            }
-                        }]
-                    )
-
-                    # Update has_embedding flag in Supabase
-                    update_result = supabase_client.table('knowledge_base_articles').update({
-                        'has_embedding': True
-                    }).eq('id', article['id']).execute()
-
-                    if update_result.error:
-                        logger.error('Error updating has_embedding flag for article %s: %s', article['id'], update_result.error)
-                        continue
-
-                    total_processed += 1
-                    logger.info(f"Processed article {article['id']}")
-                except Exception as e:
-                    logger.error(f"Error processing article {article['id']}: {str(e)}")
-                    continue
+        articles_result = supabase_client.table('knowledge_base_articles').select('*').execute()
+        articles = articles_result.data or []
+        for start in range(0, len(articles), ARTICLE_BATCH_SIZE):
+            batch = articles[start:start + ARTICLE_BATCH_SIZE]
+            try:
+                # Embed and upsert the passages of the whole batch at once
+                await index_articles(batch)
+                for article in batch:
+                    lexical_index.add(article)
+                    article_cache.put(article)
+
+                # Update has_embedding flag in Supabase
+                update_result = supabase_client.table('knowledge_base_articles').update({
+                    'has_embedding': True
+                }).in_('id', [article['id'] for article in batch]).execute()
+
+                total_processed += len(update_result.data or [])
+                logger.info(f"Processed articles {start + 1}-{start + len(batch)} of {len(articles)}")
+            except Exception as e:
+                logger.error(f"Error processing articles {start + 1}-{start + len(batch)}: {str(e)}")
+                continue
 
         return {
             "message": f"Successfully processed {total_processed} items",
@@ -1362,7 +1412,7 @@ async def delete_article(
 
         # Delete from Pinecone first
         try:
-            index.delete(ids=[f"article_{article_id}"])
+            await get_vector_store().delete(article_vector_ids(article_id))
             logger.info(f"Successfully deleted embedding for article {article_id} from Pinecone")
         except Exception as e:
             logger.error(f"Error deleting embedding from Pinecone for article {article_id}: {str(e)}")
@@ -1372,6 +1422,9 @@ async def delete_article(
         try:
             delete_result = supabase_client.table('knowledge_base_articles').delete().eq('id', article_id).execute()
             
+            lexical_index.remove(article_id)
+            article_cache.invalidate(article_id)
+
             # Check if any rows were deleted
             if not delete_result.data:
                 raise HTTPException(status_code=404, detail="Article not found")
@@ -1392,6 +1445,39 @@ async def delete_article(
         logger.error(f"Error in delete_article: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/metrics")
+async def metrics():
+    """
+    Prometheus-style metrics for requests, dependencies, tokens and caches.
+    """
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/admin/usage", response_model=Dict[str, Any])
+async def get_usage(
+    hours: int = 24,
+    limit: int = 20,
+    supabase_client: SupabaseClient = Depends(get_supabase_client),
+    user: Dict[str, Any] = Depends(get_current_user)
+):
+    """
+    LLM token usage and estimated cost over the last ``hours`` hours, in total
+    and per route, user and model; includes usage not flushed yet.
+    """
+    if user['user_metadata']['role'] != 'admin':
+        raise HTTPException(status_code=403, detail="Only admins can view usage")
+    hours = max(1, min(hours, 24 * 90))
+    since = datetime.now(timezone.utc) - timedelta(hours=hours)
+    # Usage is stored per hour; include the hour ``since`` falls in
+    first_period = since.replace(minute=0, second=0, microsecond=0).isoformat()
+    try:
+        rows = await fetch_usage(supabase_client, first_period)
+    except Exception as e:
+        logger.error('Error reading usage: %s', str(e))
+        raise HTTPException(status_code=500, detail=str(e))
+
+    rows += [row for row in usage_tracker.pending_rows() if row['period_start'] >= first_period]
+    return {"since": since.isoformat(), "hours": hours, **summarize(rows, limit)}
+
 @app.get("/favicon.ico")
 async def favicon():
     """
@@ -1425,8 +1511,11 @@ async def get_conversation_context(ticket_id: int, current_message: str, supabas
         logger.error(f"Error getting conversation context: {str(e)}")
         return None
 
+@traced("llm.generate_enhanced_response")
 async def generate_enhanced_response(context: Dict, current_message: str, user_role: str):
     try:
+        from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
+
         # Format all context pieces
         system_content = """You are a helpful customer service AI assistant. Your goal is to provide clear, concise to customer inquiries.
         
@@ -1477,16 +1566,8 @@ async def generate_enhanced_response(context: Dict, current_message: str, user_r
             logger.info(f"Content: {msg.content}")
         logger.info("=" * 50)
 
-        chat = ChatOpenAI(
-            temperature=0.7,
-            model_name="gpt-4o-mini",
-            max_tokens=500
-        )
-
-        prompt = ChatPromptTemplate.from_messages(messages)
-        chain = prompt | chat | StrOutputParser()
-        
-        response = await chain.ainvoke({})
+        # Acknowledgements and short questions get shorter, cheaper completions
+        response = await model_router.complete(classify_reply(current_message), messages)
         
         # Log the LLM's response
         logger.info("LLM Response:")
@@ -1499,30 +1580,24 @@ async def generate_enhanced_response(context: Dict, current_message: str, user_r
         logger.error('Error generating enhanced response: %s', str(e))
         return None
 
-@app.post("/api/tickets", response_model=Dict[str, Any])
+@app.post("/api/tickets", response_model=TicketCreateResponse, openapi_extra=body_openapi(TicketCreate),
+          dependencies=[Depends(json_body(TicketCreate)), Depends(admit(PRIORITY_CUSTOMER, get_current_user_cached))])
 async def create_ticket(
-    data: Dict[str, Any],
+    data: TicketCreate = Depends(json_body(TicketCreate)),
     supabase_client: SupabaseClient = Depends(get_supabase_client),
-    user: Dict[str, Any] = Depends(get_current_user)
+    user: Dict[str, Any] = Depends(get_current_user_cached)
 ):
     try:
-        # Validate required fields
-        required_fields = ['subject', 'description', 'priority', 'ticket_type', 'topic']
-        for field in required_fields:
-            if field not in data:
-                raise ValueError(f'Missing required field: {field}')
-
-        # Find an available agent with matching specialty
-        agents_result = supabase_client.table('profiles').select('id, email, full_name, specialty').eq('role', 'agent').eq('specialty', data['topic']).execute()
-        agent = agents_result.data[0] if agents_result.data else None
+        # Route to an agent with matching specialty, spreading load across them
+        agent = await agent_directory.pick(supabase_client, data.topic)
 
         # Create the ticket
         ticket_data = {
-            'subject': data['subject'],
-            'description': data['description'],
-            'priority': data['priority'],
-            'ticket_type': data['ticket_type'],
-            'topic': data['topic'],
+            'subject': data.subject,
+            'description': data.description,
+            'priority': data.priority,
+            'ticket_type': data.ticket_type,
+            'topic': data.topic,
             'user_id': user['id'],
             'status': 'open',
             'group_name': 'Support',
@@ -1533,6 +1608,7 @@ async def create_ticket(
         ticket_result = supabase_client.table('tickets').insert(ticket_data).execute()
         if not ticket_result.data:
             raise ValueError('Failed to create ticket')
+        agent_directory.ticket_changed({}, ticket_result.data[0])
 
         # Get the created ticket with related data
         created_ticket_result = supabase_client.table('tickets').select('''
@@ -1549,7 +1625,7 @@ async def create_ticket(
         # Create initial reply with ticket description
         reply_data = {
             'ticket_id': ticket['id'],
-            'content': data['description'],
+            'content': data.description,
             'user_id': user['id'],
             'is_public': True
         }
@@ -1559,31 +1635,27 @@ async def create_ticket(
             logger.error('Error creating initial reply')
 
         # Get conversation context for AI response
-        conversation_context = await get_conversation_context(ticket['id'], data['description'], supabase_client)
+        conversation_context = await get_conversation_context(ticket['id'], data.description, supabase_client)
 
         # Generate AI response
         ai_response = None
+        ai_reply_data = None
         if conversation_context:
             try:
                 ai_response = await generate_enhanced_response(
                     conversation_context,
-                    data['description'],
+                    data.description,
                     'user'  # Initial ticket is always from a user
                 )
 
-                if ai_response:
-                    # Get the assigned agent's ID from the ticket
-                    assigned_agent_id = ticket.get('assigned_to')
-                    if not assigned_agent_id:
-                        logger.error('No assigned agent found for ticket %s', ticket['id'])
-                        return {
-                            'message': 'Reply created successfully',
-                            'reply': {
-                                **reply_data,
-                                'user_avatar': reply_data.get('user_profile', {}).get('avatar_url'),
-                            }
-                        }
+                # Get the assigned agent's ID from the ticket
+                assigned_agent_id = ticket.get('assigned_to')
+                if ai_response and not assigned_agent_id:
+                    # The ticket is still returned, without an AI reply
+                    logger.error('No assigned agent found for ticket %s', ticket['id'])
+                    ai_response = None
 
+                if ai_response:
                     # Generate AI reply from the assigned agent
                     ai_reply_data = {
                         'ticket_id': ticket['id'],
@@ -1596,31 +1668,38 @@ async def create_ticket(
                     # Insert AI reply
                     ai_reply_result = supabase_client.table('replies').insert(ai_reply_data).execute()
 
-                    if ai_reply_result.error:
-                        logger.error('Error creating AI reply: %s', ai_reply_result.error)
+                    if not ai_reply_result.data:
+                        logger.error('Error creating AI reply')
                     else:
                         logger.info('AI reply created successfully')
                         ai_reply_data = ai_reply_result.data[0]
             except Exception as e:
                 logger.error('Error generating AI response: %s', str(e))
 
+        # Seed the context cache so the customer's first follow-up skips the reads
+        if conversation_context:
+            seeded_replies = list((reply_result.data or [])[:1])
+            if ai_reply_data and ai_reply_data.get('id'):
+                seeded_replies.append(ai_reply_data)
+            ticket_contexts.put(ticket['id'], TicketContext(ticket, seeded_replies, conversation_context['relevant_articles']))
+
         # Notify about ticket update
         try:
             await notify_ticket_created(supabase_client, ticket, user)
         except Exception as e:
             logger.error('Error creating notification: %s', str(e))
 
-        return {
+        return ORJSONResponse({
             'ticket': {
                 **ticket,
                 'isNewTicket': True
             },
             'ai_response': ai_response
-        }
+        })
 
     except Exception as error:
         logger.error('Error in create_ticket: %s', str(error))
-        return JSONResponse(
+        return ORJSONResponse(
             content={
                 'error': str(error),
                 'details': getattr(error, 'details', None)
@@ -0,0 +1,255 @@
+"""
+In-process Prometheus-style metrics.
+
+A tiny registry of counters, gauges and histograms rendered in the Prometheus
+text exposition format by the ``/metrics`` endpoint. Everything lives in this
+process; no agent or client library is required.
+"""
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+import bisect
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class _Metric:
+    type_name = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    type_name = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in items]
+
+
+class Gauge(_Metric):
+    type_name = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in items]
+
+
+class Histogram(_Metric):
+    type_name = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [bucket counts..., +Inf count], sum
+        self._values: Dict[LabelValues, Tuple[List[int], float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[position] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+        lines = []
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', repr(bound)))} {cumulative}")
+            cumulative += counts[-1]
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', '+Inf'))} {cumulative}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+http_requests_total = REGISTRY.register(Counter(
+    'http_requests_total', 'HTTP requests by route and status code.', ('method', 'route', 'status')))
+http_request_duration_seconds = REGISTRY.register(Histogram(
+    'http_request_duration_seconds', 'HTTP request latency by route.', ('method', 'route')))
+http_requests_in_flight = REGISTRY.register(Gauge(
+    'http_requests_in_flight', 'HTTP requests currently being served.'))
+dependency_call_duration_seconds = REGISTRY.register(Histogram(
+    'dependency_call_duration_seconds', 'Latency of calls to external dependencies.', ('dependency', 'operation', 'target')))
+dependency_call_errors_total = REGISTRY.register(Counter(
+    'dependency_call_errors_total', 'Failed calls to external dependencies.', ('dependency', 'operation', 'target')))
+dependency_calls_in_flight = REGISTRY.register(Gauge(
+    'dependency_calls_in_flight', 'Calls to external dependencies currently outstanding.', ('dependency',)))
+llm_tokens_total = REGISTRY.register(Counter(
+    'llm_tokens_total', 'OpenAI tokens consumed by model and token type.', ('model', 'type')))
+cache_requests_total = REGISTRY.register(Counter(
+    'cache_requests_total', 'Cache lookups by cache name and result.', ('cache', 'result')))
+
+
+@contextmanager
+def track_dependency(dependency: str, operation: str, target: str = '') -> Iterator[None]:
+    """
+    Time one call to an external dependency, e.g.
+    ``with track_dependency('supabase', 'select', 'tickets'): ...``
+    """
+    dependency_calls_in_flight.inc(dependency=dependency)
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        dependency_call_errors_total.inc(dependency=dependency, operation=operation, target=target)
+        raise
+    finally:
+        dependency_calls_in_flight.dec(dependency=dependency)
+        dependency_call_duration_seconds.observe(
+            time.perf_counter() - start, dependency=dependency, operation=operation, target=target)
+
+
+def record_tokens(model: str, prompt_tokens: int = 0, completion_tokens: int = 0) -> None:
+    if prompt_tokens:
+        llm_tokens_total.inc(prompt_tokens, model=model, type='prompt')
+    if completion_tokens:
+        llm_tokens_total.inc(completion_tokens, model=model, type='completion')
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    cache_requests_total.inc(cache=cache, result='hit' if hit else 'miss')
+
+
+def _route_label(scope) -> str:
+    route = scope.get('route')
+    path = getattr(route, 'path', None)
+    return path or 'unmatched'
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording request counts, latency and concurrency per
+    route template (``/api/tickets/{ticket_id}``, not the concrete path).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+            await send(message)
+
+        http_requests_in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_requests_in_flight.dec()
+            route = _route_label(scope)
+            method = scope.get('method', '')
+            http_request_duration_seconds.observe(time.perf_counter() - start, method=method, route=route)
+            http_requests_total.inc(method=method, route=route, status=str(status_code))
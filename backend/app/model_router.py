@@ -0,0 +1,133 @@
+"""
+Per-task model selection for LLM calls.
+
+Every task has a route: the model, temperature and ``max_tokens`` it runs
+with. AutoCRM's ACTION lines are generated deterministically (temperature 0).
+Customer replies are classified first, with no extra LLM call:
+
+- An acknowledgement ("thanks, that worked") gets a short answer.
+- A short, single-sentence question goes to the ``simple_reply`` route, which
+  can use a cheaper or faster model.
+- Everything else gets a full support answer.
+
+The defaults are in ``DEFAULT_ROUTES``. ``MODEL_ROUTES`` (JSON) overrides any
+field of any route, e.g.
+``{"customer_reply": {"model": "gpt-4o"}, "simple_reply": {"max_tokens": 150}}``.
+
+Every routed call logs its route, model, latency, tokens and estimated cost,
+and feeds ``llm_route_duration_seconds`` and ``llm_cost_usd_total``.
+"""
+from typing import Any, Dict, List, Optional
+import json
+import logging
+import os
+import re
+import time
+
+from . import llm
+from .metrics import REGISTRY, Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+TASK_AUTOCRM_ACTIONS = 'autocrm_actions'
+TASK_CUSTOMER_REPLY = 'customer_reply'
+TASK_SIMPLE_REPLY = 'simple_reply'
+TASK_ACKNOWLEDGEMENT = 'acknowledgement'
+TASK_CONVERSATION_SUMMARY = 'conversation_summary'
+
+SIMPLE_REPLY_MAX_WORDS = int(os.getenv('SIMPLE_REPLY_MAX_WORDS', '20'))
+ACKNOWLEDGEMENT_MAX_WORDS = 8
+
+llm_route_duration_seconds = REGISTRY.register(Histogram(
+    'llm_route_duration_seconds', 'Latency of routed LLM calls.', ('route', 'model')))
+llm_cost_usd_total = REGISTRY.register(Counter(
+    'llm_cost_usd_total', 'Estimated LLM cost in USD.', ('route', 'model')))
+
+
+class ModelRoute:
+    def __init__(self, model: str, temperature: float, max_tokens: Optional[int]):
+        self.model = model
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+
+    def __repr__(self) -> str:
+        return f"ModelRoute(model={self.model!r}, temperature={self.temperature}, max_tokens={self.max_tokens})"
+
+
+DEFAULT_ROUTES: Dict[str, Dict[str, Any]] = {
+    TASK_AUTOCRM_ACTIONS: {'model': llm.DEFAULT_CHAT_MODEL, 'temperature': 0, 'max_tokens': 512},
+    TASK_CUSTOMER_REPLY: {'model': llm.DEFAULT_CHAT_MODEL, 'temperature': 0.7, 'max_tokens': 500},
+    TASK_SIMPLE_REPLY: {'model': llm.DEFAULT_CHAT_MODEL, 'temperature': 0.5, 'max_tokens': 200},
+    TASK_ACKNOWLEDGEMENT: {'model': llm.DEFAULT_CHAT_MODEL, 'temperature': 0.3, 'max_tokens': 60},
+    TASK_CONVERSATION_SUMMARY: {'model': os.getenv('AUTOCRM_SUMMARY_MODEL', llm.DEFAULT_CHAT_MODEL),
+                                'temperature': 0, 'max_tokens': 250},
+}
+
+_ACKNOWLEDGEMENT_PHRASE = (
+    r"(ok(ay)?|thanks?|thank you|thx|ty|great|perfect|awesome|cool|got it|sounds good|all good|"
+    r"no worries|will do|much appreciated|that (worked|works|helped|fixed it))"
+    r"(\s+(so much|very much|a lot|for (the|your) help))?\b")
+# One or more acknowledgement phrases and nothing else: anything after them
+# but punctuation, emoji and whitespace makes the message substantive
+_ACKNOWLEDGEMENT_RE = re.compile(rf"[\W_]*({_ACKNOWLEDGEMENT_PHRASE}[\W_]*)+", re.IGNORECASE)
+# Anything that keeps the conversation open is not a plain acknowledgement
+_FOLLOW_UP_RE = re.compile(r"\?|\b(but|still|not|n't|however|issue|problem|error|again)\b", re.IGNORECASE)
+_SENTENCE_END_RE = re.compile(r"[.!?]+\s+\S")
+
+
+def classify_reply(message: str) -> str:
+    """
+    Route for a customer message: ``acknowledgement``, ``simple_reply`` or
+    ``customer_reply``.
+    """
+    text = (message or '').strip()
+    words = len(text.split())
+    if words <= ACKNOWLEDGEMENT_MAX_WORDS and _ACKNOWLEDGEMENT_RE.fullmatch(text) and not _FOLLOW_UP_RE.search(text):
+        route = TASK_ACKNOWLEDGEMENT
+    elif words <= SIMPLE_REPLY_MAX_WORDS and not _SENTENCE_END_RE.search(text):
+        route = TASK_SIMPLE_REPLY
+    else:
+        route = TASK_CUSTOMER_REPLY
+    logger.debug("Classified reply as %s (%d words): %r", route, words, text[:80])
+    return route
+
+
+class ModelRouter:
+    def __init__(self, overrides: Optional[Dict[str, Dict[str, Any]]] = None):
+        self.routes: Dict[str, ModelRoute] = {}
+        for task, settings in DEFAULT_ROUTES.items():
+            self.routes[task] = ModelRoute(**{**settings, **(overrides or {}).get(task, {})})
+
+    def route(self, task: str) -> ModelRoute:
+        return self.routes[task]
+
+    async def complete(
+        self,
+        task: str,
+        messages: List[Any],
+        tags: Optional[List[str]] = None,
+        metadata: Optional[Dict[str, Any]] = None
+    ) -> str:
+        """
+        Run ``messages`` through the task's route and return the text.
+        """
+        route = self.routes[task]
+        started = time.perf_counter()
+        text, usage = await llm.chat_with_usage(
+            messages,
+            model=route.model,
+            temperature=route.temperature,
+            max_tokens=route.max_tokens,
+            tags=tags,
+            metadata=metadata
+        )
+        elapsed = time.perf_counter() - started
+        cost = llm.estimate_cost(route.model, usage['prompt_tokens'], usage['completion_tokens'])
+        llm_route_duration_seconds.observe(elapsed, route=task, model=route.model)
+        llm_cost_usd_total.inc(cost, route=task, model=route.model)
+        logger.info("LLM route %s model=%s latency=%.0fms prompt_tokens=%d completion_tokens=%d cost=$%.6f",
+                    task, route.model, elapsed * 1000, usage['prompt_tokens'], usage['completion_tokens'], cost)
+        return text
+
+
+model_router = ModelRouter(json.loads(os.getenv('MODEL_ROUTES', '{}')))
@@ -0,0 +1,94 @@
+"""
+Concurrent execution of the ACTION lines in one AutoCRM reply.
+
+Each action is given a footprint: the tickets it reads and the tickets it
+writes. ``UPDATE`` writes the tickets in its spec (every ticket for
+``unassigned`` or an unparseable spec), ``SEARCH`` reads every ticket,
+``CREATE`` writes a new ticket that any read or ``unassigned`` update could
+see, and ``INFO`` touches no tickets. An action waits for every earlier action
+whose footprint conflicts with its own (a write overlapping a read or a
+write); everything else runs concurrently, at most
+``AUTOCRM_MAX_PARALLEL_ACTIONS`` at a time. Results keep the order of the
+actions.
+"""
+from typing import Awaitable, Callable, List, Optional, Tuple
+import asyncio
+import logging
+import os
+
+from .utils.ticket_specs import TICKET_SPEC_RE, TicketIdSet, TicketSpecError, parse_ticket_spec
+
+logger = logging.getLogger(__name__)
+
+AUTOCRM_MAX_PARALLEL_ACTIONS = int(os.getenv('AUTOCRM_MAX_PARALLEL_ACTIONS', '4'))
+
+# ``None`` stands for "every ticket"
+Tickets = Optional[TicketIdSet]
+NO_TICKETS = TicketIdSet()
+
+
+class Footprint:
+    def __init__(self, reads: Tickets = NO_TICKETS, writes: Tickets = NO_TICKETS):
+        self.reads = reads
+        self.writes = writes
+
+    @staticmethod
+    def _overlap(left: Tickets, right: Tickets) -> bool:
+        if left is None:
+            return right is None or bool(right)
+        if right is None:
+            return bool(left)
+        return left.overlaps(right)
+
+    def conflicts(self, other: 'Footprint') -> bool:
+        return (self._overlap(self.writes, other.reads) or self._overlap(self.writes, other.writes)
+                or self._overlap(self.reads, other.writes))
+
+
+def action_footprint(action: str, details: str) -> Footprint:
+    if action == 'SEARCH':
+        return Footprint(reads=None)
+    if action == 'UPDATE':
+        spec_match = TICKET_SPEC_RE.search(details)
+        if not spec_match or spec_match.group(1).lower() == 'unassigned':
+            return Footprint(writes=None)
+        try:
+            ticket_ids, invalid = parse_ticket_spec(spec_match.group(1))
+        except TicketSpecError:
+            # Rejected without touching anything
+            return Footprint()
+        if invalid or not ticket_ids:
+            return Footprint(writes=None)
+        return Footprint(reads=ticket_ids, writes=ticket_ids)
+    if action == 'CREATE':
+        return Footprint(writes=None)
+    return Footprint()
+
+
+async def run_actions(
+    actions: List[Tuple[str, str]],
+    execute: Callable[[str, str], Awaitable[str]],
+    max_parallel: int = AUTOCRM_MAX_PARALLEL_ACTIONS
+) -> List[str]:
+    """
+    Run ``execute(action, details)`` for every action, concurrently where
+    their footprints allow, and return the results in action order.
+    """
+    footprints = [action_footprint(action, details) for action, details in actions]
+    semaphore = asyncio.Semaphore(max_parallel)
+    tasks: List['asyncio.Task[str]'] = []
+
+    async def run(index: int, dependencies: List['asyncio.Task[str]']) -> str:
+        if dependencies:
+            await asyncio.wait(dependencies)
+        async with semaphore:
+            return await execute(*actions[index])
+
+    independent = 0
+    for index, footprint in enumerate(footprints):
+        dependencies = [tasks[earlier] for earlier in range(index) if footprints[earlier].conflicts(footprint)]
+        independent += not dependencies
+        tasks.append(asyncio.ensure_future(run(index, dependencies)))
+
+    logger.info("Running %d AutoCRM actions, %d without dependencies", len(tasks), independent)
+    return list(await asyncio.gather(*tasks))
@@ -0,0 +1,74 @@
+"""
+Re-ranking of retrieved passages before they go into a prompt.
+
+Retrieval over-fetches ``RETRIEVAL_OVERFETCH`` passages from Pinecone. Each is
+re-scored as a blend of its vector similarity and its term overlap with the
+query (``RETRIEVAL_LEXICAL_WEIGHT`` sets the overlap's share), passages below
+``RETRIEVAL_MIN_SCORE`` are dropped, and up to ``RETRIEVAL_TOP_K`` of the rest
+are picked by maximal marginal relevance (MMR) so that overlapping chunks of
+one article do not crowd out everything else. ``RETRIEVAL_MMR_LAMBDA`` trades
+relevance (1.0) against diversity.
+"""
+from typing import Any, Dict, List, Set
+import logging
+import math
+import os
+
+from .search import tokenize
+
+logger = logging.getLogger(__name__)
+
+RETRIEVAL_OVERFETCH = int(os.getenv('RETRIEVAL_OVERFETCH', '20'))
+RETRIEVAL_TOP_K = int(os.getenv('RETRIEVAL_TOP_K', '5'))
+RETRIEVAL_MIN_SCORE = float(os.getenv('RETRIEVAL_MIN_SCORE', '0.3'))
+RETRIEVAL_LEXICAL_WEIGHT = float(os.getenv('RETRIEVAL_LEXICAL_WEIGHT', '0.3'))
+RETRIEVAL_MMR_LAMBDA = float(os.getenv('RETRIEVAL_MMR_LAMBDA', '0.7'))
+
+
+def lexical_overlap(query_terms: Set[str], passage_terms: Set[str]) -> float:
+    """
+    Cosine similarity of the two term sets, in [0, 1].
+    """
+    if not query_terms or not passage_terms:
+        return 0.0
+    return len(query_terms & passage_terms) / math.sqrt(len(query_terms) * len(passage_terms))
+
+
+def jaccard(left: Set[str], right: Set[str]) -> float:
+    if not left or not right:
+        return 0.0
+    return len(left & right) / len(left | right)
+
+
+def rerank(
+    query_text: str,
+    passages: List[Dict[str, Any]],
+    top_k: int = RETRIEVAL_TOP_K,
+    min_score: float = RETRIEVAL_MIN_SCORE,
+    lexical_weight: float = RETRIEVAL_LEXICAL_WEIGHT,
+    mmr_lambda: float = RETRIEVAL_MMR_LAMBDA
+) -> List[Dict[str, Any]]:
+    """
+    Re-score, filter and diversify ``passages`` (as returned by
+    ``retrieve_passages``). Each kept passage gets a ``relevance`` score; the
+    result may be empty when nothing clears ``min_score``.
+    """
+    query_terms = set(tokenize(query_text))
+    candidates = []
+    for passage in passages:
+        terms = set(tokenize(f"{passage.get('title', '')} {passage.get('passage', '')}"))
+        relevance = (1 - lexical_weight) * passage['score'] + lexical_weight * lexical_overlap(query_terms, terms)
+        if relevance >= min_score:
+            candidates.append(({**passage, 'relevance': round(relevance, 4)}, terms))
+
+    selected: List[Any] = []
+    while candidates and len(selected) < top_k:
+        best_index = max(
+            range(len(candidates)),
+            key=lambda i: mmr_lambda * candidates[i][0]['relevance'] - (1 - mmr_lambda) * max(
+                (jaccard(candidates[i][1], chosen_terms) for _, chosen_terms in selected), default=0.0)
+        )
+        selected.append(candidates.pop(best_index))
+
+    logger.info("Re-ranked %d passages to %d (min score %.2f)", len(passages), len(selected), min_score)
+    return [passage for passage, _ in selected]
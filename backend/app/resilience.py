@@ -0,0 +1,259 @@
+"""
+Retries, deadlines, hedging and circuit breakers for external calls.
+
+Every Supabase, Pinecone and OpenAI call runs through ``call`` (or
+``call_sync`` for the blocking Supabase client):
+
+- Transient failures are retried with jittered exponential backoff. These are
+  connection errors, timeouts, and 408/429/5xx responses. There are at most
+  ``RETRY_MAX_ATTEMPTS`` attempts, all within the dependency's deadline
+  (``SUPABASE_DEADLINE_SECONDS``, ``PINECONE_DEADLINE_SECONDS``,
+  ``OPENAI_DEADLINE_SECONDS``). An async attempt still running at the
+  deadline is cancelled. Only idempotent operations are retried.
+- ``hedged`` sends a second copy of a read that has not answered after a
+  delay and takes whichever answers first. Pinecone queries are hedged after
+  ``PINECONE_HEDGE_AFTER_SECONDS``.
+- Each dependency has a circuit breaker. It opens after
+  ``CIRCUIT_FAILURE_THRESHOLD`` consecutive transient failures. While open,
+  calls fail fast with ``CircuitOpen`` for ``CIRCUIT_RESET_SECONDS``. After
+  that a single trial call is let through, and it closes the breaker again if
+  it succeeds. Errors the dependency answers with, such as a 400 or a
+  constraint violation, count as the dependency being up.
+
+Breaker states are reported by ``/health``.
+"""
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+import asyncio
+import logging
+import math
+import os
+import threading
+import time
+
+import httpx
+from tenacity import AsyncRetrying, Retrying, retry_if_exception, stop_after_attempt, stop_after_delay, wait_random_exponential
+
+from .metrics import REGISTRY, Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+RETRY_MAX_ATTEMPTS = int(os.getenv('RETRY_MAX_ATTEMPTS', '3'))
+RETRY_BASE_SECONDS = float(os.getenv('RETRY_BASE_SECONDS', '0.2'))
+RETRY_MAX_BACKOFF_SECONDS = float(os.getenv('RETRY_MAX_BACKOFF_SECONDS', '2'))
+DEADLINES = {
+    'supabase': float(os.getenv('SUPABASE_DEADLINE_SECONDS', '10')),
+    'pinecone': float(os.getenv('PINECONE_DEADLINE_SECONDS', '5')),
+    'openai': float(os.getenv('OPENAI_DEADLINE_SECONDS', '60')),
+}
+PINECONE_HEDGE_AFTER_SECONDS = float(os.getenv('PINECONE_HEDGE_AFTER_SECONDS', '0.3'))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', '5'))
+CIRCUIT_RESET_SECONDS = float(os.getenv('CIRCUIT_RESET_SECONDS', '30'))
+
+_RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+# OpenAI SDK errors that carry no status code
+_TRANSIENT_ERROR_NAMES = {'APIConnectionError', 'APITimeoutError'}
+
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half_open'
+_STATE_VALUES = {STATE_CLOSED: 0, STATE_HALF_OPEN: 1, STATE_OPEN: 2}
+
+circuit_breaker_state = REGISTRY.register(Gauge(
+    'circuit_breaker_state', 'Circuit breaker state per dependency (0 closed, 1 half open, 2 open).', ('dependency',)))
+external_call_retries_total = REGISTRY.register(Counter(
+    'external_call_retries_total', 'External calls retried after a transient failure.', ('dependency',)))
+external_call_hedges_total = REGISTRY.register(Counter(
+    'external_call_hedges_total', 'Hedged second requests sent for slow reads.', ('dependency', 'winner')))
+circuit_breaker_rejections_total = REGISTRY.register(Counter(
+    'circuit_breaker_rejections_total', 'Calls failed fast by an open circuit breaker.', ('dependency',)))
+
+
+class CircuitOpen(Exception):
+    def __init__(self, dependency: str, retry_after: float):
+        self.retry_after = max(1, math.ceil(retry_after))
+        super().__init__(f"{dependency} is unavailable, retry after {self.retry_after}s")
+        self.dependency = dependency
+
+
+def is_transient(error: BaseException) -> bool:
+    """
+    Whether ``error`` is worth retrying: the dependency could not be reached,
+    timed out or answered 408/429/5xx.
+    """
+    if isinstance(error, CircuitOpen):
+        return False
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError, ConnectionError, httpx.TransportError)):
+        return True
+    status = getattr(error, 'status_code', None) or getattr(getattr(error, 'response', None), 'status_code', None)
+    if isinstance(status, int):
+        return status in _RETRYABLE_STATUS
+    return type(error).__name__ in _TRANSIENT_ERROR_NAMES
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker. Thread-safe, as Supabase calls are
+    made from worker threads as well as the event loop.
+    """
+
+    def __init__(self, dependency: str, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+                 reset_seconds: float = CIRCUIT_RESET_SECONDS):
+        self.dependency = dependency
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = STATE_CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.last_error: Optional[str] = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+        circuit_breaker_state.set(_STATE_VALUES[self.state], dependency=dependency)
+
+    def _set_state(self, state: str) -> None:
+        if state != self.state:
+            logger.warning("Circuit breaker for %s is now %s", self.dependency, state)
+        self.state = state
+        circuit_breaker_state.set(_STATE_VALUES[state], dependency=self.dependency)
+
+    def before_call(self) -> None:
+        """
+        Raise ``CircuitOpen`` unless a call may go through now.
+        """
+        with self._lock:
+            if self.state == STATE_OPEN:
+                remaining = self.reset_seconds - (time.monotonic() - self.opened_at)
+                if remaining > 0:
+                    circuit_breaker_rejections_total.inc(dependency=self.dependency)
+                    raise CircuitOpen(self.dependency, remaining)
+                self._set_state(STATE_HALF_OPEN)
+            if self.state == STATE_HALF_OPEN:
+                if self._trial_running:
+                    circuit_breaker_rejections_total.inc(dependency=self.dependency)
+                    raise CircuitOpen(self.dependency, self.reset_seconds)
+                self._trial_running = True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self._trial_running = False
+            self._set_state(STATE_CLOSED)
+
+    def record_failure(self, error: BaseException) -> None:
+        if not isinstance(error, Exception):
+            # Cancelled: says nothing about the dependency
+            with self._lock:
+                self._trial_running = False
+            return
+        if not is_transient(error):
+            self.record_success()
+            return
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            self.last_error = f"{type(error).__name__}: {error}"
+            if self.state == STATE_HALF_OPEN or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self._set_state(STATE_OPEN)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            status: Dict[str, Any] = {'state': self.state, 'consecutive_failures': self.failures}
+            if self.state == STATE_OPEN:
+                status['retry_after_seconds'] = round(max(0.0, self.reset_seconds - (time.monotonic() - self.opened_at)), 1)
+            if self.last_error:
+                status['last_error'] = self.last_error
+            return status
+
+
+breakers: Dict[str, CircuitBreaker] = {dependency: CircuitBreaker(dependency) for dependency in DEADLINES}
+
+
+def circuit_states() -> Dict[str, Dict[str, Any]]:
+    return {dependency: breaker.snapshot() for dependency, breaker in breakers.items()}
+
+
+def _retry_policy(dependency: str, retry: bool, deadline: float) -> Dict[str, Any]:
+    def count_retry(retry_state) -> None:
+        external_call_retries_total.inc(dependency=dependency)
+        logger.warning("Retrying %s call after %s (attempt %d)", dependency,
+                       retry_state.outcome.exception(), retry_state.attempt_number)
+
+    return {
+        'stop': stop_after_attempt(RETRY_MAX_ATTEMPTS if retry else 1) | stop_after_delay(deadline),
+        'wait': wait_random_exponential(multiplier=RETRY_BASE_SECONDS, max=RETRY_MAX_BACKOFF_SECONDS),
+        'retry': retry_if_exception(is_transient),
+        'before_sleep': count_retry,
+        'reraise': True,
+    }
+
+
+async def call(dependency: str, fn: Callable[[], Awaitable[T]], retry: bool = True,
+               deadline: Optional[float] = None) -> T:
+    """
+    Await ``fn()`` behind the dependency's circuit breaker, retrying transient
+    failures unless ``retry`` is off. ``fn`` is called again for every attempt.
+    """
+    breaker = breakers[dependency]
+    deadline = DEADLINES[dependency] if deadline is None else deadline
+    expires = time.monotonic() + deadline
+    async for attempt in AsyncRetrying(**_retry_policy(dependency, retry, deadline)):
+        with attempt:
+            breaker.before_call()
+            try:
+                result = await asyncio.wait_for(fn(), max(expires - time.monotonic(), 0.001))
+            except BaseException as e:
+                breaker.record_failure(e)
+                raise
+            breaker.record_success()
+            return result
+
+
+def call_sync(dependency: str, fn: Callable[[], T], retry: bool = True, deadline: Optional[float] = None) -> T:
+    """
+    Blocking counterpart of ``call``. A running attempt cannot be cut off, so
+    the deadline only bounds when further attempts are made.
+    """
+    breaker = breakers[dependency]
+    deadline = DEADLINES[dependency] if deadline is None else deadline
+    for attempt in Retrying(**_retry_policy(dependency, retry, deadline)):
+        with attempt:
+            breaker.before_call()
+            try:
+                result = fn()
+            except BaseException as e:
+                breaker.record_failure(e)
+                raise
+            breaker.record_success()
+            return result
+
+
+async def hedged(dependency: str, fn: Callable[[], Awaitable[T]], hedge_after: float) -> T:
+    """
+    Await ``fn()``; if it has not finished after ``hedge_after`` seconds, start
+    a second ``fn()`` and return the first successful result, cancelling the
+    other. Only for reads, as both requests may reach the dependency.
+    """
+    tasks = [asyncio.ensure_future(fn())]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+        if done:
+            return tasks[0].result()
+
+        tasks.append(asyncio.ensure_future(fn()))
+        pending = set(tasks)
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    external_call_hedges_total.inc(dependency=dependency,
+                                                   winner='hedge' if task is tasks[1] else 'original')
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
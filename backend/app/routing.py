@@ -0,0 +1,129 @@
+"""
+In-memory agent routing for new and unassigned tickets.
+
+``AgentDirectory`` indexes agents by specialty together with the number of
+open tickets each one holds. It is loaded with two queries (agents, and the
+open tickets per agent, counted in SQL by ``open_ticket_counts``) in a worker
+thread, kept current as this API assigns and updates tickets, and fully
+reloaded every ``AGENT_DIRECTORY_TTL_SECONDS`` to pick up new agents and
+changes made elsewhere.
+
+``AGENT_ROUTING_STRATEGY`` selects ``least_loaded`` (default; ties broken
+round-robin) or ``round_robin``.
+"""
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+import asyncio
+import logging
+import os
+import threading
+import time
+
+from .metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+OPEN_STATUSES = ('open', 'pending')
+AGENT_DIRECTORY_TTL_SECONDS = float(os.getenv('AGENT_DIRECTORY_TTL_SECONDS', '300'))
+AGENT_ROUTING_STRATEGY = os.getenv('AGENT_ROUTING_STRATEGY', 'least_loaded')
+
+
+class AgentDirectory:
+    def __init__(self, ttl_seconds: float = AGENT_DIRECTORY_TTL_SECONDS, strategy: str = AGENT_ROUTING_STRATEGY):
+        if strategy not in ('least_loaded', 'round_robin'):
+            raise ValueError(f"Unknown agent routing strategy: {strategy}")
+        self.ttl_seconds = ttl_seconds
+        self.strategy = strategy
+        self.agents: Dict[str, Dict[str, Any]] = {}
+        self.by_specialty: Dict[str, List[str]] = {}
+        self.open_tickets: Dict[str, int] = defaultdict(int)
+        self._cursors: Dict[Optional[str], int] = defaultdict(int)
+        self._loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._reload = asyncio.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at <= self.ttl_seconds
+
+    def load(self, supabase_client) -> None:
+        """
+        Reload agents and open-ticket counts from Supabase.
+        """
+        agents_result = supabase_client.table('profiles').select('id, email, full_name, specialty').eq('role', 'agent').execute()
+        counts_result = supabase_client.rpc('open_ticket_counts', {'statuses': list(OPEN_STATUSES)}).execute()
+
+        agents = {agent['id']: agent for agent in agents_result.data or []}
+        by_specialty: Dict[str, List[str]] = defaultdict(list)
+        for agent in agents.values():
+            if agent.get('specialty'):
+                by_specialty[agent['specialty']].append(agent['id'])
+        open_tickets: Dict[str, int] = defaultdict(int)
+        for row in counts_result.data or []:
+            if row['agent_id'] in agents:
+                open_tickets[row['agent_id']] = row['open_tickets']
+
+        with self._lock:
+            self.agents = agents
+            self.by_specialty = dict(by_specialty)
+            self.open_tickets = open_tickets
+            self._loaded_at = time.monotonic()
+        logger.info("Agent directory loaded: %d agents, %d specialties", len(agents), len(by_specialty))
+
+    async def ensure_loaded(self, supabase_client) -> None:
+        """
+        Reload in a worker thread when the directory is cold or expired;
+        concurrent callers wait for the same reload.
+        """
+        hit = self.loaded
+        record_cache('agent_directory', hit)
+        if hit:
+            return
+        async with self._reload:
+            if not self.loaded:
+                await asyncio.to_thread(self.load, supabase_client)
+
+    async def pick(self, supabase_client, specialty: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Choose an agent for a new open ticket.
+
+        With a ``specialty`` only agents with that specialty are considered
+        and ``None`` is returned when there are none; without one, any agent.
+        The ticket counts against the agent once it is written: report it
+        with ``ticket_changed``.
+        """
+        await self.ensure_loaded(supabase_client)
+        with self._lock:
+            candidates = self.by_specialty.get(specialty, []) if specialty else list(self.agents)
+            if not candidates:
+                return None
+
+            cursor = self._cursors[specialty]
+            self._cursors[specialty] = cursor + 1
+            # Rotate so ties (and round-robin) start after the last pick
+            rotated = candidates[cursor % len(candidates):] + candidates[:cursor % len(candidates)]
+            if self.strategy == 'least_loaded':
+                agent_id = min(rotated, key=lambda candidate: self.open_tickets[candidate])
+            else:
+                agent_id = rotated[0]
+            return self.agents[agent_id]
+
+    def ticket_changed(self, previous: Dict[str, Any], current: Dict[str, Any]) -> None:
+        """
+        Move open-ticket counts after a ticket's assignee or status changed;
+        ``previous`` is empty for a new ticket.
+        """
+        was_open = previous.get('status') in OPEN_STATUSES and previous.get('assigned_to')
+        is_open = current.get('status') in OPEN_STATUSES and current.get('assigned_to')
+        with self._lock:
+            if was_open and previous['assigned_to'] in self.agents:
+                self.open_tickets[previous['assigned_to']] = max(0, self.open_tickets[previous['assigned_to']] - 1)
+            if is_open and current['assigned_to'] in self.agents:
+                self.open_tickets[current['assigned_to']] += 1
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._loaded_at = None
+
+
+agent_directory = AgentDirectory()
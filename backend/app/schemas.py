@@ -0,0 +1,172 @@
+"""
+Request and response models of the JSON endpoints.
+
+Request bodies are validated in strict mode, so ``"1"`` is not coerced to
+``1`` nor ``1`` to ``True``, and unknown fields are rejected. ``json_body``
+parses and validates the raw body in one pydantic-core pass
+(``model_validate_json``). List it first in a route's ``dependencies`` to
+reject a malformed request with a 422 before auth, admission or any database
+call.
+
+Response models type the fields clients rely on and document the rest of a
+row as additional columns. Handlers that return Supabase rows render them
+with ``ORJSONResponse`` themselves. The rows are already JSON, and validating
+them against the model would cost more than rendering them. FastAPI then uses
+the ``response_model`` only for the OpenAPI schema. Small responses such as
+``AutoCRMResponse`` are returned as dicts and checked against their model.
+"""
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Literal, Optional, Type, TypeVar, Union
+import logging
+
+from fastapi import Request
+from fastapi.exceptions import RequestValidationError
+from pydantic import BaseModel, ConfigDict, Field, ValidationError
+
+logger = logging.getLogger(__name__)
+
+MAX_QUERY_CHARS = 4000
+# Typeahead queries travel in the URL
+MAX_SUGGEST_QUERY_CHARS = 500
+MAX_CONTENT_CHARS = 20000
+
+Model = TypeVar('Model', bound=BaseModel)
+
+
+class RequestModel(BaseModel):
+    model_config = ConfigDict(strict=True, extra='forbid', frozen=True)
+
+
+class ResponseModel(BaseModel):
+    model_config = ConfigDict(extra='allow')
+
+
+# Requests
+
+class AutoCRMRequest(RequestModel):
+    query: str = Field(min_length=1, max_length=MAX_QUERY_CHARS)
+    userId: str = Field(min_length=1, max_length=64)
+    # HTML of the message, with mentions as ``<span data-email=...>``
+    displayContent: Optional[str] = Field(None, max_length=MAX_CONTENT_CHARS)
+
+
+class TicketCreate(RequestModel):
+    subject: str = Field(min_length=1, max_length=500)
+    description: str = Field(min_length=1, max_length=MAX_CONTENT_CHARS)
+    priority: Literal['low', 'normal', 'high', 'urgent']
+    ticket_type: Literal['question', 'incident', 'problem', 'task']
+    # Free text: topic names have changed over time
+    topic: str = Field(min_length=1, max_length=200)
+
+
+class ReplyCreate(RequestModel):
+    content: str = Field(min_length=1, max_length=MAX_CONTENT_CHARS)
+    is_public: bool = True
+
+
+class GenerateEmbeddingsRequest(RequestModel):
+    # All articles without embeddings when omitted
+    article_id: Optional[str] = Field(None, min_length=1, max_length=64)
+
+
+class ArticleSearchRequest(RequestModel):
+    query: str = Field(min_length=1, max_length=MAX_QUERY_CHARS)
+
+
+# Responses
+
+class AutoCRMResponse(ResponseModel):
+    reply: str
+
+
+class UserProfile(ResponseModel):
+    email: Optional[str] = None
+    full_name: Optional[str] = None
+    avatar_url: Optional[str] = None
+    role: Optional[str] = None
+
+
+class Reply(ResponseModel):
+    id: Union[int, str]
+    ticket_id: int
+    content: str
+    user_id: Optional[str] = None
+    is_public: bool = True
+    is_ai_generated: bool = False
+    created_at: Optional[str] = None
+    user_profile: Optional[UserProfile] = None
+
+
+class ReplyCreateResponse(ResponseModel):
+    reply: Reply
+    ai_pending: bool
+
+
+class Ticket(ResponseModel):
+    id: int
+    subject: str
+    description: Optional[str] = None
+    status: str
+    priority: str
+    ticket_type: Optional[str] = None
+    topic: Optional[str] = None
+    user_id: Optional[str] = None
+    assigned_to: Optional[str] = None
+    created_at: Optional[str] = None
+    isNewTicket: bool = False
+
+
+class TicketCreateResponse(ResponseModel):
+    ticket: Ticket
+    # Text of the first AI reply
+    ai_response: Optional[str] = None
+
+
+class EmbeddingsResponse(ResponseModel):
+    message: str
+    updated_count: int
+
+
+class ArticleMatch(ResponseModel):
+    id: Union[int, str]
+    title: str
+    content: Optional[str] = None
+    score: float
+
+
+class ArticleSearchResponse(ResponseModel):
+    articles: List[ArticleMatch]
+    mode: str
+
+
+def _body_errors(error: ValidationError) -> List[Dict[str, Any]]:
+    # Same shape as FastAPI's own body errors; ``ctx`` may hold exceptions
+    return [{'type': e['type'], 'loc': ('body', *e['loc']), 'msg': e['msg'], 'input': e.get('input')}
+            for e in error.errors(include_url=False, include_context=False)]
+
+
+@lru_cache(maxsize=None)
+def json_body(model: Type[Model]) -> Callable[[Request], Any]:
+    """
+    Dependency parsing the request body into ``model``. Memoized per model,
+    so a route listing it in ``dependencies`` and as a parameter validates
+    the body once.
+    """
+    async def parse(request: Request) -> Model:
+        body = await request.body()
+        try:
+            return model.model_validate_json(body or b'{}')
+        except ValidationError as e:
+            logger.info("Rejected %s body for %s: %d errors", model.__name__, request.url.path, e.error_count())
+            raise RequestValidationError(_body_errors(e), body=body)
+
+    parse.__name__ = f"json_body_{model.__name__}"
+    return parse
+
+
+def body_openapi(model: Type[BaseModel]) -> Dict[str, Any]:
+    """
+    ``openapi_extra`` documenting a body read with ``json_body``, which
+    FastAPI cannot see.
+    """
+    return {'requestBody': {'required': True, 'content': {'application/json': {'schema': model.model_json_schema()}}}}
@@ -0,0 +1,324 @@
+"""
+Hybrid lexical + vector search over knowledge base articles.
+
+``LexicalIndex`` is an in-memory BM25 inverted index over article titles and
+content. Short keyword queries that it answers with confidence (every term
+found in at least one article) skip the OpenAI embedding and the Pinecone
+query altogether; everything else runs both and fuses the normalized BM25
+score with the vector similarity.
+
+The index is loaded with one query on first use, updated as articles are
+embedded or deleted through this API, and reloaded every
+``LEXICAL_INDEX_TTL_SECONDS`` to pick up edits made directly in Supabase.
+
+``suggest`` serves typeahead from the same index: the last, partially typed
+word is expanded to every indexed term it prefixes, and results (id, title
+and snippet only) are kept in an LRU cache until the index changes.
+"""
+from collections import Counter, OrderedDict, defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+import bisect
+import logging
+import math
+import os
+import re
+import threading
+import time
+
+from . import llm
+from .articles import article_cache
+from .clients import get_vector_store
+from .metrics import REGISTRY, Counter as MetricCounter, record_cache
+
+logger = logging.getLogger(__name__)
+
+LEXICAL_INDEX_TTL_SECONDS = float(os.getenv('LEXICAL_INDEX_TTL_SECONDS', '300'))
+# Queries of at most this many terms may be answered from the lexical index alone
+LEXICAL_ONLY_MAX_TERMS = 3
+# Weight of the vector score when fusing; the BM25 score gets the rest
+HYBRID_VECTOR_WEIGHT = 0.6
+TITLE_WEIGHT = 2
+SNIPPET_CHARS = 150
+# Indexed terms a partially typed word may expand to
+MAX_PREFIX_EXPANSIONS = 20
+SUGGEST_CACHE_SIZE = 1024
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+STOPWORDS = frozenset((
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'can', 'do', 'does', 'for', 'from', 'how', 'i',
+    'if', 'in', 'is', 'it', 'my', 'of', 'on', 'or', 'the', 'to', 'what', 'when', 'where', 'why',
+    'with', 'you', 'your',
+))
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+search_requests_total = REGISTRY.register(MetricCounter(
+    'search_requests_total', 'Knowledge base searches by the path that answered them.', ('mode',)))
+
+
+def _stem(token: str) -> str:
+    # Fold plurals so "refund" matches "refunds"
+    if len(token) > 4 and token.endswith('ies'):
+        return token[:-3] + 'y'
+    if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    return [_stem(token) for token in _TOKEN_RE.findall((text or '').lower()) if token not in STOPWORDS]
+
+
+class LexicalIndex:
+    def __init__(self, ttl_seconds: float = LEXICAL_INDEX_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self.titles: Dict[str, str] = {}
+        self.snippets: Dict[str, str] = {}
+        self.version = 0
+        self._vocabulary: Optional[List[str]] = None
+        self._lengths: Dict[str, int] = {}
+        self._doc_terms: Dict[str, List[str]] = {}
+        self._postings: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self._total_length = 0
+        self._loaded_at: Optional[float] = None
+        self._lock = threading.RLock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at <= self.ttl_seconds
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+    def load(self, supabase_client) -> None:
+        """
+        Rebuild the index from every article in Supabase, filling the
+        article cache on the way.
+        """
+        result = supabase_client.table('knowledge_base_articles').select('*').execute()
+        article_cache.put_many(result.data or [])
+        with self._lock:
+            self.titles.clear()
+            self.snippets.clear()
+            self._lengths.clear()
+            self._doc_terms.clear()
+            self._postings.clear()
+            self._total_length = 0
+            for article in result.data or []:
+                self.add(article)
+            self._loaded_at = time.monotonic()
+        logger.info("Lexical index loaded with %d articles", len(self))
+
+    def ensure_loaded(self, supabase_client) -> None:
+        hit = self.loaded
+        record_cache('lexical_index', hit)
+        if not hit:
+            self.load(supabase_client)
+
+    def add(self, article: Dict[str, Any]) -> None:
+        """
+        Index an article, replacing any previous version of it.
+        """
+        article_id = str(article['id'])
+        terms = tokenize(article.get('title', '')) * TITLE_WEIGHT + tokenize(article.get('content', ''))
+        with self._lock:
+            self.remove(article_id)
+            frequencies = Counter(terms)
+            for term, count in frequencies.items():
+                self._postings[term][article_id] = count
+            self._doc_terms[article_id] = list(frequencies)
+            self.titles[article_id] = article.get('title', '')
+            self.snippets[article_id] = ' '.join((article.get('content') or '').split())[:SNIPPET_CHARS]
+            self._lengths[article_id] = len(terms)
+            self._total_length += len(terms)
+            self._changed()
+
+    def remove(self, article_id: str) -> None:
+        article_id = str(article_id)
+        with self._lock:
+            if article_id not in self._lengths:
+                return
+            for term in self._doc_terms.pop(article_id, []):
+                postings = self._postings.get(term, {})
+                postings.pop(article_id, None)
+                if not postings:
+                    self._postings.pop(term, None)
+            self._total_length -= self._lengths.pop(article_id)
+            self.titles.pop(article_id, None)
+            self.snippets.pop(article_id, None)
+            self._changed()
+
+    def _changed(self) -> None:
+        self.version += 1
+        self._vocabulary = None
+
+    def expand_prefix(self, prefix: str) -> List[str]:
+        """
+        Indexed terms starting with ``prefix``, shortest first.
+        """
+        with self._lock:
+            if self._vocabulary is None:
+                self._vocabulary = sorted(self._postings)
+            vocabulary = self._vocabulary
+        start = bisect.bisect_left(vocabulary, prefix)
+        matches = []
+        for term in vocabulary[start:]:
+            if not term.startswith(prefix):
+                break
+            matches.append(term)
+        return sorted(matches, key=len)[:MAX_PREFIX_EXPANSIONS]
+
+    def search(self, query: str, limit: int = 10) -> Tuple[List[Tuple[str, float]], bool]:
+        """
+        Return ``(article_id, bm25_score)`` pairs, best first, and whether
+        some article contains every query term.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        return self.search_terms([[term] for term in terms], limit)
+
+    def search_terms(self, groups: List[List[str]], limit: int = 10) -> Tuple[List[Tuple[str, float]], bool]:
+        """
+        BM25 over term groups: each group contributes the score of its best
+        matching term, so a group can hold the expansions of one prefix.
+        """
+        if not groups:
+            return [], False
+
+        with self._lock:
+            doc_count = len(self._lengths)
+            if not doc_count:
+                return [], False
+            average_length = self._total_length / doc_count
+            scores: Dict[str, float] = defaultdict(float)
+            matched_groups: Dict[str, int] = defaultdict(int)
+            for group in groups:
+                best: Dict[str, float] = {}
+                for term in group:
+                    postings = self._postings.get(term)
+                    if not postings:
+                        continue
+                    idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                    for article_id, frequency in postings.items():
+                        length_norm = BM25_K1 * (1 - BM25_B + BM25_B * self._lengths[article_id] / average_length)
+                        score = idf * frequency * (BM25_K1 + 1) / (frequency + length_norm)
+                        best[article_id] = max(best.get(article_id, 0.0), score)
+                for article_id, score in best.items():
+                    scores[article_id] += score
+                    matched_groups[article_id] += 1
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+        full_match = any(count == len(groups) for count in matched_groups.values())
+        return ranked, full_match
+
+
+lexical_index = LexicalIndex()
+
+
+class LRUCache:
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries: 'OrderedDict[Any, Any]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Any) -> Optional[Any]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: Any, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+_suggest_cache = LRUCache(SUGGEST_CACHE_SIZE)
+
+
+def suggest(query: str, supabase_client, limit: int = 5) -> List[Dict[str, Any]]:
+    """
+    Typeahead suggestions for ``query`` from the local index only: no
+    embedding, no Pinecone and no article fetch. The last word is treated as
+    a prefix unless the query ends with a space.
+    """
+    lexical_index.ensure_loaded(supabase_client)
+    normalized = ' '.join(query.lower().split()) + (' ' if query[-1:].isspace() else '')
+    key = (normalized, limit, lexical_index.version)
+    cached = _suggest_cache.get(key)
+    record_cache('suggest', cached is not None)
+    if cached is not None:
+        return cached
+
+    words = _TOKEN_RE.findall(normalized)
+    prefix = words.pop() if words and not normalized.endswith(' ') else None
+    groups = [[term] for term in dict.fromkeys(tokenize(' '.join(words)))]
+    if prefix:
+        expansions = lexical_index.expand_prefix(prefix)
+        if expansions:
+            groups.append(expansions)
+        elif prefix not in STOPWORDS:
+            groups.append([_stem(prefix)])
+
+    ranked, _ = lexical_index.search_terms(groups, limit)
+    suggestions = [{
+        'id': article_id,
+        'title': lexical_index.titles.get(article_id, ''),
+        'snippet': lexical_index.snippets.get(article_id, ''),
+    } for article_id, _ in ranked]
+    _suggest_cache.put(key, suggestions)
+    return suggestions
+
+
+def _normalize(scores: List[Tuple[str, float]]) -> Dict[str, float]:
+    if not scores:
+        return {}
+    top = max(score for _, score in scores) or 1.0
+    return {article_id: score / top for article_id, score in scores}
+
+
+async def search_articles(query: str, supabase_client, limit: int = 5) -> Tuple[List[Tuple[str, float]], str, Dict[str, str]]:
+    """
+    Rank articles for ``query``. Returns ``(article_id, score)`` pairs with
+    scores in [0, 1], best first, the mode that produced them (``lexical``
+    or ``hybrid``) and the ``updated_at`` the vector index holds per article.
+    """
+    lexical_index.ensure_loaded(supabase_client)
+    lexical, full_match = lexical_index.search(query, limit * 2)
+
+    if full_match and len(tokenize(query)) <= LEXICAL_ONLY_MAX_TERMS:
+        search_requests_total.inc(mode='lexical')
+        normalized = _normalize(lexical)
+        return [(article_id, normalized[article_id]) for article_id, _ in lexical[:limit]], 'lexical', {}
+
+    query_embedding = await llm.embed_query(query)
+    response = await get_vector_store().query(
+        vector=query_embedding,
+        top_k=limit * 4,
+        include_metadata=True,
+        filter={"type": "article"}
+    )
+    vector: Dict[str, float] = {}
+    versions: Dict[str, str] = {}
+    for match in response['matches']:
+        if 'article_id' in match['metadata']:
+            article_id = str(match['metadata']['article_id'])
+            vector[article_id] = max(vector.get(article_id, 0.0), float(match['score']))
+            if match['metadata'].get('updated_at'):
+                versions[article_id] = match['metadata']['updated_at']
+
+    lexical_scores = _normalize(lexical)
+    fused = {
+        article_id: HYBRID_VECTOR_WEIGHT * vector.get(article_id, 0.0)
+        + (1 - HYBRID_VECTOR_WEIGHT) * lexical_scores.get(article_id, 0.0)
+        for article_id in set(vector) | set(lexical_scores)
+    }
+    search_requests_total.inc(mode='hybrid')
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)[:limit], 'hybrid', versions
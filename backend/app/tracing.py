@@ -0,0 +1,279 @@
+"""
+Request-scoped tracing compatible with OpenTelemetry.
+
+Spans use W3C trace context identifiers, nest through a context variable and
+are exported as OTLP/JSON (one ``resourceSpans`` document per trace) to the
+console or a local file. ``TracingMiddleware`` opens the root span for each
+request, honours an incoming ``traceparent`` header and returns the trace ID
+in ``X-Trace-Id``.
+
+Configuration:
+    TRACE_EXPORTER  ``none`` (default), ``console`` or ``file``
+    TRACE_FILE      path for the file exporter (default ``traces.jsonl``)
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Any, Callable, Dict, Iterator, List, Optional
+import asyncio
+import json
+import logging
+import os
+import re
+import secrets
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = "autocrm-api"
+TRACE_HEADER = "X-Trace-Id"
+
+_TRACEPARENT_RE = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$')
+
+# OTLP status codes
+STATUS_UNSET = 0
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+
+class Span:
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str] = None, attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.status = STATUS_UNSET
+        self.status_message = ''
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+
+    @property
+    def duration_ms(self) -> float:
+        end_ns = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end_ns - self.start_ns) / 1e6
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def record_error(self, error: BaseException) -> None:
+        self.status = STATUS_ERROR
+        self.status_message = f"{type(error).__name__}: {error}"
+
+    def to_otlp(self) -> Dict[str, Any]:
+        span = {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': 1,
+            'startTimeUnixNano': str(self.start_ns),
+            'endTimeUnixNano': str(self.end_ns or time.time_ns()),
+            'attributes': [_otlp_attribute(key, value) for key, value in self.attributes.items()],
+            'status': {'code': self.status, 'message': self.status_message} if self.status_message else {'code': self.status},
+        }
+        if self.parent_id:
+            span['parentSpanId'] = self.parent_id
+        return span
+
+
+def _otlp_attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {'key': key, 'value': {'boolValue': value}}
+    if isinstance(value, int):
+        return {'key': key, 'value': {'intValue': str(value)}}
+    if isinstance(value, float):
+        return {'key': key, 'value': {'doubleValue': value}}
+    return {'key': key, 'value': {'stringValue': str(value)}}
+
+
+class _Trace:
+    """
+    Spans collected for one request; exported together when the root ends.
+    """
+
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+        self.spans: List[Span] = []
+        self.finished = False
+
+
+class ConsoleExporter:
+    def export(self, spans: List[Span]) -> None:
+        for span in spans:
+            logger.info("span trace=%s span=%s parent=%s name=%s duration_ms=%.1f status=%s attributes=%s",
+                        span.trace_id, span.span_id, span.parent_id or '-', span.name,
+                        span.duration_ms, span.status, span.attributes)
+
+
+class FileExporter:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans: List[Span]) -> None:
+        document = {
+            'resourceSpans': [{
+                'resource': {'attributes': [_otlp_attribute('service.name', SERVICE_NAME)]},
+                'scopeSpans': [{
+                    'scope': {'name': __name__},
+                    'spans': [span.to_otlp() for span in spans],
+                }],
+            }]
+        }
+        line = json.dumps(document)
+        with self._lock:
+            with open(self.path, 'a') as trace_file:
+                trace_file.write(line + '\n')
+
+
+def _exporter_from_env():
+    kind = os.getenv('TRACE_EXPORTER', 'none').lower()
+    if kind == 'console':
+        return ConsoleExporter()
+    if kind == 'file':
+        return FileExporter(os.getenv('TRACE_FILE', 'traces.jsonl'))
+    return None
+
+
+_exporter = _exporter_from_env()
+_current_span: ContextVar[Optional[Span]] = ContextVar('current_span', default=None)
+_current_trace: ContextVar[Optional[_Trace]] = ContextVar('current_trace', default=None)
+
+
+def set_exporter(exporter) -> None:
+    """
+    Replace the span exporter; ``None`` disables exporting.
+    """
+    global _exporter
+    _exporter = exporter
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def current_trace_id() -> Optional[str]:
+    span = _current_span.get()
+    return span.trace_id if span else None
+
+
+def _export(spans: List[Span]) -> None:
+    if _exporter is None or not spans:
+        return
+    try:
+        _exporter.export(spans)
+    except Exception as e:
+        logger.error("Failed to export spans: %s", str(e))
+
+
+@contextmanager
+def start_span(name: str, trace_id: Optional[str] = None, parent_id: Optional[str] = None, **attributes: Any) -> Iterator[Span]:
+    """
+    Open a span as a child of the current one, or a new root span when there
+    is no active trace (or an explicit ``trace_id`` is given).
+    """
+    parent = _current_span.get()
+    trace = _current_trace.get()
+    if trace_id is None and parent is not None:
+        trace_id = parent.trace_id
+        parent_id = parent.span_id
+    is_root = trace_id is None or trace is None or trace.trace_id != trace_id
+    if trace_id is None:
+        trace_id = secrets.token_hex(16)
+    if is_root:
+        trace = _Trace(trace_id)
+
+    span = Span(name, trace_id, parent_id, attributes)
+    span_token = _current_span.set(span)
+    trace_token = _current_trace.set(trace) if is_root else None
+    try:
+        yield span
+    except BaseException as e:
+        span.record_error(e)
+        raise
+    finally:
+        span.end_ns = time.time_ns()
+        _current_span.reset(span_token)
+        if trace_token is not None:
+            _current_trace.reset(trace_token)
+        if trace.finished:
+            # Background work that outlived its request is exported on its own
+            _export([span])
+        else:
+            trace.spans.append(span)
+            if is_root:
+                trace.finished = True
+                _export(trace.spans)
+
+
+def traced(name: Optional[str] = None) -> Callable:
+    """
+    Decorator running a sync or async function inside a span.
+    """
+    def decorator(func: Callable) -> Callable:
+        span_name = name or func.__qualname__
+
+        if asyncio.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with start_span(span_name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with start_span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[Dict[str, str]]:
+    if not header:
+        return None
+    match = _TRACEPARENT_RE.match(header.strip().lower())
+    if not match or match.group(1) == '0' * 32:
+        return None
+    return {'trace_id': match.group(1), 'parent_id': match.group(2)}
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware opening the root span of every HTTP request.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        headers = {key.decode('latin-1'): value.decode('latin-1') for key, value in scope.get('headers', [])}
+        incoming = parse_traceparent(headers.get('traceparent')) or {}
+
+        with start_span(f"{scope.get('method', '')} {scope.get('path', '')}",
+                        trace_id=incoming.get('trace_id'),
+                        parent_id=incoming.get('parent_id'),
+                        **{'http.method': scope.get('method', ''), 'http.target': scope.get('path', '')}) as span:
+
+            async def send_wrapper(message):
+                if message['type'] == 'http.response.start':
+                    span.set_attribute('http.status_code', message['status'])
+                    if message['status'] >= 500:
+                        span.status = STATUS_ERROR
+                    message.setdefault('headers', [])
+                    message['headers'] = list(message['headers']) + [
+                        (TRACE_HEADER.lower().encode('latin-1'), span.trace_id.encode('latin-1'))
+                    ]
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                route = getattr(scope.get('route'), 'path', None)
+                if route:
+                    span.name = f"{scope.get('method', '')} {route}"
+                    span.set_attribute('http.route', route)
@@ -0,0 +1,274 @@
+"""
+Token and cost accounting for OpenAI calls.
+
+Every chat completion and embedding batch is recorded with its model, prompt
+and completion tokens, and estimated cost. It is attributed to the route and
+user of the HTTP request it was made for. ``UsageMiddleware`` scopes each
+request, and the auth code names the user with ``set_usage_user``. Background
+work started by a request is still attributed to it.
+
+Usage is aggregated in memory per hour, route, user and model. Every
+``USAGE_FLUSH_SECONDS`` it is added to the ``usage`` table in one
+``record_usage`` call, which keeps a single row per hour and key. A batch
+being written still counts as pending until the call succeeds; a failed
+flush is kept for the next attempt, up to ``USAGE_MAX_PENDING_ROWS``
+aggregates. Each request's total is logged and observed in
+``llm_request_tokens``.
+
+``fetch_usage`` reads usage summed per route, user and model in SQL
+(``usage_by_key``), ``USAGE_PAGE_ROWS`` keys at a time.
+"""
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import logging
+import os
+import threading
+
+from .clients import aexecute
+from .metrics import REGISTRY, Histogram
+
+logger = logging.getLogger(__name__)
+
+USAGE_FLUSH_SECONDS = float(os.getenv('USAGE_FLUSH_SECONDS', '60'))
+USAGE_MAX_PENDING_ROWS = int(os.getenv('USAGE_MAX_PENDING_ROWS', '10000'))
+# At most PostgREST's default max_rows
+USAGE_PAGE_ROWS = int(os.getenv('USAGE_PAGE_ROWS', '1000'))
+USAGE_BUCKET_SECONDS = 3600
+BACKGROUND_ROUTE = 'background'
+
+llm_request_tokens = REGISTRY.register(Histogram(
+    'llm_request_tokens', 'LLM tokens used per HTTP request that called the LLM.', ('route',),
+    buckets=(100, 500, 1000, 2000, 5000, 10000, 20000, 50000)))
+
+# (period start, route, user id, model)
+UsageKey = Tuple[str, str, Optional[str], str]
+
+
+class UsageTotals:
+    __slots__ = ('calls', 'prompt_tokens', 'completion_tokens', 'cost_usd')
+
+    def __init__(self, calls: int = 0, prompt_tokens: int = 0, completion_tokens: int = 0, cost_usd: float = 0.0):
+        self.calls = calls
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.cost_usd = cost_usd
+
+    def add(self, other: 'UsageTotals') -> None:
+        self.calls += other.calls
+        self.prompt_tokens += other.prompt_tokens
+        self.completion_tokens += other.completion_tokens
+        self.cost_usd += other.cost_usd
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'calls': self.calls,
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens,
+            'total_tokens': self.prompt_tokens + self.completion_tokens,
+            'cost_usd': round(self.cost_usd, 6),
+        }
+
+
+class _RequestUsage:
+    """
+    Attribution and running total of one HTTP request.
+    """
+
+    def __init__(self, scope: Dict[str, Any]):
+        self.scope = scope
+        self.user_id: Optional[str] = None
+        self.totals = UsageTotals()
+
+    @property
+    def route(self) -> str:
+        # Filled in by the router once the request has been matched
+        return getattr(self.scope.get('route'), 'path', None) or 'unmatched'
+
+
+_current: ContextVar[Optional[_RequestUsage]] = ContextVar('usage_request', default=None)
+
+
+def set_usage_user(user_id: Any) -> None:
+    """
+    Attribute the current request's LLM usage to ``user_id``.
+    """
+    request = _current.get()
+    if request is not None and user_id:
+        request.user_id = str(user_id)
+
+
+def _period_start(moment: datetime) -> str:
+    timestamp = int(moment.timestamp()) // USAGE_BUCKET_SECONDS * USAGE_BUCKET_SECONDS
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat()
+
+
+class UsageTracker:
+    def __init__(self, max_pending: int = USAGE_MAX_PENDING_ROWS):
+        self.max_pending = max_pending
+        self._pending: Dict[UsageKey, UsageTotals] = {}
+        # The batch a flush is writing, until ``record_usage`` returns
+        self._in_flight: Dict[UsageKey, UsageTotals] = {}
+        self._lock = threading.Lock()
+
+    def record(self, model: str, prompt_tokens: int = 0, completion_tokens: int = 0, cost_usd: float = 0.0) -> None:
+        """
+        Add one OpenAI call to the current request and the pending aggregates.
+        """
+        request = _current.get()
+        call = UsageTotals(1, prompt_tokens, completion_tokens, cost_usd)
+        if request is not None:
+            request.totals.add(call)
+        key = (_period_start(datetime.now(timezone.utc)),
+               request.route if request else BACKGROUND_ROUTE,
+               request.user_id if request else None,
+               model)
+        with self._lock:
+            self._pending.setdefault(key, UsageTotals()).add(call)
+
+    @staticmethod
+    def _rows(batch: Dict[UsageKey, UsageTotals]) -> List[Dict[str, Any]]:
+        return [
+            {'period_start': period_start, 'route': route, 'user_id': user_id, 'model': model,
+             'calls': totals.calls, 'prompt_tokens': totals.prompt_tokens,
+             'completion_tokens': totals.completion_tokens, 'cost_usd': round(totals.cost_usd, 6)}
+            for (period_start, route, user_id, model), totals in batch.items()
+        ]
+
+    def pending_rows(self) -> List[Dict[str, Any]]:
+        """
+        Aggregates not flushed yet, including a batch being written, as
+        ``usage`` rows.
+        """
+        with self._lock:
+            merged: Dict[UsageKey, UsageTotals] = {}
+            for batch in (self._in_flight, self._pending):
+                for key, totals in batch.items():
+                    merged.setdefault(key, UsageTotals()).add(totals)
+            return self._rows(merged)
+
+    def _settle(self, batch: Dict[UsageKey, UsageTotals], written: bool) -> None:
+        """
+        Retire the in-flight batch, putting it back into the pending
+        aggregates unless it was written.
+        """
+        with self._lock:
+            self._in_flight = {}
+            if written:
+                return
+            for key, totals in batch.items():
+                if key not in self._pending and len(self._pending) >= self.max_pending:
+                    logger.error("Dropping usage for %s: too many unflushed aggregates", key)
+                    continue
+                self._pending.setdefault(key, UsageTotals()).add(totals)
+
+    async def flush(self, supabase_client) -> int:
+        """
+        Add the pending aggregates to the ``usage`` table in one call and
+        return the number of aggregates written.
+        """
+        with self._lock:
+            # One flush at a time; the next one picks up whatever is left
+            if self._in_flight or not self._pending:
+                return 0
+            batch, self._pending = self._pending, {}
+            self._in_flight = batch
+        rows = self._rows(batch)
+        written = False
+        try:
+            await aexecute(supabase_client.rpc('record_usage', {'batch': rows}))
+            written = True
+        except Exception as e:
+            logger.error("Error flushing %d usage rows: %s", len(rows), str(e))
+        finally:
+            # Also runs when the flush is cancelled, so the batch is not lost
+            self._settle(batch, written)
+        if not written:
+            return 0
+        logger.info("Flushed %d usage rows", len(rows))
+        return len(rows)
+
+    async def run(self, get_client, interval: float = USAGE_FLUSH_SECONDS) -> None:
+        """
+        Flush every ``interval`` seconds until cancelled, then flush once more.
+        """
+        try:
+            while True:
+                await asyncio.sleep(interval)
+                await self.flush(get_client())
+        finally:
+            try:
+                await self.flush(get_client())
+            except Exception as e:
+                logger.error("Error in final usage flush: %s", str(e))
+
+
+usage_tracker = UsageTracker()
+
+
+async def fetch_usage(supabase_client, since: str, page_rows: int = USAGE_PAGE_ROWS) -> List[Dict[str, Any]]:
+    """
+    Stored usage from the period starting at ``since``, one row per route,
+    user and model.
+    """
+    rows: List[Dict[str, Any]] = []
+    while True:
+        page = await aexecute(supabase_client.rpc('usage_by_key', {
+            'since': since, 'page_offset': len(rows), 'page_size': page_rows}))
+        rows.extend(page.data or [])
+        if len(page.data or []) < page_rows:
+            return rows
+
+
+def summarize(rows: List[Dict[str, Any]], limit: int = 20) -> Dict[str, Any]:
+    """
+    Totals plus per-route, per-user and per-model breakdowns of usage rows,
+    most expensive first, at most ``limit`` users.
+    """
+    totals = UsageTotals()
+    groups: Dict[str, Dict[Any, UsageTotals]] = {'route': {}, 'user_id': {}, 'model': {}}
+    for row in rows:
+        row_totals = UsageTotals(int(row.get('calls') or 0), int(row.get('prompt_tokens') or 0),
+                                 int(row.get('completion_tokens') or 0), float(row.get('cost_usd') or 0))
+        totals.add(row_totals)
+        for field, group in groups.items():
+            group.setdefault(row.get(field), UsageTotals()).add(row_totals)
+
+    def breakdown(field: str, top: Optional[int] = None) -> List[Dict[str, Any]]:
+        ordered = sorted(groups[field].items(), key=lambda item: item[1].cost_usd, reverse=True)
+        return [{field: key, **group_totals.as_dict()} for key, group_totals in ordered[:top]]
+
+    return {
+        'totals': totals.as_dict(),
+        'by_route': breakdown('route'),
+        'by_user': breakdown('user_id', limit),
+        'by_model': breakdown('model'),
+    }
+
+
+class UsageMiddleware:
+    """
+    ASGI middleware scoping LLM usage to each HTTP request.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        request = _RequestUsage(scope)
+        token = _current.set(request)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _current.reset(token)
+            if request.totals.calls:
+                llm_request_tokens.observe(request.totals.prompt_tokens + request.totals.completion_tokens,
+                                           route=request.route)
+                logger.info("LLM usage for %s %s (user %s): %d calls, %d prompt + %d completion tokens, $%.6f",
+                            scope.get('method', ''), request.route, request.user_id, request.totals.calls,
+                            request.totals.prompt_tokens, request.totals.completion_tokens, request.totals.cost_usd)
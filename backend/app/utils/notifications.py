@@ -1,6 +1,7 @@
 from typing import Dict, Any, List
 from supabase import Client
 from .formatting import format_ticket_numbers
+from ..tracing import traced
 from datetime import datetime
 import logging
 
@@ -53,6 +54,7 @@ async def create_notification(supabase: Client, payload: Dict[str, Any]) -> None
         print(f"Error creating notification: {str(e)}")
         raise e
 
+@traced("notifications.ticket_updated")
 async def notify_ticket_updated(supabase_client, ticket, updater, previous_ticket):
     try:
         # Get updater info
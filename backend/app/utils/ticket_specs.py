@@ -0,0 +1,134 @@
+"""
+Parsing of ticket ID specs such as ``43-47, 50`` from AutoCRM actions.
+
+Specs become a ``TicketIdSet`` of merged, inclusive intervals that is never
+expanded into a list: IDs are iterated lazily, and ``fetch_tickets`` turns
+ranges into ``gte``/``lte`` filters and single IDs into one ``in`` filter so
+only tickets that exist are read. A single range may span at most
+``MAX_TICKET_SPAN`` IDs, a whole spec at most ``MAX_TICKET_SPEC_IDS`` IDs in
+``MAX_TICKET_SPEC_SEGMENTS`` segments (both checked before any query), and an
+update may touch at most ``MAX_TICKETS_PER_UPDATE`` existing tickets.
+"""
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+import bisect
+import os
+import re
+
+MAX_TICKET_SPAN = int(os.getenv('MAX_TICKET_SPAN', '1000'))
+MAX_TICKET_SPEC_IDS = int(os.getenv('MAX_TICKET_SPEC_IDS', '2000'))
+# Each range costs a query
+MAX_TICKET_SPEC_SEGMENTS = int(os.getenv('MAX_TICKET_SPEC_SEGMENTS', '20'))
+MAX_TICKETS_PER_UPDATE = int(os.getenv('MAX_TICKETS_PER_UPDATE', '200'))
+
+# The ``ticket:`` field of an UPDATE action
+TICKET_SPEC_RE = re.compile(r'ticket:\s*([\d,\s\-]+|unassigned)(?=\s+\w+:|$)')
+_RANGE_RE = re.compile(r'^(\d+)\s*-\s*(\d+)$')
+
+
+class TicketSpecError(ValueError):
+    pass
+
+
+class TicketIdSet:
+    """
+    A set of ticket IDs stored as sorted, non-overlapping inclusive intervals.
+    """
+
+    def __init__(self, intervals: Iterable[Tuple[int, int]] = ()):
+        merged: List[Tuple[int, int]] = []
+        for start, end in sorted(intervals):
+            if merged and start <= merged[-1][1] + 1:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+            else:
+                merged.append((start, end))
+        self.intervals = merged
+        self._starts = [start for start, _ in merged]
+
+    def __iter__(self) -> Iterator[int]:
+        for start, end in self.intervals:
+            yield from range(start, end + 1)
+
+    def __len__(self) -> int:
+        return sum(end - start + 1 for start, end in self.intervals)
+
+    def __bool__(self) -> bool:
+        return bool(self.intervals)
+
+    def __contains__(self, ticket_id: Any) -> bool:
+        position = bisect.bisect_right(self._starts, int(ticket_id)) - 1
+        return position >= 0 and int(ticket_id) <= self.intervals[position][1]
+
+    def overlaps(self, other: 'TicketIdSet') -> bool:
+        mine, theirs = iter(self.intervals), iter(other.intervals)
+        left, right = next(mine, None), next(theirs, None)
+        while left and right:
+            if left[1] < right[0]:
+                left = next(mine, None)
+            elif right[1] < left[0]:
+                right = next(theirs, None)
+            else:
+                return True
+        return False
+
+    @property
+    def ranges(self) -> List[Tuple[int, int]]:
+        return [(start, end) for start, end in self.intervals if start != end]
+
+    @property
+    def singles(self) -> List[int]:
+        return [start for start, end in self.intervals if start == end]
+
+
+def parse_ticket_spec(spec: str, max_span: int = MAX_TICKET_SPAN, max_ids: int = MAX_TICKET_SPEC_IDS,
+                      max_segments: int = MAX_TICKET_SPEC_SEGMENTS) -> Tuple[TicketIdSet, List[str]]:
+    """
+    Parse a comma-separated list of IDs and ``start-end`` ranges. Returns the
+    ID set and the segments that could not be parsed; raises
+    ``TicketSpecError`` for a range wider than ``max_span``, more than
+    ``max_segments`` segments or more than ``max_ids`` IDs in all.
+    """
+    intervals: List[Tuple[int, int]] = []
+    invalid: List[str] = []
+    segments = [segment.strip() for segment in spec.split(',') if segment.strip()]
+    if len(segments) > max_segments:
+        raise TicketSpecError(f'Too many ticket ranges ({len(segments)}); at most {max_segments} can be given at once')
+    for segment in segments:
+        range_match = _RANGE_RE.match(segment)
+        if range_match:
+            start, end = sorted(map(int, range_match.groups()))
+            if end - start + 1 > max_span:
+                raise TicketSpecError(f'Ticket range {segment} is too large; a range may cover at most {max_span} tickets')
+            intervals.append((start, end))
+        elif segment.isdigit():
+            intervals.append((int(segment), int(segment)))
+        else:
+            invalid.append(segment)
+    ticket_ids = TicketIdSet(intervals)
+    if len(ticket_ids) > max_ids:
+        raise TicketSpecError(f'Ticket spec covers {len(ticket_ids)} tickets; at most {max_ids} can be given at once')
+    return ticket_ids, invalid
+
+
+def fetch_tickets(supabase_client, ticket_ids: TicketIdSet, limit: int = MAX_TICKETS_PER_UPDATE) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Read the existing tickets in ``ticket_ids``, ordered by ID, with one query
+    per range plus one for all single IDs. Each query also counts its matches,
+    so the total number of existing tickets is known up front while at most
+    ``limit + 1`` rows are read per query. Returns ``(tickets, total)``.
+    """
+    queries = [
+        supabase_client.table('tickets').select('*', count='exact').gte('id', start).lte('id', end)
+        for start, end in ticket_ids.ranges
+    ]
+    if ticket_ids.singles:
+        queries.append(supabase_client.table('tickets').select('*', count='exact').in_('id', ticket_ids.singles))
+
+    tickets: List[Dict[str, Any]] = []
+    total = 0
+    for query in queries:
+        result = query.order('id').limit(limit + 1).execute()
+        total += result.count if result.count is not None else len(result.data or [])
+        tickets.extend(result.data or [])
+        if total > limit:
+            break
+    return sorted(tickets, key=lambda ticket: ticket['id']), total
@@ -0,0 +1,156 @@
+"""
+Asyncio client for the Pinecone data plane.
+
+``VectorStore`` calls the index host's REST API (``/query``,
+``/vectors/upsert``, ``/vectors/delete``) over one pooled ``httpx.AsyncClient``
+instead of the synchronous SDK, so vector calls no longer block the event loop.
+At most ``PINECONE_MAX_CONCURRENCY`` calls are in flight per process.
+
+Calls are retried and guarded by the ``pinecone`` circuit breaker
+(``app/resilience.py``); queries are also hedged when they are slow.
+
+Identical queries that are already in flight are coalesced: a burst of the
+same search shares one round trip and every caller receives the same
+response, which callers must treat as read-only.
+
+The index host comes from ``PINECONE_HOST``; without it, it is looked up once
+through the control plane.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import json
+import logging
+import os
+
+import httpx
+
+from . import resilience
+from .instrumentation import external_call
+from .metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+PINECONE_CONTROL_PLANE_URL = os.getenv('PINECONE_CONTROL_PLANE_URL', 'https://api.pinecone.io')
+PINECONE_MAX_CONCURRENCY = int(os.getenv('PINECONE_MAX_CONCURRENCY', '16'))
+PINECONE_MAX_CONNECTIONS = int(os.getenv('PINECONE_MAX_CONNECTIONS', '32'))
+PINECONE_TIMEOUT_SECONDS = float(os.getenv('PINECONE_TIMEOUT_SECONDS', '10'))
+# Pinecone rejects larger delete requests
+DELETE_BATCH_SIZE = 1000
+
+
+class VectorStore:
+    def __init__(
+        self,
+        api_key: str,
+        index_name: str,
+        host: Optional[str] = None,
+        max_concurrency: int = PINECONE_MAX_CONCURRENCY,
+        max_connections: int = PINECONE_MAX_CONNECTIONS,
+        timeout_seconds: float = PINECONE_TIMEOUT_SECONDS
+    ):
+        self.api_key = api_key
+        self.index_name = index_name
+        self.host = self._normalize_host(host) if host else None
+        self.max_concurrency = max_concurrency
+        self.max_connections = max_connections
+        self.timeout_seconds = timeout_seconds
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._inflight: Dict[Tuple[Any, ...], 'asyncio.Task[Dict[str, Any]]'] = {}
+
+    @staticmethod
+    def _normalize_host(host: str) -> str:
+        host = host.rstrip('/')
+        return host if host.startswith(('http://', 'https://')) else f"https://{host}"
+
+    def _session(self) -> Tuple[httpx.AsyncClient, asyncio.Semaphore]:
+        # The pool and semaphore belong to the loop that created them
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            self._client = httpx.AsyncClient(
+                headers={'Api-Key': self.api_key, 'Content-Type': 'application/json'},
+                timeout=self.timeout_seconds,
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections)
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._inflight = {}
+            self._loop = loop
+        return self._client, self._semaphore
+
+    async def _resolve_host(self, client: httpx.AsyncClient) -> str:
+        if self.host is None:
+            with external_call('pinecone', 'describe_index', self.index_name):
+                response = await client.get(f"{PINECONE_CONTROL_PLANE_URL}/indexes/{self.index_name}")
+            response.raise_for_status()
+            self.host = self._normalize_host(response.json()['host'])
+            logger.info("Resolved Pinecone index %s to %s", self.index_name, self.host)
+        return self.host
+
+    async def _post(self, operation: str, path: str, body: Dict[str, Any], hedge: bool = False) -> Dict[str, Any]:
+        # Every operation is idempotent (upserts and deletes by ID), so all are retried
+        if hedge:
+            return await resilience.call('pinecone', lambda: resilience.hedged(
+                'pinecone', lambda: self._send(operation, path, body), resilience.PINECONE_HEDGE_AFTER_SECONDS))
+        return await resilience.call('pinecone', lambda: self._send(operation, path, body))
+
+    async def _send(self, operation: str, path: str, body: Dict[str, Any]) -> Dict[str, Any]:
+        client, semaphore = self._session()
+        async with semaphore:
+            host = await self._resolve_host(client)
+            with external_call('pinecone', operation, self.index_name):
+                response = await client.post(f"{host}{path}", json=body)
+            response.raise_for_status()
+            return response.json() if response.content else {}
+
+    async def query(
+        self,
+        vector: List[float],
+        top_k: int = 10,
+        filter: Optional[Dict[str, Any]] = None,
+        include_metadata: bool = True,
+        namespace: str = ''
+    ) -> Dict[str, Any]:
+        """
+        Return ``{'matches': [{'id', 'score', 'metadata'}, ...]}``, best first.
+        """
+        self._session()
+        key = (tuple(vector), top_k, json.dumps(filter, sort_keys=True), include_metadata, namespace)
+        task = self._inflight.get(key)
+        record_cache('pinecone_query', task is not None)
+        if task is None:
+            body: Dict[str, Any] = {'vector': vector, 'topK': top_k, 'includeMetadata': include_metadata,
+                                    'namespace': namespace}
+            if filter:
+                body['filter'] = filter
+            task = asyncio.ensure_future(self._query(body))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # Shielded so one caller giving up does not cancel the query for the rest
+        return await asyncio.shield(task)
+
+    async def _query(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        response = await self._post('query', '/query', body, hedge=True)
+        matches = [{**match, 'metadata': match.get('metadata') or {}} for match in response.get('matches') or []]
+        return {'matches': matches, 'namespace': response.get('namespace', '')}
+
+    async def upsert(self, vectors: List[Dict[str, Any]], namespace: str = '') -> Dict[str, Any]:
+        return await self._post('upsert', '/vectors/upsert', {'vectors': vectors, 'namespace': namespace})
+
+    async def delete(self, ids: List[str], namespace: str = '') -> None:
+        """
+        Delete ``ids``, in concurrent batches when there are many.
+        """
+        await asyncio.gather(*(
+            self._post('delete', '/vectors/delete', {'ids': ids[start:start + DELETE_BATCH_SIZE], 'namespace': namespace})
+            for start in range(0, len(ids), DELETE_BATCH_SIZE)
+        ))
+
+    async def describe_index_stats(self) -> Dict[str, Any]:
+        return await self._post('describe_index_stats', '/describe_index_stats', {})
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
@@ -0,0 +1,3 @@
+"""
+Benchmarks and budget checks for the AutoCRM backend.
+"""
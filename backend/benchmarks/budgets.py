@@ -0,0 +1,59 @@
+"""
+Round-trip budgets per route.
+
+Each budget is the most Supabase, Pinecone and OpenAI calls a single request
+to the route may make. The backend reports its counts in the ``X-Round-Trips``
+header when ``DEBUG_ROUND_TRIPS`` is enabled; ``assert_round_trip_budget``
+checks a response against the budget so N+1 regressions fail before deploy:
+
+    response = client.post('/api/tickets', json=payload, headers=auth)
+    assert_round_trip_budget(response, 'POST /api/tickets')
+"""
+from typing import Dict, List, Optional, Tuple
+
+from app.instrumentation import ROUND_TRIP_HEADER, parse_round_trip_header
+
+# Budgets for the benchmark workload in benchmarks/run.py: the AutoCRM UPDATE
+# touches 10 tickets and the backfill covers a 40-article corpus.
+ROUTE_BUDGETS: Dict[str, Dict[str, int]] = {
+    'POST /autocrm': {'supabase': 50, 'pinecone': 0, 'openai': 1},
+    'POST /autocrm/transcribe': {'supabase': 50, 'pinecone': 0, 'openai': 2},
+    # Includes a cold agent directory load (agents and open-ticket counts)
+    'POST /api/tickets': {'supabase': 14, 'pinecone': 2, 'openai': 3},
+    # Auth, the ticket for the ownership check unless cached, and the insert
+    'POST /api/tickets/{ticket_id}/replies': {'supabase': 4, 'pinecone': 0, 'openai': 0},
+    # Assigning an unassigned ticket may load the agent directory cold
+    'POST /api/tickets/{ticket_id}/replies/{reply_id}/process': {'supabase': 8, 'pinecone': 0, 'openai': 1},
+    'POST /api/knowledge-base/search': {'supabase': 3, 'pinecone': 1, 'openai': 1},
+    'GET /api/knowledge-base/suggest': {'supabase': 3, 'pinecone': 0, 'openai': 0},
+    'POST /api/knowledge-base/generate-embeddings': {'supabase': 2, 'pinecone': 2, 'openai': 1},
+    'POST /api/embeddings/backfill': {'supabase': 6, 'pinecone': 4, 'openai': 2},
+}
+
+
+def check_round_trip_budget(response, route: str, budget: Optional[Dict[str, int]] = None) -> Tuple[Dict[str, int], List[str]]:
+    """
+    Return the response's round-trip counts and a message for every
+    dependency over budget. Routes without a budget are never over.
+    """
+    header = response.headers.get(ROUND_TRIP_HEADER)
+    if header is None:
+        raise AssertionError(f"Response has no {ROUND_TRIP_HEADER} header; is DEBUG_ROUND_TRIPS enabled?")
+    counts = parse_round_trip_header(header)
+    budget = budget if budget is not None else ROUTE_BUDGETS.get(route, {})
+    violations = [
+        f"{route} made {counts.get(dependency, 0)} {dependency} calls, budget is {limit}"
+        for dependency, limit in budget.items()
+        if counts.get(dependency, 0) > limit
+    ]
+    return counts, violations
+
+
+def assert_round_trip_budget(response, route: str, budget: Optional[Dict[str, int]] = None) -> Dict[str, int]:
+    """
+    Raise ``AssertionError`` if the response exceeded the route's budget.
+    """
+    counts, violations = check_round_trip_budget(response, route, budget)
+    if violations:
+        raise AssertionError('; '.join(violations))
+    return counts
@@ -0,0 +1,511 @@
+"""
+In-process stand-ins for Supabase (PostgREST + GoTrue), Pinecone and OpenAI.
+
+``FakeServices`` serves all three from one Starlette app on a local port:
+
+    /rest/v1/{table}, /auth/v1/user     Supabase
+    /rest/v1/rpc/{function}              the usage functions of the migrations
+    /pinecone/query, /pinecone/vectors/* Pinecone data plane
+    /openai/v1/...                       OpenAI chat, embeddings, transcription
+
+Each service has a configurable latency and counts the requests it serves,
+which is what the benchmark reports as round trips.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import base64
+import copy
+import hashlib
+import itertools
+import json
+import re
+import socket
+import struct
+import threading
+import time
+import uuid
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+SERVICES = ('supabase', 'pinecone', 'openai')
+EMBEDDING_DIMENSION = 16
+INTEGER_ID_TABLES = {'tickets'}
+
+
+def fake_embedding(text: str, dimension: int = EMBEDDING_DIMENSION) -> List[float]:
+    """
+    Deterministic pseudo-embedding so identical texts map to identical vectors.
+    """
+    digest = hashlib.sha256(text.encode('utf-8')).digest()
+    return [(byte - 128) / 128 for byte in (digest * (dimension // len(digest) + 1))[:dimension]]
+
+
+def _split_top_level(value: str) -> List[str]:
+    parts, depth, current = [], 0, ''
+    for char in value:
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        if char == ',' and depth == 0:
+            parts.append(current.strip())
+            current = ''
+        else:
+            current += char
+    if current.strip():
+        parts.append(current.strip())
+    return parts
+
+
+def _coerce(value: Any) -> Any:
+    if isinstance(value, str) and re.fullmatch(r'-?\d+', value):
+        return int(value)
+    return value
+
+
+class FakeDatabase:
+    """
+    A dict of tables with just enough PostgREST semantics for the backend.
+    """
+
+    def __init__(self):
+        self.tables: Dict[str, List[Dict[str, Any]]] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def seed(self, table: str, rows: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            self.tables.setdefault(table, []).extend(copy.deepcopy(rows))
+
+    def insert(self, table: str, rows: List[Dict[str, Any]], upsert: bool = False) -> List[Dict[str, Any]]:
+        inserted = []
+        with self._lock:
+            existing = self.tables.setdefault(table, [])
+            for row in rows:
+                row = dict(row)
+                if 'id' not in row:
+                    if table in INTEGER_ID_TABLES:
+                        row['id'] = max((r['id'] for r in existing), default=0) + 1
+                    else:
+                        row['id'] = str(uuid.uuid4())
+                row.setdefault('created_at', time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime()) + f'.{next(self._ids):06d}')
+                match = next((r for r in existing if r['id'] == row['id']), None) if upsert else None
+                if match is not None:
+                    match.update(row)
+                    inserted.append(dict(match))
+                else:
+                    existing.append(row)
+                    inserted.append(dict(row))
+        return inserted
+
+    def rows(self, table: str) -> List[Dict[str, Any]]:
+        return self.tables.setdefault(table, [])
+
+    def accumulate(self, table: str, rows: List[Dict[str, Any]], key: Tuple[str, ...], counters: Tuple[str, ...]) -> None:
+        """
+        Insert ``rows``, adding ``counters`` into an existing row with the same ``key``.
+        """
+        with self._lock:
+            existing = self.tables.setdefault(table, [])
+            for row in rows:
+                match = next((r for r in existing if all(r.get(column) == row.get(column) for column in key)), None)
+                if match is None:
+                    existing.append(dict(row))
+                else:
+                    for counter in counters:
+                        match[counter] += row[counter]
+
+    def get(self, table: str, row_id: Any) -> Optional[Dict[str, Any]]:
+        return next((row for row in self.rows(table) if str(row.get('id')) == str(row_id)), None)
+
+
+def _matches(row: Dict[str, Any], column: str, expression: str) -> bool:
+    negate = expression.startswith('not.')
+    if negate:
+        expression = expression[4:]
+    operator, _, operand = expression.partition('.')
+    value = row.get(column)
+    if operator == 'eq':
+        result = str(value) == operand
+    elif operator == 'neq':
+        result = str(value) != operand
+    elif operator == 'is':
+        result = value is None if operand == 'null' else str(value).lower() == operand
+    elif operator == 'in':
+        options = [option.strip().strip('"') for option in operand.strip('()').split(',')]
+        result = str(value) in options
+    elif operator in ('gt', 'gte', 'lt', 'lte'):
+        if value is None:
+            return False
+        left, right = _coerce(value), _coerce(operand)
+        result = {'gt': left > right, 'gte': left >= right, 'lt': left < right, 'lte': left <= right}[operator]
+    elif operator in ('like', 'ilike'):
+        pattern = re.escape(operand).replace(r'\*', '.*').replace('%', '.*')
+        result = re.fullmatch(pattern, str(value or ''), re.IGNORECASE if operator == 'ilike' else 0) is not None
+    else:
+        result = True
+    return not result if negate else result
+
+
+class FakeServices:
+    """
+    Supabase, Pinecone and OpenAI fakes served from one local HTTP server.
+    """
+
+    def __init__(self, latency_ms: Optional[Dict[str, float]] = None, chat_reply: str = 'Thanks for reaching out, we are looking into it.'):
+        self.latency_ms = {service: 0.0 for service in SERVICES}
+        self.latency_ms.update(latency_ms or {})
+        self.chat_reply = chat_reply
+        self.db = FakeDatabase()
+        self.vectors: Dict[str, Dict[str, Any]] = {}
+        self.users: Dict[str, Dict[str, Any]] = {}
+        self.calls = {service: 0 for service in SERVICES}
+        self._calls_lock = threading.Lock()
+        self.port = _free_port()
+        self.app = self._build_app()
+        self._server = None
+        self._thread: Optional[threading.Thread] = None
+
+    # Lifecycle -----------------------------------------------------------
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def environment(self) -> Dict[str, str]:
+        """
+        Environment variables pointing the backend at the fakes.
+        """
+        return {
+            'SUPABASE_URL': self.base_url,
+            'SUPABASE_SERVICE_ROLE_KEY': 'eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoic2VydmljZV9yb2xlIn0.benchmark',
+            'PINECONE_API_KEY': 'benchmark',
+            'PINECONE_INDEX': 'benchmark',
+            'PINECONE_HOST': f"{self.base_url}/pinecone",
+            'OPENAI_API_KEY': 'sk-benchmark',
+            'OPENAI_BASE_URL': f"{self.base_url}/openai/v1",
+            'OPENAI_API_BASE': f"{self.base_url}/openai/v1",
+        }
+
+    def start(self) -> None:
+        import uvicorn
+
+        config = uvicorn.Config(self.app, host='127.0.0.1', port=self.port, log_level='warning', access_log=False)
+        self._server = uvicorn.Server(config)
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+        self._thread.start()
+        deadline = time.time() + 10
+        while not self._server.started:
+            if time.time() > deadline:
+                raise RuntimeError('Fake services did not start')
+            time.sleep(0.01)
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.should_exit = True
+            self._thread.join(timeout=5)
+
+    def reset_calls(self) -> None:
+        with self._calls_lock:
+            self.calls = {service: 0 for service in SERVICES}
+
+    def snapshot_calls(self) -> Dict[str, int]:
+        with self._calls_lock:
+            return dict(self.calls)
+
+    async def _enter(self, service: str) -> None:
+        with self._calls_lock:
+            self.calls[service] += 1
+        latency = self.latency_ms.get(service, 0.0)
+        if latency:
+            await asyncio.sleep(latency / 1000)
+
+    # Seeding -------------------------------------------------------------
+
+    def add_user(self, token: str, profile: Dict[str, Any]) -> None:
+        self.users[token] = profile
+        self.db.seed('profiles', [profile])
+
+    def add_article_vectors(self, articles: List[Dict[str, Any]]) -> None:
+        """
+        Store article passages the way ``app.indexing.index_articles`` does.
+        """
+        from app.indexing import article_passages, passage_id
+
+        for article in articles:
+            for chunk, passage in enumerate(article_passages(article) or ['']):
+                vector_id = passage_id(article['id'], chunk)
+                self.vectors[vector_id] = {
+                    'id': vector_id,
+                    'values': fake_embedding(f"Title: {article['title']}\nContent: {passage}"),
+                    'metadata': {
+                        'title': article['title'],
+                        'passage': passage,
+                        'chunk': chunk,
+                        'article_id': article['id'],
+                        'type': 'article',
+                    },
+                }
+
+    # App -----------------------------------------------------------------
+
+    def _build_app(self) -> Starlette:
+        return Starlette(routes=[
+            Route('/auth/v1/user', self._auth_user, methods=['GET']),
+            Route('/rest/v1/rpc/{function}', self._rpc, methods=['POST']),
+            Route('/rest/v1/{table}', self._postgrest, methods=['GET', 'POST', 'PATCH', 'DELETE', 'HEAD']),
+            Route('/pinecone/query', self._pinecone_query, methods=['POST']),
+            Route('/pinecone/vectors/upsert', self._pinecone_upsert, methods=['POST']),
+            Route('/pinecone/vectors/delete', self._pinecone_delete, methods=['POST']),
+            Route('/pinecone/describe_index_stats', self._pinecone_stats, methods=['GET', 'POST']),
+            Route('/openai/v1/chat/completions', self._openai_chat, methods=['POST']),
+            Route('/openai/v1/embeddings', self._openai_embeddings, methods=['POST']),
+            Route('/openai/v1/audio/transcriptions', self._openai_transcription, methods=['POST']),
+            Route('/openai/v1/models/{model}', self._openai_model, methods=['GET']),
+        ])
+
+    # Supabase ------------------------------------------------------------
+
+    async def _auth_user(self, request: Request) -> Response:
+        await self._enter('supabase')
+        token = request.headers.get('authorization', '').replace('Bearer ', '')
+        profile = self.users.get(token)
+        if profile is None:
+            return JSONResponse({'message': 'invalid JWT'}, status_code=401)
+        return JSONResponse({
+            'id': profile['id'],
+            'aud': 'authenticated',
+            'role': 'authenticated',
+            'email': profile.get('email'),
+            'app_metadata': {},
+            'user_metadata': {'role': profile.get('role')},
+            'created_at': '2024-01-01T00:00:00Z',
+        })
+
+    def _embed(self, table: str, row: Dict[str, Any], item: str) -> Any:
+        # alias:target!table_column_fkey (columns)
+        match = re.match(r'^(?:(\w+):)?(\w+)(?:!(\w+))?\s*\((.*)\)$', item, re.S)
+        if not match:
+            return None, None
+        alias, target, foreign_key, columns = match.groups()
+        key = alias or target
+        column = None
+        if foreign_key and foreign_key.startswith(f"{table}_") and foreign_key.endswith('_fkey'):
+            column = foreign_key[len(table) + 1:-len('_fkey')]
+        related = self.db.get(target, row.get(column)) if column else None
+        return key, self._project(target, related, columns) if related else None
+
+    def _project(self, table: str, row: Dict[str, Any], select: str) -> Dict[str, Any]:
+        items = _split_top_level(select or '*')
+        projected: Dict[str, Any] = {}
+        for item in items:
+            if '(' in item:
+                key, value = self._embed(table, row, item)
+                if key:
+                    projected[key] = value
+            elif item == '*':
+                projected.update(row)
+            else:
+                projected[item] = row.get(item)
+        return projected
+
+    def _filter(self, table: str, request: Request) -> List[Dict[str, Any]]:
+        rows = self.db.rows(table)
+        for column, expression in request.query_params.multi_items():
+            if column in ('select', 'order', 'limit', 'offset', 'on_conflict', 'columns'):
+                continue
+            rows = [row for row in rows if _matches(row, column, expression)]
+        return rows
+
+    async def _postgrest(self, request: Request) -> Response:
+        await self._enter('supabase')
+        table = request.path_params['table']
+        params = request.query_params
+        prefer = request.headers.get('prefer', '')
+        single = 'vnd.pgrst.object' in request.headers.get('accept', '')
+
+        if request.method == 'POST':
+            body = json.loads(await request.body() or b'[]')
+            rows = body if isinstance(body, list) else [body]
+            result = self.db.insert(table, rows, upsert='merge-duplicates' in prefer)
+            status = 201
+        elif request.method == 'PATCH':
+            changes = json.loads(await request.body() or b'{}')
+            result = []
+            for row in self._filter(table, request):
+                row.update(changes)
+                result.append(dict(row))
+            status = 200
+        elif request.method == 'DELETE':
+            doomed = self._filter(table, request)
+            self.db.tables[table] = [row for row in self.db.rows(table) if row not in doomed]
+            result = doomed
+            status = 200
+        else:
+            result = list(self._filter(table, request))
+            status = 200
+
+        total = len(result)
+        order = params.get('order')
+        if order:
+            column, *modifiers = order.split('.')
+            result.sort(key=lambda row: (row.get(column) is None, _coerce(row.get(column))), reverse='desc' in modifiers)
+        offset = int(params.get('offset', 0))
+        if 'limit' in params:
+            result = result[offset:offset + int(params['limit'])]
+
+        select = params.get('select', '*')
+        if select.replace(' ', '') == 'count':
+            result = [{'count': total}]
+        else:
+            result = [self._project(table, row, select) for row in result]
+
+        headers = {}
+        if 'count=' in prefer:
+            headers['content-range'] = f"0-{max(len(result) - 1, 0)}/{total}"
+        if 'return=minimal' in prefer:
+            return Response(status_code=status, headers=headers)
+        if single:
+            if len(result) != 1:
+                return JSONResponse({'code': 'PGRST116', 'message': 'JSON object requested, multiple (or no) rows returned',
+                                     'details': f'Results contain {len(result)} rows', 'hint': None}, status_code=406)
+            return JSONResponse(result[0], status_code=status, headers=headers)
+        return JSONResponse(result, status_code=status, headers=headers)
+
+    _USAGE_KEY = ('period_start', 'route', 'user_id', 'model')
+    _USAGE_COUNTERS = ('calls', 'prompt_tokens', 'completion_tokens', 'cost_usd')
+
+    async def _rpc(self, request: Request) -> Response:
+        await self._enter('supabase')
+        function = request.path_params['function']
+        params = json.loads(await request.body() or b'{}')
+        if function == 'record_usage':
+            self.db.accumulate('usage', params['batch'], self._USAGE_KEY, self._USAGE_COUNTERS)
+            return Response(status_code=204)
+        if function == 'usage_by_key':
+            groups: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+            for row in self.db.rows('usage'):
+                if row['period_start'] < params['since']:
+                    continue
+                key = (row['route'], row['user_id'] or '', row['model'])
+                group = groups.setdefault(key, {'route': row['route'], 'user_id': row['user_id'], 'model': row['model'],
+                                                 **{counter: 0 for counter in self._USAGE_COUNTERS}})
+                for counter in self._USAGE_COUNTERS:
+                    group[counter] += row[counter]
+            offset, size = params.get('page_offset', 0), params.get('page_size', 1000)
+            return JSONResponse([groups[key] for key in sorted(groups)][offset:offset + size])
+        if function == 'open_ticket_counts':
+            counts: Dict[str, int] = {}
+            for row in self.db.rows('tickets'):
+                if row.get('status') in params['statuses'] and row.get('assigned_to'):
+                    counts[row['assigned_to']] = counts.get(row['assigned_to'], 0) + 1
+            return JSONResponse([{'agent_id': agent_id, 'open_tickets': count} for agent_id, count in counts.items()])
+        return JSONResponse({'code': 'PGRST202', 'message': f'Could not find the function {function}'}, status_code=404)
+
+    # Pinecone ------------------------------------------------------------
+
+    async def _pinecone_query(self, request: Request) -> Response:
+        await self._enter('pinecone')
+        body = await request.json()
+        vector = body.get('vector') or []
+        metadata_filter = body.get('filter') or {}
+
+        def accepted(record: Dict[str, Any]) -> bool:
+            for key, condition in metadata_filter.items():
+                expected = condition.get('$eq') if isinstance(condition, dict) else condition
+                if record['metadata'].get(key) != expected:
+                    return False
+            return True
+
+        scored = []
+        for record in self.vectors.values():
+            if accepted(record):
+                score = sum(a * b for a, b in zip(vector, record['values']))
+                scored.append((score, record))
+        scored.sort(key=lambda item: item[0], reverse=True)
+        matches = [{
+            'id': record['id'],
+            'score': score,
+            'values': [],
+            'metadata': record['metadata'] if body.get('includeMetadata') else None,
+        } for score, record in scored[:body.get('topK', 10)]]
+        return JSONResponse({'matches': matches, 'namespace': body.get('namespace', '')})
+
+    async def _pinecone_upsert(self, request: Request) -> Response:
+        await self._enter('pinecone')
+        body = await request.json()
+        for vector in body.get('vectors', []):
+            self.vectors[vector['id']] = {'id': vector['id'], 'values': vector.get('values', []), 'metadata': vector.get('metadata') or {}}
+        return JSONResponse({'upsertedCount': len(body.get('vectors', []))})
+
+    async def _pinecone_delete(self, request: Request) -> Response:
+        await self._enter('pinecone')
+        body = await request.json()
+        for vector_id in body.get('ids', []):
+            self.vectors.pop(vector_id, None)
+        return JSONResponse({})
+
+    async def _pinecone_stats(self, request: Request) -> Response:
+        await self._enter('pinecone')
+        return JSONResponse({'dimension': EMBEDDING_DIMENSION, 'indexFullness': 0.0,
+                             'totalVectorCount': len(self.vectors), 'namespaces': {'': {'vectorCount': len(self.vectors)}}})
+
+    # OpenAI --------------------------------------------------------------
+
+    async def _openai_chat(self, request: Request) -> Response:
+        await self._enter('openai')
+        body = await request.json()
+        messages = body.get('messages', [])
+        prompt_text = ' '.join(str(message.get('content', '')) for message in messages)
+        last_user = next((str(m.get('content', '')) for m in reversed(messages) if m.get('role') == 'user'), '')
+        # AutoCRM requests carry the desired ACTION line in the query; echo it back, ignoring
+        # the ones quoted in the conversation history
+        current_request = last_user.rsplit('Current request:', 1)[-1]
+        actions = [line.strip() for line in current_request.split('\n') if line.strip().startswith('ACTION:')]
+        content = '\n'.join(actions) if actions else self.chat_reply
+        prompt_tokens = max(1, len(prompt_text) // 4)
+        completion_tokens = max(1, len(content) // 4)
+        return JSONResponse({
+            'id': f"chatcmpl-{uuid.uuid4().hex}",
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': body.get('model', 'gpt-4o-mini'),
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}],
+            'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+                      'total_tokens': prompt_tokens + completion_tokens},
+        })
+
+    async def _openai_embeddings(self, request: Request) -> Response:
+        await self._enter('openai')
+        body = await request.json()
+        inputs = body.get('input', [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        data = []
+        for position, text in enumerate(inputs):
+            vector = fake_embedding(str(text))
+            if body.get('encoding_format') == 'base64':
+                embedding: Any = base64.b64encode(struct.pack(f'<{len(vector)}f', *vector)).decode('ascii')
+            else:
+                embedding = vector
+            data.append({'object': 'embedding', 'index': position, 'embedding': embedding})
+        tokens = sum(max(1, len(str(text)) // 4) for text in inputs)
+        return JSONResponse({'object': 'list', 'data': data, 'model': body.get('model'),
+                             'usage': {'prompt_tokens': tokens, 'total_tokens': tokens}})
+
+    async def _openai_transcription(self, request: Request) -> Response:
+        await self._enter('openai')
+        return JSONResponse({'text': 'ACTION: SEARCH status: open'})
+
+    async def _openai_model(self, request: Request) -> Response:
+        await self._enter('openai')
+        return JSONResponse({'id': request.path_params['model'], 'object': 'model', 'created': 0, 'owned_by': 'system'})
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
@@ -0,0 +1,74 @@
+"""
+Import-time budget for ``app.main``.
+
+Runs ``python -X importtime -c "import app.main"`` in a fresh interpreter,
+reports the cumulative cost of importing the app and the heaviest modules,
+and exits non-zero when the total exceeds the budget.
+
+Usage (from ``backend/``):
+    python -m benchmarks.import_time --budget-ms 1500
+"""
+from typing import List, Tuple
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+DEFAULT_BUDGET_MS = float(os.getenv("IMPORT_BUDGET_MS", "1500"))
+
+
+def measure_import_time(module: str = "app.main") -> Tuple[float, List[Tuple[str, float]]]:
+    """
+    Return the cumulative import time of ``module`` in milliseconds and the
+    per-module cumulative times, heaviest first.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+
+    modules = []
+    total_ms = None
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = [part.strip() for part in line[len("import time:"):].split("|")]
+        if len(parts) != 3 or not parts[1].isdigit():
+            continue
+        cumulative_ms = int(parts[1]) / 1000
+        name = parts[2].strip()
+        modules.append((name, cumulative_ms))
+        if name == module:
+            total_ms = cumulative_ms
+
+    if total_ms is None:
+        raise RuntimeError(f"No importtime entry found for {module}")
+
+    modules.sort(key=lambda item: item[1], reverse=True)
+    return total_ms, modules
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    total_ms, modules = measure_import_time()
+    print(json.dumps({"module": "app.main", "import_ms": round(total_ms, 1), "budget_ms": args.budget_ms}))
+    for name, cumulative_ms in modules[:args.top]:
+        print(f"{cumulative_ms:10.1f} ms  {name}")
+
+    if total_ms > args.budget_ms:
+        print(f"Import time {total_ms:.1f} ms exceeds budget of {args.budget_ms:.1f} ms", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,440 @@
+"""
+Load-test the backend against local fakes of Supabase, Pinecone and OpenAI.
+
+Drives the main endpoints at fixed concurrency levels through the ASGI app
+in-process, and reports throughput, p50/p95/p99 latency and the average number
+of round trips per request to each dependency. Average round trips are
+compared against ``benchmarks/baselines.json`` and every single request is
+checked against the per-route budgets in ``benchmarks/budgets.py``; any
+increase fails the run.
+
+AutoCRM scenarios give each concurrent worker a conversation of its own per
+scenario and level, and let each request's background summary fold finish
+before the worker sends the next one, so the counts repeat from run to run.
+
+Usage (from ``backend/``):
+    python -m benchmarks.run
+    python -m benchmarks.run --scenarios autocrm_search,kb_search --concurrency 1,8 --requests 40
+    python -m benchmarks.run --latency supabase=5,pinecone=20,openai=150
+    python -m benchmarks.run --update-baselines
+"""
+from typing import Any, Callable, Dict, List, Tuple
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import random
+import re
+import sys
+import time
+
+from .budgets import ROUTE_BUDGETS, check_round_trip_budget
+from .fakes import FakeServices, SERVICES
+
+BASELINES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines.json')
+
+TOPICS = [
+    "Order & Shipping Issues",
+    "Billing & Account Concerns",
+    "Communication & Customer Experience",
+    "Policy, Promotions & Loyalty Programs",
+    "Product & Service Usage",
+]
+
+ADMIN_TOKEN = 'admin-token'
+AGENT_TOKEN = 'agent-token'
+CUSTOMER_TOKEN = 'customer-token'
+
+# Requests issued per concurrency level, capped for the expensive scenarios
+REQUEST_CAPS = {'backfill_embeddings': 5}
+
+
+def seed(fakes: FakeServices, tickets: int = 200, articles: int = 40) -> Dict[str, Any]:
+    """
+    Populate the fakes with users, agents, tickets, replies and articles.
+    """
+    rng = random.Random(42)
+    admin = {'id': '00000000-0000-0000-0000-00000000000a', 'email': 'admin@example.com',
+             'full_name': 'Ada Admin', 'name': 'Ada Admin', 'role': 'admin', 'specialty': None}
+    customer = {'id': '00000000-0000-0000-0000-00000000000c', 'email': 'customer@example.com',
+                'full_name': 'Casey Customer', 'name': 'Casey Customer', 'role': 'user', 'specialty': None}
+    fakes.add_user(ADMIN_TOKEN, admin)
+    fakes.add_user(CUSTOMER_TOKEN, customer)
+
+    agents = []
+    for position, topic in enumerate(TOPICS * 2):
+        agent = {'id': f'00000000-0000-0000-0001-{position:012d}', 'email': f'agent{position}@example.com',
+                 'full_name': f'Agent {position}', 'name': f'Agent {position}', 'role': 'agent', 'specialty': topic}
+        agents.append(agent)
+        if position == 0:
+            fakes.add_user(AGENT_TOKEN, agent)
+        else:
+            fakes.db.seed('profiles', [agent])
+
+    fakes.db.seed('tickets', [{
+        'id': ticket_id,
+        'subject': f'Ticket {ticket_id}',
+        'description': f'Customer question number {ticket_id}',
+        'status': rng.choice(['open', 'pending', 'solved', 'closed']),
+        'priority': rng.choice(['low', 'normal', 'high', 'urgent']),
+        'ticket_type': 'question',
+        'topic': rng.choice(TOPICS),
+        'group_name': 'Support',
+        'user_id': customer['id'],
+        'assigned_to': rng.choice(agents)['id'] if rng.random() < 0.8 else None,
+        'tags': [],
+    } for ticket_id in range(1, tickets + 1)])
+
+    replies = []
+    for ticket_id in range(1, tickets + 1):
+        for turn in range(4):
+            replies.append({'ticket_id': ticket_id, 'content': f'Message {turn} on ticket {ticket_id}',
+                            'user_id': customer['id'] if turn % 2 == 0 else agents[0]['id'],
+                            'is_public': True, 'is_ai_generated': turn % 2 == 1})
+    fakes.db.insert('replies', replies)
+
+    article_rows = [{
+        'id': f'10000000-0000-0000-0000-{article_id:012d}',
+        'title': f'How to handle {topic.lower()} case {article_id}',
+        'content': ' '.join([f'Step {step}: follow the {topic.lower()} procedure for refunds and tracking numbers.'
+                             for step in range(1, 12)]),
+        'has_embedding': True,
+        'updated_at': '2024-01-01T00:00:00Z',
+    } for article_id, topic in ((i, TOPICS[i % len(TOPICS)]) for i in range(1, articles + 1))]
+    fakes.db.seed('knowledge_base_articles', article_rows)
+    fakes.add_article_vectors(article_rows)
+
+    return {'admin': admin, 'customer': customer, 'agents': agents, 'articles': article_rows, 'tickets': tickets}
+
+
+def _auth(token: str) -> Dict[str, str]:
+    return {'Authorization': f'Bearer {token}'}
+
+
+def build_scenarios(fakes: FakeServices, data: Dict[str, Any]) -> Dict[str, Callable[[int, str], Tuple[str, str, Dict[str, Any]]]]:
+    """
+    Map scenario name to a factory producing ``(method, path, request kwargs)``
+    for the n-th request of a conversation (see ``run_level``).
+    """
+    customer = data['customer']
+    conversation_users: Dict[str, Tuple[str, Dict[str, Any]]] = {}
+
+    def conversation_user(conversation: str) -> Tuple[str, Dict[str, Any]]:
+        # AutoCRM keeps one conversation per user, so every conversation gets
+        # a user (and token) of its own; admins, to stay out of ticket routing
+        if conversation not in conversation_users:
+            position = len(conversation_users)
+            profile = {'id': f'00000000-0000-0000-0002-{position:012d}', 'email': f'autocrm{position}@example.com',
+                       'full_name': f'AutoCRM User {position}', 'name': f'AutoCRM User {position}', 'role': 'admin',
+                       'specialty': None}
+            fakes.add_user(f'autocrm-token-{position}', profile)
+            conversation_users[conversation] = (f'autocrm-token-{position}', profile)
+        return conversation_users[conversation]
+
+    def autocrm(query: str, conversation: str) -> Tuple[str, str, Dict[str, Any]]:
+        token, user = conversation_user(conversation)
+        return 'POST', '/autocrm', {'json': {'query': query, 'userId': user['id']}, 'headers': _auth(token)}
+
+    def autocrm_search(n, conversation):
+        return autocrm('ACTION: SEARCH status: open', conversation)
+
+    def autocrm_update(n, conversation):
+        start = (n * 10) % (data['tickets'] - 20) + 1
+        return autocrm(f'ACTION: UPDATE ticket: {start}-{start + 9} priority: high', conversation)
+
+    def autocrm_transcribe(n, conversation):
+        # The fake Whisper transcribes any upload to an AutoCRM SEARCH
+        token, _ = conversation_user(conversation)
+        return 'POST', '/autocrm/transcribe', {'files': {'file': ('voice-note.wav', b'RIFF\x00\x00\x00\x00WAVE', 'audio/wav')},
+                                               'headers': _auth(token)}
+
+    def autocrm_multi_action(n, conversation):
+        # Three updates on disjoint tickets and a profile lookup. No footprints
+        # overlap, so all four run at once; a SEARCH reads every ticket and
+        # would wait for the updates
+        start = (n * 10) % (data['tickets'] - 20) + 1
+        query = '\n'.join((
+            f'ACTION: UPDATE ticket: {start}-{start + 2} priority: high',
+            f'ACTION: UPDATE ticket: {start + 3}-{start + 5} status: pending',
+            f'ACTION: UPDATE ticket: {start + 6}-{start + 9} priority: low',
+            f"ACTION: INFO customer: {customer['id']}",
+        ))
+        return autocrm(query, conversation)
+
+    def create_ticket(n, conversation):
+        return 'POST', '/api/tickets', {'json': {
+            'subject': f'Benchmark ticket {n}',
+            'description': 'My order has not arrived and the tracking number does not work.',
+            'priority': 'normal',
+            'ticket_type': 'question',
+            'topic': TOPICS[n % len(TOPICS)],
+        }, 'headers': _auth(CUSTOMER_TOKEN)}
+
+    def process_reply(n, conversation):
+        ticket_id = n % data['tickets'] + 1
+        reply = fakes.db.insert('replies', [{'ticket_id': ticket_id, 'content': f'Any update on this? ({n})',
+                                             'user_id': customer['id'], 'is_public': True, 'is_ai_generated': False}])[0]
+        return 'POST', f"/api/tickets/{ticket_id}/replies/{reply['id']}/process", {'headers': _auth(CUSTOMER_TOKEN)}
+
+    def create_reply(n, conversation):
+        ticket_id = n % data['tickets'] + 1
+        return 'POST', f"/api/tickets/{ticket_id}/replies", {'json': {'content': f'Any update on this? ({n})'},
+                                                             'headers': _auth(CUSTOMER_TOKEN)}
+
+    def process_reply_active_chat(n, conversation):
+        # A handful of live conversations, each posting several messages
+        return process_reply(n % 4, conversation)
+
+    def kb_search(n, conversation):
+        queries = ['refund', 'tracking number', 'how do I change my billing address', 'loyalty program points']
+        return 'POST', '/api/knowledge-base/search', {'json': {'query': queries[n % len(queries)]},
+                                                       'headers': _auth(AGENT_TOKEN)}
+
+    def kb_suggest(n, conversation):
+        # Keystrokes of a few queries being typed, as the search box sends them
+        queries = ['refund', 'tracking number', 'billing address', 'loyalty program']
+        query = queries[n % len(queries)]
+        typed = query[:2 + (n // len(queries)) % (len(query) - 1)]
+        return 'GET', f'/api/knowledge-base/suggest?q={typed}', {'headers': _auth(AGENT_TOKEN)}
+
+    def generate_embeddings(n, conversation):
+        article = data['articles'][n % len(data['articles'])]
+        return 'POST', '/api/knowledge-base/generate-embeddings', {'json': {'article_id': article['id']}}
+
+    def backfill_embeddings(n, conversation):
+        return 'POST', '/api/embeddings/backfill', {'headers': _auth(ADMIN_TOKEN)}
+
+    return {
+        'autocrm_search': autocrm_search,
+        'autocrm_update': autocrm_update,
+        'autocrm_multi_action': autocrm_multi_action,
+        'autocrm_transcribe': autocrm_transcribe,
+        'create_ticket': create_ticket,
+        'process_reply': process_reply,
+        'process_reply_active_chat': process_reply_active_chat,
+        'create_reply': create_reply,
+        'kb_search': kb_search,
+        'kb_suggest': kb_suggest,
+        'generate_embeddings': generate_embeddings,
+        'backfill_embeddings': backfill_embeddings,
+    }
+
+
+# Scenarios holding AutoCRM conversations, whose summary folds run in the background
+CONVERSATION_SCENARIOS = {'autocrm_search', 'autocrm_update', 'autocrm_multi_action', 'autocrm_transcribe'}
+
+# Route template each scenario exercises, for the round-trip budgets
+SCENARIO_ROUTES = {
+    'autocrm_search': 'POST /autocrm',
+    'autocrm_update': 'POST /autocrm',
+    'autocrm_multi_action': 'POST /autocrm',
+    'autocrm_transcribe': 'POST /autocrm/transcribe',
+    'create_ticket': 'POST /api/tickets',
+    'process_reply': 'POST /api/tickets/{ticket_id}/replies/{reply_id}/process',
+    'process_reply_active_chat': 'POST /api/tickets/{ticket_id}/replies/{reply_id}/process',
+    'create_reply': 'POST /api/tickets/{ticket_id}/replies',
+    'kb_search': 'POST /api/knowledge-base/search',
+    'kb_suggest': 'GET /api/knowledge-base/suggest',
+    'generate_embeddings': 'POST /api/knowledge-base/generate-embeddings',
+    'backfill_embeddings': 'POST /api/embeddings/backfill',
+}
+
+
+def instrumented_calls() -> Dict[str, int]:
+    """
+    Calls per service that went through the backend's instrumentation
+    (``dependency_call_duration_seconds``) since it started.
+    """
+    from app.metrics import REGISTRY
+
+    calls = {service: 0 for service in SERVICES}
+    for line in REGISTRY.render().splitlines():
+        match = re.match(r'dependency_call_duration_seconds_count\{.*dependency="(\w+)".*\} (\S+)$', line)
+        if match and match.group(1) in calls:
+            calls[match.group(1)] += int(float(match.group(2)))
+    return calls
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(fraction * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+async def run_level(client, fakes: FakeServices, factory, route: str, requests: int, concurrency: int,
+                    level: str = '', settle: bool = False) -> Dict[str, Any]:
+    """
+    Issue ``requests`` calls with at most ``concurrency`` in flight.
+
+    Request ``n`` belongs to conversation ``n % concurrency`` of ``level``.
+    With ``settle``, a conversation's requests run one at a time and each
+    waits for the background work of the previous one (the summary fold)
+    to finish, so the folds, and the round trips counted, do not depend on
+    timing.
+    """
+    from app.main import drain_background_tasks
+
+    semaphore = asyncio.Semaphore(concurrency)
+    turns = [asyncio.Lock() for _ in range(concurrency)]
+    latencies: List[float] = []
+    max_round_trips = {service: 0 for service in SERVICES}
+    budget_violations: List[str] = []
+    errors = 0
+
+    async def one(n: int) -> None:
+        nonlocal errors
+        worker = n % concurrency
+        method, path, kwargs = factory(n, f"{level}/{worker}")
+        async with turns[worker] if settle else contextlib.nullcontext():
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.request(method, path, **kwargs)
+                latencies.append((time.perf_counter() - start) * 1000)
+            if settle:
+                await drain_background_tasks()
+        if response.status_code >= 400:
+            errors += 1
+        counts, violations = check_round_trip_budget(response, route)
+        for service, count in counts.items():
+            max_round_trips[service] = max(max_round_trips.get(service, 0), count)
+        budget_violations.extend(violations)
+
+    fakes.reset_calls()
+    counted_before = instrumented_calls()
+    started = time.perf_counter()
+    await asyncio.gather(*(one(n) for n in range(requests)))
+    elapsed = time.perf_counter() - started
+    # Count work the requests left running, such as AI replies, against them
+    await drain_background_tasks()
+    calls = fakes.snapshot_calls()
+    counted = instrumented_calls()
+    # Calls that bypassed the instrumentation also skip the round-trip counts,
+    # budgets, metrics, retries and circuit breakers
+    uncounted = {service: calls[service] - (counted[service] - counted_before[service]) for service in SERVICES}
+
+    return {
+        'requests': requests,
+        'concurrency': concurrency,
+        'errors': errors,
+        'throughput_rps': round(requests / elapsed, 2) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 0.50), 2),
+        'p95_ms': round(percentile(latencies, 0.95), 2),
+        'p99_ms': round(percentile(latencies, 0.99), 2),
+        'round_trips': {service: round(calls[service] / requests, 2) for service in SERVICES},
+        'max_round_trips': max_round_trips,
+        'budget_violations': sorted(set(budget_violations)),
+        'uncounted_calls': {service: count for service, count in uncounted.items() if count > 0},
+    }
+
+
+def compare_to_baselines(results: Dict[str, Dict[str, Any]], baselines: Dict[str, Any]) -> List[str]:
+    """
+    Return a message for every round-trip count above its baseline.
+    """
+    regressions = []
+    for key, result in results.items():
+        baseline = baselines.get(key)
+        if not baseline:
+            continue
+        for service, count in result['round_trips'].items():
+            allowed = baseline['round_trips'].get(service, 0)
+            if count > allowed + 0.01:
+                regressions.append(f"{key}: {service} round trips per request rose from {allowed} to {count}")
+    return regressions
+
+
+def _parse_latency(value: str) -> Dict[str, float]:
+    latency = {}
+    for part in filter(None, value.split(',')):
+        service, _, milliseconds = part.partition('=')
+        if service not in SERVICES:
+            raise argparse.ArgumentTypeError(f"Unknown service {service}; expected one of {SERVICES}")
+        latency[service] = float(milliseconds)
+    return latency
+
+
+async def main_async(args) -> int:
+    fakes = FakeServices(latency_ms=args.latency)
+    os.environ.update(fakes.environment())
+    os.environ['DEBUG_ROUND_TRIPS'] = 'true'
+    # Keep the AI reply debounce short so sequential runs measure the pipeline
+    os.environ.setdefault('REPLY_DEBOUNCE_SECONDS', '0.2')
+    fakes.start()
+    try:
+        data = seed(fakes)
+        scenarios = build_scenarios(fakes, data)
+        selected = args.scenarios.split(',') if args.scenarios else list(scenarios)
+
+        import httpx
+        from app.main import app
+
+        if not args.verbose:
+            logging.getLogger().setLevel(logging.WARNING)
+
+        results: Dict[str, Dict[str, Any]] = {}
+        async with httpx.AsyncClient(app=app, base_url='http://benchmark', timeout=120) as client:
+            for name in selected:
+                for concurrency in args.concurrency:
+                    requests = min(args.requests, REQUEST_CAPS.get(name, args.requests))
+                    route = SCENARIO_ROUTES[name]
+                    key = f"{name}@{concurrency}"
+                    result = await run_level(client, fakes, scenarios[name], route, requests, concurrency,
+                                             level=key, settle=name in CONVERSATION_SCENARIOS)
+                    results[key] = result
+                    trips = ' '.join(f"{service}={count}" for service, count in result['round_trips'].items())
+                    print(f"{key:32} {result['throughput_rps']:8.1f} req/s  p50 {result['p50_ms']:8.1f} ms  "
+                          f"p95 {result['p95_ms']:8.1f} ms  p99 {result['p99_ms']:8.1f} ms  "
+                          f"errors {result['errors']:3d}  round trips {trips}")
+                    for violation in result['budget_violations']:
+                        print(f"  over budget: {violation}")
+                    for service, count in result['uncounted_calls'].items():
+                        print(f"  not instrumented: {count} {service} calls")
+    finally:
+        fakes.stop()
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+
+    regressions = [f"{key}: {violation}" for key, result in results.items() for violation in result['budget_violations']]
+    regressions.extend(f"{key}: {count} {service} calls bypassed the instrumentation"
+                       for key, result in results.items() for service, count in result['uncounted_calls'].items())
+
+    if args.update_baselines or not os.path.exists(BASELINES_PATH):
+        baselines = {}
+        if os.path.exists(BASELINES_PATH):
+            with open(BASELINES_PATH) as baseline_file:
+                baselines = json.load(baseline_file)
+        baselines.update({key: {'round_trips': result['round_trips']} for key, result in results.items()})
+        with open(BASELINES_PATH, 'w') as baseline_file:
+            json.dump(baselines, baseline_file, indent=2, sort_keys=True)
+        print(f"Baselines written to {BASELINES_PATH}")
+    else:
+        with open(BASELINES_PATH) as baseline_file:
+            regressions.extend(compare_to_baselines(results, json.load(baseline_file)))
+
+    for regression in regressions:
+        print(f"REGRESSION {regression}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenarios', default='', help='Comma-separated scenario names (default: all)')
+    parser.add_argument('--concurrency', type=lambda value: [int(level) for level in value.split(',')], default=[1, 8])
+    parser.add_argument('--requests', type=int, default=40, help='Requests per concurrency level')
+    parser.add_argument('--latency', type=_parse_latency, default={'supabase': 2, 'pinecone': 10, 'openai': 50},
+                        help='Per-service latency, e.g. supabase=5,pinecone=20,openai=150')
+    parser.add_argument('--output', default='', help='Write full results as JSON to this path')
+    parser.add_argument('--update-baselines', action='store_true')
+    parser.add_argument('--verbose', action='store_true', help='Keep the application INFO logs')
+    args = parser.parse_args()
+    return asyncio.run(main_async(args))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,181 @@
+"""
+Serialization and compression benchmark for representative API payloads.
+
+For each payload, reports the time to render the response body. It compares
+the stdlib ``json`` encoder used by FastAPI's default ``JSONResponse`` with
+``orjson`` (``ORJSONResponse``). Both run after FastAPI's
+``jsonable_encoder``, as in a real request. It also reports the bytes on the
+wire raw, gzipped and, when the ``brotli`` package is installed, brotli'd,
+with the time each compression takes.
+
+The payloads mirror:
+
+- an AutoCRM SEARCH reply listing many tickets;
+- ``/api/knowledge-base/search`` with full article bodies;
+- ``create_ticket``, which returns the ticket with joined profiles and the
+  first AI reply.
+
+Usage (from ``backend/``):
+    python -m benchmarks.serialization --iterations 2000
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Tuple
+from uuid import uuid4
+import argparse
+import json
+import random
+import time
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+
+from app.compression import COMPRESSION_MIN_BYTES, Compressor, brotli
+
+WORDS = ('account', 'billing', 'refund', 'password', 'reset', 'invoice', 'login', 'error', 'shipping', 'order',
+         'update', 'settings', 'export', 'report', 'integration', 'webhook', 'timeout', 'customer', 'plan', 'upgrade')
+
+
+def _text(rng: random.Random, words: int) -> str:
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize() + '.'
+
+
+def _profile(rng: random.Random) -> Dict[str, Any]:
+    name = f"{rng.choice(WORDS).title()} {rng.choice(WORDS).title()}"
+    return {'email': f"{name.replace(' ', '.').lower()}@example.com", 'full_name': name}
+
+
+def _ticket(rng: random.Random, ticket_id: int) -> Dict[str, Any]:
+    created = datetime(2024, 1, 1, tzinfo=timezone.utc) + timedelta(minutes=rng.randrange(500000))
+    return {
+        'id': ticket_id,
+        'subject': _text(rng, 6),
+        'description': _text(rng, 60),
+        'status': rng.choice(('open', 'pending', 'solved', 'closed')),
+        'priority': rng.choice(('low', 'normal', 'high', 'urgent')),
+        'ticket_type': rng.choice(('question', 'incident', 'problem', 'task')),
+        'topic': rng.choice(('ISSUE', 'INQUIRY', 'OTHER', 'PAYMENTS', 'NONE')),
+        'user_id': str(uuid4()),
+        'assigned_to': str(uuid4()),
+        'tags': rng.sample(WORDS, 3),
+        'created_at': created,
+        'updated_at': created + timedelta(hours=rng.randrange(48)),
+    }
+
+
+def autocrm_search_payload(rng: random.Random, tickets: int = 200) -> Dict[str, Any]:
+    lines = [f"#{ticket['id']}: {ticket['subject']} ({ticket['status']}) [{ticket['priority']}] - Assigned to @{_profile(rng)['full_name']}"
+             for ticket in (_ticket(rng, 1000 + n) for n in range(tickets))]
+    return {'reply': "I found these tickets:\n" + '\n'.join(lines)}
+
+
+def article_search_payload(rng: random.Random, articles: int = 5) -> Dict[str, Any]:
+    return {
+        'articles': [{
+            'id': str(uuid4()),
+            'title': _text(rng, 8),
+            'content': '\n\n'.join(_text(rng, 120) for _ in range(6)),
+            'created_at': datetime(2024, 1, 1, tzinfo=timezone.utc),
+            'updated_at': datetime(2024, 6, 1, tzinfo=timezone.utc),
+            'score': round(rng.random(), 4),
+        } for _ in range(articles)],
+        'mode': 'hybrid',
+    }
+
+
+def create_ticket_payload(rng: random.Random) -> Dict[str, Any]:
+    ticket = _ticket(rng, 4242)
+    return {
+        'ticket': {**ticket, 'profiles': _profile(rng), 'agents': _profile(rng), 'isNewTicket': True},
+        'ai_response': {
+            'id': str(uuid4()), 'ticket_id': ticket['id'], 'content': _text(rng, 150), 'user_id': str(uuid4()),
+            'is_public': True, 'is_ai_generated': True, 'created_at': ticket['created_at'],
+        },
+    }
+
+
+PAYLOADS: Dict[str, Callable[[random.Random], Dict[str, Any]]] = {
+    'autocrm_search': autocrm_search_payload,
+    'kb_search': article_search_payload,
+    'create_ticket': create_ticket_payload,
+}
+
+
+def _time_per_call(work: Callable[[], Any], iterations: int) -> float:
+    """
+    Mean microseconds per call of ``work``.
+    """
+    started = time.perf_counter()
+    for _ in range(iterations):
+        work()
+    return (time.perf_counter() - started) / iterations * 1_000_000
+
+
+def _compress(encoding: str, body: bytes) -> bytes:
+    compressor = Compressor(encoding)
+    return compressor.compress(body) + compressor.finish()
+
+
+def measure(payload: Dict[str, Any], iterations: int) -> Dict[str, Any]:
+    encoded = jsonable_encoder(payload)
+    stdlib_body = JSONResponse(encoded).body
+    orjson_body = ORJSONResponse(encoded).body
+    # Same document either way
+    assert json.loads(stdlib_body) == orjson.loads(orjson_body)
+
+    result: Dict[str, Any] = {
+        'jsonable_encoder_us': _time_per_call(lambda: jsonable_encoder(payload), iterations),
+        'stdlib_json_us': _time_per_call(lambda: JSONResponse(encoded).body, iterations),
+        'orjson_us': _time_per_call(lambda: ORJSONResponse(encoded).body, iterations),
+        'raw_bytes': len(orjson_body),
+        'compressed': {},
+    }
+    encodings: List[str] = ['gzip'] + (['br'] if brotli is not None else [])
+    for encoding in encodings:
+        result['compressed'][encoding] = {
+            'bytes': len(_compress(encoding, orjson_body)),
+            'us': _time_per_call(lambda: _compress(encoding, orjson_body), max(1, iterations // 10)),
+        }
+    return result
+
+
+def _row(name: str, result: Dict[str, Any]) -> str:
+    speedup = result['stdlib_json_us'] / result['orjson_us'] if result['orjson_us'] else 0.0
+    parts = [
+        f"{name:<16}",
+        f"encoder {result['jsonable_encoder_us']:8.1f} us",
+        f"json {result['stdlib_json_us']:8.1f} us",
+        f"orjson {result['orjson_us']:7.1f} us ({speedup:4.1f}x)",
+        f"raw {result['raw_bytes']:7d} B",
+    ]
+    for encoding, compressed in result['compressed'].items():
+        ratio = result['raw_bytes'] / compressed['bytes'] if compressed['bytes'] else 0.0
+        parts.append(f"{encoding} {compressed['bytes']:6d} B ({ratio:4.1f}x, {compressed['us']:7.1f} us)")
+    return '  '.join(parts)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--payloads', type=lambda value: [name for name in value.split(',') if name],
+                        default=list(PAYLOADS), help=f"comma-separated subset of {', '.join(PAYLOADS)}")
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    results: List[Tuple[str, Dict[str, Any]]] = []
+    for name in args.payloads:
+        results.append((name, measure(PAYLOADS[name](random.Random(name)), args.iterations)))
+
+    if args.json:
+        print(json.dumps(dict(results), indent=2))
+    else:
+        if brotli is None:
+            print("brotli is not installed; only gzip is measured")
+        print(f"Responses under {COMPRESSION_MIN_BYTES} B are sent uncompressed")
+        for name, result in results:
+            print(_row(name, result))
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
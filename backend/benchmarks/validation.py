@@ -0,0 +1,235 @@
+"""
+Request validation and response serialization overhead per endpoint.
+
+For the five JSON endpoints with typed bodies, it times two ways of handling
+a body, per call:
+
+- ``dict``: what the handlers did with ``Dict[str, Any]`` bodies. FastAPI ran
+  ``json.loads`` and a generic dict validation, and the handler then checked
+  the fields by hand.
+- ``model``: a single ``model_validate_json`` of the request model in
+  ``app.schemas``.
+
+Both are timed on a valid and on a malformed body. Responses are timed up to
+the rendered body. Before, rows went through a generic ``Dict[str, Any]``
+response model (``/autocrm`` had none and went through ``jsonable_encoder``)
+and were then rendered. Now the handlers returning rows render them straight
+with ``ORJSONResponse``, and ``/autocrm`` goes through ``AutoCRMResponse``.
+
+Finally, malformed bodies are sent through the app against the local fakes,
+and the status and round trips to Supabase, Pinecone and OpenAI are reported.
+They should be 422 with no round trips.
+
+Usage (from ``backend/``):
+    python -m benchmarks.validation --iterations 20000
+"""
+from typing import Any, Callable, Dict, List, Tuple, Type
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, TypeAdapter, ValidationError
+
+from app.schemas import (ArticleSearchRequest, ArticleSearchResponse, AutoCRMRequest, AutoCRMResponse, EmbeddingsResponse,
+                         GenerateEmbeddingsRequest, ReplyCreate, ReplyCreateResponse, TicketCreate, TicketCreateResponse)
+
+from .serialization import article_search_payload, autocrm_search_payload, create_ticket_payload
+
+_generic = TypeAdapter(Dict[str, Any])
+
+
+def _check_autocrm(data: Dict[str, Any]) -> None:
+    if not data.get('query') or not data.get('userId'):
+        raise ValueError('Query and userId are required')
+
+
+def _check_ticket(data: Dict[str, Any]) -> None:
+    for field in ('subject', 'description', 'priority', 'ticket_type', 'topic'):
+        if field not in data:
+            raise ValueError(f'Missing required field: {field}')
+
+
+def _check_reply(data: Dict[str, Any]) -> None:
+    if not data.get('content'):
+        raise ValueError('Content is required')
+
+
+def _check_query(data: Dict[str, Any]) -> None:
+    if not data.get('query'):
+        raise ValueError('Query is required')
+
+
+def _ticket_payload(rng: random.Random) -> Dict[str, Any]:
+    payload = create_ticket_payload(rng)
+    # The handler returns the text of the AI reply
+    return {**payload, 'ai_response': payload['ai_response']['content']}
+
+
+def _reply_payload(rng: random.Random) -> Dict[str, Any]:
+    ticket = create_ticket_payload(rng)['ticket']
+    return {
+        'reply': {'id': 'b6f1c7a4-1f0e-4a57-9b1e-0c8a8f6b2d11', 'ticket_id': ticket['id'], 'content': ticket['description'],
+                  'user_id': ticket['user_id'], 'is_public': True, 'is_ai_generated': False, 'created_at': ticket['created_at'],
+                  'user_profile': {**ticket['profiles'], 'avatar_url': None, 'role': 'user'}},
+        'ai_pending': True,
+    }
+
+
+# name: (request model, manual checks, valid body, malformed body, response model, response factory,
+#        whether the handler renders the response itself)
+ENDPOINTS: Dict[str, Tuple[Type[BaseModel], Callable[[Dict[str, Any]], None], Dict[str, Any], Dict[str, Any],
+                           Type[BaseModel], Callable[[random.Random], Dict[str, Any]], bool]] = {
+    'autocrm': (AutoCRMRequest, _check_autocrm,
+                {'query': 'ACTION: SEARCH status: open', 'userId': '00000000-0000-0000-0000-0000000000a1',
+                 'displayContent': '<p>find open tickets for <span data-email="a@example.com">@Ann</span></p>'},
+                {'query': 'ACTION: SEARCH status: open'},
+                AutoCRMResponse, autocrm_search_payload, False),
+    'create_ticket': (TicketCreate, _check_ticket,
+                      {'subject': 'Order missing', 'description': 'My order has not arrived and the tracking number does not work.',
+                       'priority': 'normal', 'ticket_type': 'question', 'topic': 'Order & Shipping Issues'},
+                      {'subject': 'Order missing', 'description': '', 'priority': 'critical', 'ticket_type': 'question',
+                       'topic': 'Order & Shipping Issues'},
+                      TicketCreateResponse, _ticket_payload, True),
+    'create_reply': (ReplyCreate, _check_reply,
+                     {'content': 'Any update on this?', 'is_public': True},
+                     {'content': 'Any update on this?', 'is_public': 'yes'},
+                     ReplyCreateResponse, _reply_payload, True),
+    'generate_embeddings': (GenerateEmbeddingsRequest, lambda data: None,
+                            {'article_id': 'b6f1c7a4-1f0e-4a57-9b1e-0c8a8f6b2d11'},
+                            {'article_id': 42},
+                            EmbeddingsResponse, lambda rng: {'message': 'Successfully updated 1 articles with embeddings',
+                                                             'updated_count': 1}, True),
+    'kb_search': (ArticleSearchRequest, _check_query,
+                  {'query': 'how do I change my billing address'},
+                  {'query': ['refund']},
+                  ArticleSearchResponse, article_search_payload, True),
+}
+
+
+def _time_per_call(work: Callable[[], Any], iterations: int) -> float:
+    """
+    Mean microseconds per call of ``work``.
+    """
+    started = time.perf_counter()
+    for _ in range(iterations):
+        work()
+    return (time.perf_counter() - started) / iterations * 1_000_000
+
+
+def _quietly(work: Callable[[], Any]) -> Callable[[], Any]:
+    def call() -> None:
+        try:
+            work()
+        except (ValueError, ValidationError):
+            pass
+    return call
+
+
+def measure(name: str, iterations: int) -> Dict[str, float]:
+    model, check, valid, malformed, response_model, make_response, rendered = ENDPOINTS[name]
+    valid_body = json.dumps(valid).encode()
+    malformed_body = json.dumps(malformed).encode()
+    # Rows as Supabase returns them, with timestamps as strings
+    response = jsonable_encoder(make_response(random.Random(name)))
+
+    def as_dict(body: bytes) -> Callable[[], Any]:
+        return _quietly(lambda: check(_generic.validate_python(json.loads(body))))
+
+    def as_model(body: bytes) -> Callable[[], Any]:
+        return _quietly(lambda: model.model_validate_json(body))
+
+    if rendered:
+        dict_response = lambda: ORJSONResponse(_generic.dump_python(_generic.validate_python(response), mode='json')).body
+        model_response = lambda: ORJSONResponse(response).body
+    else:
+        dict_response = lambda: ORJSONResponse(jsonable_encoder(response)).body
+        model_response = lambda: ORJSONResponse(response_model.model_validate(response).model_dump(mode='json')).body
+    # Same document either way, and one the response model accepts
+    assert orjson.loads(model_response()) == orjson.loads(dict_response())
+    response_model.model_validate_json(model_response())
+
+    return {
+        'valid_dict_us': _time_per_call(as_dict(valid_body), iterations),
+        'valid_model_us': _time_per_call(as_model(valid_body), iterations),
+        'malformed_dict_us': _time_per_call(as_dict(malformed_body), iterations),
+        'malformed_model_us': _time_per_call(as_model(malformed_body), iterations),
+        'response_dict_us': _time_per_call(dict_response, max(1, iterations // 10)),
+        'response_model_us': _time_per_call(model_response, max(1, iterations // 10)),
+    }
+
+
+async def reject_malformed() -> List[Tuple[str, int, Dict[str, int], float]]:
+    """
+    Send each malformed body through the app; returns path, status, round
+    trips and latency in milliseconds.
+    """
+    from .fakes import FakeServices
+    from .run import AGENT_TOKEN, CUSTOMER_TOKEN, _auth, seed
+
+    fakes = FakeServices()
+    os.environ.update(fakes.environment())
+    os.environ['DEBUG_ROUND_TRIPS'] = 'true'
+    fakes.start()
+    try:
+        seed(fakes, tickets=5, articles=5)
+        import httpx
+        from app.instrumentation import ROUND_TRIP_HEADER, parse_round_trip_header
+        from app.main import app
+
+        requests = {
+            'autocrm': ('/autocrm', AGENT_TOKEN),
+            'create_ticket': ('/api/tickets', CUSTOMER_TOKEN),
+            'create_reply': ('/api/tickets/1/replies', CUSTOMER_TOKEN),
+            'generate_embeddings': ('/api/knowledge-base/generate-embeddings', AGENT_TOKEN),
+            'kb_search': ('/api/knowledge-base/search', AGENT_TOKEN),
+        }
+        results = []
+        async with httpx.AsyncClient(app=app, base_url='http://benchmark') as client:
+            for name, (path, token) in requests.items():
+                started = time.perf_counter()
+                response = await client.post(path, json=ENDPOINTS[name][3], headers=_auth(token))
+                elapsed = (time.perf_counter() - started) * 1000
+                trips = parse_round_trip_header(response.headers.get(ROUND_TRIP_HEADER, ''))
+                results.append((path, response.status_code, trips, elapsed))
+        return results
+    finally:
+        fakes.stop()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=20000)
+    parser.add_argument('--endpoints', type=lambda value: [name for name in value.split(',') if name],
+                        default=list(ENDPOINTS), help=f"comma-separated subset of {', '.join(ENDPOINTS)}")
+    parser.add_argument('--skip-app', action='store_true', help='do not send malformed bodies through the app')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    results = {name: measure(name, args.iterations) for name in args.endpoints}
+    rejected = [] if args.skip_app else asyncio.run(reject_malformed())
+
+    if args.json:
+        print(json.dumps({'endpoints': results, 'malformed': [
+            {'path': path, 'status': status, 'round_trips': trips, 'ms': round(ms, 2)}
+            for path, status, trips, ms in rejected]}, indent=2))
+        return 0
+
+    for name, result in results.items():
+        print(f"{name:<20}"
+              f"  valid {result['valid_dict_us']:6.1f} -> {result['valid_model_us']:5.1f} us"
+              f"  malformed {result['malformed_dict_us']:6.1f} -> {result['malformed_model_us']:5.1f} us"
+              f"  response {result['response_dict_us']:7.1f} -> {result['response_model_us']:7.1f} us")
+    for path, status, trips, ms in rejected:
+        trip_counts = ' '.join(f"{service}={count}" for service, count in sorted(trips.items())) or 'none'
+        print(f"malformed {path:<42} {status}  {ms:6.1f} ms  round trips {trip_counts}")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -38,6 +38,10 @@ interface SimilarArticle {
   updated_at: string;
 }
 
+const API_URL = process.env.REACT_APP_API_URL || 'http://localhost:8000';
+// The search endpoint rejects queries longer than 4000 characters
+const SEARCH_QUERY_CHARS = 4000;
+
 interface TicketContentProps {
   ticket: Ticket;
   messages: Message[];
@@ -63,15 +67,19 @@ const SimilarArticles = ({ ticket, messages }: { ticket: Ticket; messages: Messa
           .map(msg => msg.content)
           .join(' ');
 
-        const response = await fetch('http://localhost:8000/api/knowledge-base/search', {
+        // Semantic search, so related articles are found even when the ticket
+        // words differ from the article's. Long threads are cut at a word boundary
+        const context = `${ticket.subject} ${ticket.description} ${recentMessages}`;
+        const query = context.length > SEARCH_QUERY_CHARS
+          ? context.slice(0, SEARCH_QUERY_CHARS).replace(/\s+\S*$/, '')
+          : context;
+        const response = await fetch(`${API_URL}/api/knowledge-base/search`, {
           method: 'POST',
           headers: {
             'Content-Type': 'application/json',
             'Authorization': `Bearer ${session.access_token}`
           },
-          body: JSON.stringify({
-            query: `${ticket.subject} ${ticket.description} ${recentMessages}`
-          })
+          body: JSON.stringify({ query })
         });
 
         if (!response.ok) {
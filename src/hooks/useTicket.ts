@@ -5,6 +5,7 @@ import { useAuth } from '../contexts/AuthContext';
 
 const EDGE_FUNCTION_URL = process.env.REACT_APP_SUPABASE_URL + '/functions/v1/tickets';
 const PYTHON_BACKEND_URL = process.env.REACT_APP_API_URL || 'http://localhost:8000';
+const AI_REPLY_TIMEOUT_MS = 60000;
 
 export interface Reply {
   id: number;
@@ -83,12 +84,14 @@ export const useTicket = (ticketId: string) => {
   const isInitialLoadRef = useRef(true);
   const isSubscribedRef = useRef(false);
   const mountedRef = useRef(true);
+  const aiLoadingTimeoutRef = useRef<ReturnType<typeof setTimeout> | null>(null);
 
   // Cleanup on unmount
   useEffect(() => {
     mountedRef.current = true;
     return () => {
       mountedRef.current = false;
+      if (aiLoadingTimeoutRef.current) clearTimeout(aiLoadingTimeoutRef.current);
     };
   }, []);
 
@@ -198,6 +201,11 @@ export const useTicket = (ticketId: string) => {
 
   const handleNewReply = async (payload: any) => {
     console.log('Received new reply from Postgres:', payload.new);
+
+    if (payload.new.is_ai_generated) {
+      if (aiLoadingTimeoutRef.current) clearTimeout(aiLoadingTimeoutRef.current);
+      setIsAiLoading(false);
+    }
     
     try {
       // Prevent duplicate processing
@@ -345,58 +353,30 @@ export const useTicket = (ticketId: string) => {
 
     console.log('Adding new reply:', { content, isPublic, ticketId: ticket.id });
 
-    // Create reply in Supabase first
-    const { data: reply, error: replyError } = await supabase
-      .from('replies')
-      .insert({
-        ticket_id: ticket.id,
-        content,
-        user_id: user.id,
-        is_public: isPublic,
-        is_ai_generated: false
-      })
-      .select(`
-        *,
-        user_profile:profiles!replies_user_id_fkey (
-          email,
-          full_name,
-          avatar_url,
-          role
-        )
-      `)
-      .single();
-
-    if (replyError) {
-      console.error('Error creating reply in Supabase:', replyError);
-      throw new Error(replyError.message || 'Failed to create reply');
+    // Create the reply through the Python backend, which answers customer
+    // replies with AI in the background; the AI reply arrives over realtime
+    const response = await fetch(`${PYTHON_BACKEND_URL}/api/tickets/${ticket.id}/replies`, {
+      method: 'POST',
+      headers: {
+        'Authorization': `Bearer ${session.access_token}`,
+        'Content-Type': 'application/json'
+      },
+      body: JSON.stringify({ content, is_public: isPublic })
+    });
+
+    if (!response.ok) {
+      const errorData = await response.json().catch(() => ({}));
+      console.error('Error creating reply:', errorData);
+      throw new Error(errorData.detail || 'Failed to create reply');
     }
 
-    // After creating the reply, trigger the Python backend for AI processing
-    if (user.user_metadata?.role === 'user') {
-      setIsAiLoading(true);
-      try {
-        const pythonResponse = await fetch(`${PYTHON_BACKEND_URL}/api/tickets/${ticket.id}/replies/${reply.id}/process`, {
-          method: 'POST',
-          headers: {
-            'Authorization': `Bearer ${session.access_token}`,
-            'Content-Type': 'application/json'
-          }
-        });
+    const { reply, ai_pending } = await response.json();
 
-        if (!pythonResponse.ok) {
-          const errorData = await pythonResponse.json();
-          console.error('Warning: AI processing failed, but user reply was saved:', errorData);
-        } else {
-          const { ai_reply } = await pythonResponse.json();
-          if (ai_reply) {
-            console.log('AI reply generated:', ai_reply);
-          }
-        }
-      } catch (error) {
-        console.error('Warning: AI processing failed, but user reply was saved:', error);
-      } finally {
-        setIsAiLoading(false);
-      }
+    if (ai_pending) {
+      setIsAiLoading(true);
+      // Stop waiting if the AI reply never arrives
+      if (aiLoadingTimeoutRef.current) clearTimeout(aiLoadingTimeoutRef.current);
+      aiLoadingTimeoutRef.current = setTimeout(() => setIsAiLoading(false), AI_REPLY_TIMEOUT_MS);
     }
 
     return reply;
@@ -473,6 +453,12 @@ export const useTicket = (ticketId: string) => {
       const { ticket: updatedTicket } = await response.json();
       console.log('✅ Received response from Edge Function:', updatedTicket);
 
+      // The backend caches ticket context for AI replies; have it re-read this ticket
+      fetch(`${PYTHON_BACKEND_URL}/api/tickets/${ticket.id}/changed`, {
+        method: 'POST',
+        headers: { 'Authorization': `Bearer ${session.access_token}` }
+      }).catch(error => console.error('❌ Error invalidating ticket context:', error));
+
       // Parse the tags back from JSONB to array
       const parsedTicket = {
         ...updatedTicket,
@@ -0,0 +1,9 @@
+-- Rolling summary of each AutoCRM conversation; summarized_through is the
+-- created_at of the last message folded into the summary
+ALTER TABLE autocrm_conversations
+    ADD COLUMN summary TEXT,
+    ADD COLUMN summarized_through TIMESTAMPTZ;
+
+-- Recent-message lookups per conversation
+CREATE INDEX IF NOT EXISTS autocrm_messages_conversation_created_at_idx
+    ON autocrm_messages (conversation_id, created_at DESC);
@@ -0,0 +1,75 @@
+-- Hourly LLM token usage and estimated cost per route, user and model.
+-- There is one row per hour and key: the API adds each flush to it through
+-- record_usage, so the table grows with the number of keys, not flushes.
+CREATE TABLE IF NOT EXISTS usage (
+    id BIGSERIAL PRIMARY KEY,
+    period_start TIMESTAMPTZ NOT NULL,
+    route TEXT NOT NULL,
+    user_id UUID,
+    model TEXT NOT NULL,
+    calls INTEGER NOT NULL DEFAULT 0,
+    prompt_tokens BIGINT NOT NULL DEFAULT 0,
+    completion_tokens BIGINT NOT NULL DEFAULT 0,
+    cost_usd NUMERIC(12, 6) NOT NULL DEFAULT 0,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- One row per hour and key. Background usage has no user; the nil UUID stands
+-- in for it so it still gets one row per key (UNIQUE NULLS NOT DISTINCT would
+-- need Postgres 15)
+CREATE UNIQUE INDEX IF NOT EXISTS usage_period_key
+    ON usage (period_start, route, COALESCE(user_id, '00000000-0000-0000-0000-000000000000'::UUID), model);
+
+CREATE INDEX IF NOT EXISTS usage_period_start_idx ON usage (period_start);
+CREATE INDEX IF NOT EXISTS usage_user_period_idx ON usage (user_id, period_start);
+
+-- Written and read by the backend with the service role only
+ALTER TABLE usage ENABLE ROW LEVEL SECURITY;
+
+-- Add a batch of aggregates (a JSON array of usage rows) to their rows
+CREATE OR REPLACE FUNCTION record_usage(batch JSONB)
+RETURNS VOID
+LANGUAGE sql
+AS $$
+    INSERT INTO usage AS u (period_start, route, user_id, model, calls, prompt_tokens, completion_tokens, cost_usd)
+    SELECT r.period_start, r.route, r.user_id, r.model, r.calls, r.prompt_tokens, r.completion_tokens, r.cost_usd
+    FROM jsonb_to_recordset(batch) AS r(
+        period_start TIMESTAMPTZ, route TEXT, user_id UUID, model TEXT,
+        calls INTEGER, prompt_tokens BIGINT, completion_tokens BIGINT, cost_usd NUMERIC
+    )
+    ON CONFLICT (period_start, route, COALESCE(user_id, '00000000-0000-0000-0000-000000000000'::UUID), model) DO UPDATE SET
+        calls = u.calls + EXCLUDED.calls,
+        prompt_tokens = u.prompt_tokens + EXCLUDED.prompt_tokens,
+        completion_tokens = u.completion_tokens + EXCLUDED.completion_tokens,
+        cost_usd = u.cost_usd + EXCLUDED.cost_usd,
+        updated_at = NOW();
+$$;
+
+-- Usage since a time, summed per route, user and model. Paged, as PostgREST
+-- caps every response at max_rows
+CREATE OR REPLACE FUNCTION usage_by_key(since TIMESTAMPTZ, page_offset INTEGER DEFAULT 0, page_size INTEGER DEFAULT 1000)
+RETURNS TABLE (
+    route TEXT,
+    user_id UUID,
+    model TEXT,
+    calls BIGINT,
+    prompt_tokens NUMERIC,
+    completion_tokens NUMERIC,
+    cost_usd NUMERIC
+)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT route, user_id, model, SUM(calls), SUM(prompt_tokens), SUM(completion_tokens), SUM(cost_usd)
+    FROM usage
+    WHERE period_start >= since
+    GROUP BY route, user_id, model
+    ORDER BY route, user_id, model
+    OFFSET page_offset
+    LIMIT page_size;
+$$;
+
+-- Backend only; the service role keeps its grant
+REVOKE EXECUTE ON FUNCTION record_usage(JSONB) FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION usage_by_key(TIMESTAMPTZ, INTEGER, INTEGER) FROM PUBLIC, anon, authenticated;
@@ -0,0 +1,21 @@
+-- Open tickets per assignee, counted in the database so the agent directory
+-- reads one row per agent instead of one per open ticket (which PostgREST
+-- would cut off at max_rows)
+CREATE OR REPLACE FUNCTION open_ticket_counts(statuses TEXT[])
+RETURNS TABLE (
+    agent_id UUID,
+    open_tickets BIGINT
+)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT assigned_to, COUNT(*)
+    FROM tickets
+    WHERE status = ANY(statuses) AND assigned_to IS NOT NULL
+    GROUP BY assigned_to;
+$$;
+
+CREATE INDEX IF NOT EXISTS tickets_status_assigned_to_idx ON tickets (status, assigned_to);
+
+-- Backend only; the service role keeps its grant
+REVOKE EXECUTE ON FUNCTION open_ticket_counts(TEXT[]) FROM PUBLIC, anon, authenticated;